@@ -1,113 +1,1309 @@
-from flask import Flask, render_template, request, redirect, session, url_for, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+import click
+from flask import (Flask, render_template, stream_template, request, redirect, session, url_for, flash,
+                   get_flashed_messages, jsonify, g, Response)
+import base64
+import csv
+import io
+import itertools
+import json
+import math
+import os
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+import zlib
+from datetime import datetime, timedelta
 import time
 
+from utils.activity import add_month, empty_summary, merge_top, summarize_users, trim_months
+from utils.archive import TransactionArchive
+from utils.bootstrap import ensure_schema
+from utils.cache import LRUCache
+from utils.hashing import HashQueueFull, PasswordHasher
+from utils.limits import MemoryLimiter
+from utils.metrics import HistogramFamily, query_metrics, render_prometheus
+from utils.money import SQLITE_MAX_INTEGER, from_cents, to_cents
+from utils.pool import WAL_PROFILE, ConnectionPool, get_pool
+from utils.pubsub import Broker, TooManySubscribers
+from utils.reconcile import lower_priority, reconcile_range
+from utils.rows import record_type, record_type_for, to_records
+from utils.schedule import next_run_after, parse_start
+from utils.shards import ShardRouter, transaction_ids
+from utils.sweeper import PeriodicTask
+from utils.writer import WriteQueue
+
 app = Flask(__name__)
+# Set by asgi.py, which serves /api/v1/events without holding a thread per stream.
+app.config['NATIVE_EVENT_STREAMS'] = False
 app.secret_key = 'quickpay_secret_key_change_me'
+app.json.compact = True
 
 DB_PATH = 'quickpay.db'
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT = 10.0
+DB_PRAGMAS = WAL_PROFILE
+WRITE_QUEUE_SIZE = 1000
+WRITE_TIMEOUT = 30.0
+WRITE_BATCH_SIZE = 64
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+RECIPIENT_SEARCH_LIMIT = 10
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 30.0
+ASYNC_DB_WORKERS = DB_POOL_SIZE
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_MAX_PENDING = 32
+SIGNUP_CREDIT_CENTS = 100000
+PAYOUT_MAX_ROWS = 50000
+IDEMPOTENCY_KEY_RETENTION = timedelta(hours=24)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_SWEEP_INTERVAL = 300.0
+IDEMPOTENCY_SWEEP_BATCH = 1000
+# Transactions older than ARCHIVE_AFTER can be moved into monthly files under ARCHIVE_DIR.
+ARCHIVE_DIR = 'archive'
+ARCHIVE_AFTER = timedelta(days=365)
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_PAUSE = 0.05
+ACTIVITY_MONTHS = 12
+ACTIVITY_TOP_COUNTERPARTIES = 5
+ACTIVITY_REBUILD_CHUNK = 1000
+ACTIVITY_REBUILD_WORKERS = 4
+RECONCILE_REPORT = 'reconcile-report.ndjson'
+RECONCILE_CHECKPOINT = 'reconcile-checkpoint.json'
+RECONCILE_CHUNK = 2000
+RECONCILE_WORKERS = 2
+# Share of the time each reconciliation worker may spend reading; it sleeps for the rest.
+RECONCILE_DUTY_CYCLE = 0.5
+# Counter-account for money that enters the ledger from outside (signup credits, opening balances).
+SYSTEM_ACCOUNT_ID = 0
+# Counter-account for money between two shards: a cross-shard transfer's debit and credit,
+# or a user's balance while the user is moved.
+SHARD_TRANSIT_ACCOUNT_ID = -1
+# Statements slower than this (seconds) are logged with their normalized text.
+SLOW_QUERY_THRESHOLD = 0.1
+# Stamped into the database by init_db (PRAGMA user_version). Bump it whenever init_db
+# gains DDL, so existing databases run it once more on their next start.
+SCHEMA_VERSION = 3
+# Start method for password hashing, rebuild and reconciliation worker processes. The
+# app runs writer, sweeper and scheduler threads, and a child forked while one of them
+# holds a lock can hang.
+WORKER_START_METHOD = 'spawn'
+# Database files users are spread over. The first is DB_PATH and also holds the user
+# directory; with one file nothing is sharded. To add a shard, append a path (never
+# reorder them), run `flask init-db` and then `flask rebalance-shards`.
+SHARD_PATHS = [DB_PATH]
+# Cross-shard transfers and user moves left unfinished for longer than the grace
+# period are completed by a background recovery pass every SHARD_RECOVERY_INTERVAL.
+SHARD_RECOVERY_INTERVAL = 60.0
+SHARD_RECOVERY_GRACE = timedelta(seconds=30)
+SHARD_MOVE_BATCH = 1000
+# Server-Sent Events (/api/v1/events): events buffered per stream before the oldest are
+# dropped, streams per process, seconds between heartbeats, and how often an idle
+# stream re-reads the balance to catch changes committed by other processes.
+NOTIFY_BUFFER_SIZE = 32
+NOTIFY_MAX_SUBSCRIBERS = 10000
+NOTIFY_HEARTBEAT = 15.0
+NOTIFY_RESYNC_INTERVAL = 60.0
+# Under WSGI a stream holds a worker thread, so it ends after NOTIFY_WSGI_STREAM_SECONDS
+# and asks the client to reconnect NOTIFY_WSGI_RETRY_MS later.
+NOTIFY_WSGI_STREAM_SECONDS = 30.0
+NOTIFY_WSGI_RETRY_MS = 30000
+# Login attempts draw on token buckets per client IP and per email, as (capacity,
+# tokens refilled per second). Transfers are limited per sender and per
+# sender->receiver pair, in count and in cents, over a sliding TRANSFER_WINDOW (seconds).
+LOGIN_IP_BUCKET = (20, 20 / 60.0)
+LOGIN_ACCOUNT_BUCKET = (10, 10 / 900.0)
+TRANSFER_WINDOW = 3600.0
+TRANSFER_MAX_COUNT = 60
+TRANSFER_MAX_CENTS = 1000000
+TRANSFER_PAIR_MAX_COUNT = 20
+TRANSFER_PAIR_MAX_CENTS = 500000
+LIMITER_MAX_KEYS = 100000
+# Scheduled transfers: every SCHEDULE_INTERVAL seconds the scheduler pays what is due
+# in batches of SCHEDULE_BATCH_SIZE, each one writer job and one commit. A recurring
+# schedule that fails SCHEDULE_MAX_FAILURES runs in a row is suspended.
+SCHEDULE_FREQUENCIES = ('once', 'daily', 'weekly', 'monthly')
+SCHEDULE_INTERVAL = 30.0
+SCHEDULE_BATCH_SIZE = 1000
+SCHEDULE_MAX_FAILURES = 3
+SCHEDULE_MAX_PER_USER = 100
+
+
+# Current-user rows keyed by user id. Swap in utils.cache.FileCache to share it between processes.
+user_cache = LRUCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Login and transfer limit state. Swap in utils.limits.FileLimiter to share it between processes.
+limiter = MemoryLimiter(max_keys=LIMITER_MAX_KEYS)
+
+# Balance and payment events for the /api/v1/events streams open in this process, keyed by user id.
+notifications = Broker(buffer_size=NOTIFY_BUFFER_SIZE, max_subscribers=NOTIFY_MAX_SUBSCRIBERS)
+
+# Which shard holds each user's rows; see utils.shards.ShardRouter.
+shards = ShardRouter(SHARD_PATHS, lambda user_ids: load_placements(user_ids))
+
+# Cold transactions, read only when a history reaches past the hot table. Every shard
+# archives into the same files, so a moved user's archived history needs no copying.
+transaction_archive = TransactionArchive(ARCHIVE_DIR, pragmas=WAL_PROFILE)
+
+# Per-route request latency, labelled by method and URL rule.
+request_latency = HistogramFamily(('method', 'route'))
+query_metrics.slow_query_threshold = SLOW_QUERY_THRESHOLD
+
+
+USER_COLUMNS = 'id, name, email, balance, balance_cents, verification_status, version, created_at'
 
 
 class User:
     def __init__(self, db_conn):
         self.db = db_conn
 
+    def _invalidate(self, user_id):
+        self.db.on_commit(lambda: user_cache.invalidate(user_id))
+
+    # Only the login lookup reads the password hash; profile rows never carry it.
     def get_user_by_email(self, email):
-        sql = "SELECT * FROM users WHERE email = ?;"
+        sql = "SELECT id, name, email, password FROM users WHERE email = ?;"
         return self.db.execute_fetch_one(sql, (email,))
 
     def get_user_by_id(self, user_id):
-        sql = "SELECT * FROM users WHERE id = ?;"
+        sql = f"SELECT {USER_COLUMNS} FROM users WHERE id = ?;"
         return self.db.execute_fetch_one(sql, (user_id,))
 
-    def create_user(self, name, email, password_hash):
-        sql = "INSERT INTO users (name, email, password, balance, created_at) VALUES (?, ?, ?, 1000.00, ?);"
+    # With more than one shard the id comes from the user directory (UserDirectory.reserve).
+    def create_user(self, name, email, password_hash, user_id=None):
+        sql = """
+            INSERT INTO users (id, name, email, password, balance, balance_cents, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+        """
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        lastrowid = self.db.execute_insert(sql, (name, email, password_hash, timestamp))
+        lastrowid = self.db.execute_insert(sql, (user_id, name, email, password_hash,
+                                                 from_cents(SIGNUP_CREDIT_CENTS), SIGNUP_CREDIT_CENTS, timestamp))
+        Ledger(self.db).record_signup_credit(lastrowid, SIGNUP_CREDIT_CENTS)
+        self._invalidate(lastrowid)
         return lastrowid
 
     def get_all_users_except_self(self, current_user_id):
         sql = "SELECT id, name, email FROM users WHERE id != ? ORDER BY name;"
         return self.db.execute_fetch_all(sql, (current_user_id,))
 
+    def search_recipients(self, query, current_user_id, limit=RECIPIENT_SEARCH_LIMIT):
+        # Every word typed becomes a prefix term, so "ali smi" matches "Alice Smith".
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql = """
+            SELECT u.id, u.name, u.email
+            FROM users_fts
+            JOIN users u ON u.id = users_fts.rowid
+            WHERE users_fts MATCH ? AND u.id != ?
+            ORDER BY users_fts.rank
+            LIMIT ?;
+        """
+        return self.db.execute_fetch_all(sql, (match, current_user_id, limit))
+
+    # balance_cents is authoritative; balance is kept alongside it as a display copy.
     def update_balance(self, user_id, new_balance):
-        sql = "UPDATE users SET balance = ? WHERE id = ?;"
-        self.db.execute_update(sql, (new_balance, user_id))
+        sql = "UPDATE users SET balance_cents = ?, balance = ?, version = version + 1 WHERE id = ?;"
+        new_balance_cents = to_cents(new_balance)
+        self.db.execute_update(sql, (new_balance_cents, from_cents(new_balance_cents), user_id))
+        self._invalidate(user_id)
+
+    def debit_if_sufficient(self, user_id, amount_cents):
+        sql = """
+            UPDATE users
+            SET balance_cents = balance_cents - ?, balance = (balance_cents - ?) / 100.0, version = version + 1
+            WHERE id = ? AND balance_cents >= ?;
+        """
+        self._invalidate(user_id)
+        return self.db.execute_update(sql, (amount_cents, amount_cents, user_id, amount_cents))
+
+    def credit(self, user_id, amount_cents):
+        sql = """
+            UPDATE users
+            SET balance_cents = balance_cents + ?, balance = (balance_cents + ?) / 100.0, version = version + 1
+            WHERE id = ?;
+        """
+        self._invalidate(user_id)
+        return self.db.execute_update(sql, (amount_cents, amount_cents, user_id))
+
+    def credit_many(self, credits):
+        """Applies (user_id, amount_cents) credits with one executemany."""
+        sql = """
+            UPDATE users
+            SET balance_cents = balance_cents + ?, balance = (balance_cents + ?) / 100.0, version = version + 1
+            WHERE id = ?;
+        """
+        self.db.execute_many(sql, [(amount_cents, amount_cents, user_id) for user_id, amount_cents in credits])
+        for user_id, _ in credits:
+            self._invalidate(user_id)
+
+    def get_users_by_ids(self, user_ids, chunk_size=500):
+        """Maps each of user_ids that exists to its profile row."""
+        user_ids = list(user_ids)
+        users = {}
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            sql = f"SELECT {USER_COLUMNS} FROM users WHERE id IN ({', '.join('?' * len(chunk))});"
+            users.update((row.id, row) for row in self.db.execute_fetch_all(sql, chunk))
+        return users
+
+    def existing_ids(self, user_ids, chunk_size=500):
+        user_ids = list(user_ids)
+        found = set()
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            sql = f"SELECT id FROM users WHERE id IN ({', '.join('?' * len(chunk))});"
+            found.update(row.id for row in self.db.execute_fetch_all(sql, chunk))
+        return found
+
+    def names_for(self, user_ids, chunk_size=500):
+        """Maps each of user_ids to its name."""
+        user_ids = list(user_ids)
+        names = {}
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            sql = f"SELECT id, name FROM users WHERE id IN ({', '.join('?' * len(chunk))});"
+            names.update(self.db.execute_fetch_all(sql, chunk))
+        return names
+
+    def update_password(self, user_id, password_hash):
+        sql = "UPDATE users SET password = ? WHERE id = ?;"
+        self.db.execute_update(sql, (password_hash, user_id))
 
     def update_verification_status(self, user_id, status):
-        sql = "UPDATE users SET verification_status = ? WHERE id = ?;"
+        sql = "UPDATE users SET verification_status = ?, version = version + 1 WHERE id = ?;"
         self.db.execute_update(sql, (status, user_id))
+        self._invalidate(user_id)
+
+
+# The columns of Transaction.HISTORY_SQL, for history rows assembled in Python from the archive.
+HistoryRow = record_type(('id', 'amount', 'timestamp', 'sender_name', 'receiver_name', 'type',
+                          'sender_id', 'receiver_id'))
+
+TRANSACTION_COLUMNS = ('id', 'sender_id', 'receiver_id', 'amount', 'amount_cents', 'timestamp', 'status')
+
+
+def utc_timestamp():
+    """Now, in the UTC 'YYYY-MM-DD HH:MM:SS' form of CURRENT_TIMESTAMP."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def allocate_ids(db, sequence, count):
+    """
+    Reserves `count` ids of `sequence` on the session's shard (see
+    utils.shards.transaction_ids), so they are unique across shards. The last id
+    handed out is kept in shard_sequences and advanced under the write lock, so
+    writers in other processes never reuse it.
+    """
+    row = db.execute_fetch_one("SELECT value FROM shard_sequences WHERE name = ?;", (sequence,))
+    allocated = transaction_ids(row.value if row else 0, shards.index_of(db.db_path), count)
+    db.execute_update("""
+        INSERT INTO shard_sequences (name, value) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+    """, (sequence, allocated[-1]))
+    return allocated
 
 
 class Transaction:
     def __init__(self, db_conn):
         self.db = db_conn
 
-    def record_transaction(self, sender_id, receiver_id, amount):
-        sql = "INSERT INTO transactions (sender_id, receiver_id, amount, status) VALUES (?, ?, ?, 'Completed');"
-        self.db.execute_insert(sql, (sender_id, receiver_id, amount))
-
-    def get_transactions_for_user(self, user_id):
+    def record_transaction(self, sender_id, receiver_id, amount_cents, timestamp=None):
+        return self.record_transactions(sender_id, [(receiver_id, amount_cents)], timestamp)[0]
+
+    def record_transactions(self, sender_id, payments, timestamp=None):
+        """Inserts one transaction per (receiver_id, amount_cents) with executemany and returns their ids."""
+        timestamp = timestamp or utc_timestamp()
+        transaction_ids = self.allocate_ids(len(payments))
+        self.insert_rows([(transaction_id, sender_id, receiver_id, from_cents(amount_cents), amount_cents,
+                           timestamp, 'Completed')
+                          for transaction_id, (receiver_id, amount_cents) in zip(transaction_ids, payments)])
+        return transaction_ids
+
+    def allocate_ids(self, count):
+        return allocate_ids(self.db, 'transactions', count)
+
+    def insert_rows(self, rows, ignore_existing=False):
+        """Inserts (TRANSACTION_COLUMNS) tuples; copies of rows from another shard skip ids already present."""
+        sql = f"""
+            INSERT {'OR IGNORE ' if ignore_existing else ''}INTO transactions ({', '.join(TRANSACTION_COLUMNS)})
+            VALUES ({', '.join('?' * len(TRANSACTION_COLUMNS))});
+        """
+        self.db.execute_many(sql, rows)
+
+    # Two range scans over the (sender_id, timestamp) and (receiver_id, timestamp)
+    # covering indexes, merged in timestamp order instead of an OR filter plus a sort.
+    # Self-transfers only come back from the first branch. Pages continue strictly
+    # below a (timestamp, id) cursor, and date ranges bound the timestamp, both of
+    # which the indexes can seek to directly. The joins are LEFT joins because a
+    # counterparty on another shard has no users row here; with_names fills those in.
+    HISTORY_SQL = """
+        SELECT
+            t.id AS id,
+            t.amount AS amount,
+            t.timestamp AS timestamp,
+            u_sender.name AS sender_name,
+            u_receiver.name AS receiver_name,
+            'Sent' AS type,
+            t.sender_id AS sender_id,
+            t.receiver_id AS receiver_id
+        FROM transactions t
+        LEFT JOIN users u_sender ON u_sender.id = t.sender_id
+        LEFT JOIN users u_receiver ON u_receiver.id = t.receiver_id
+        WHERE t.sender_id = ?{filters}
+        UNION ALL
+        SELECT t.id, t.amount, t.timestamp, u_sender.name, u_receiver.name, 'Received', t.sender_id, t.receiver_id
+        FROM transactions t
+        LEFT JOIN users u_sender ON u_sender.id = t.sender_id
+        LEFT JOIN users u_receiver ON u_receiver.id = t.receiver_id
+        WHERE t.receiver_id = ? AND t.sender_id != ?{filters}
+        ORDER BY timestamp DESC, id DESC{limit};
+    """
+    HISTORY_KEYSET = " AND (t.timestamp, t.id) < (?, ?)"
+    HISTORY_SINCE = " AND t.timestamp >= ?"
+    HISTORY_UNTIL = " AND t.timestamp < ?"
+
+    @classmethod
+    def history_query(cls, user_id, limit=None, before=None, since=None, until=None):
+        filters, filter_params = '', ()
+        if before:
+            filters += cls.HISTORY_KEYSET
+            filter_params += tuple(before)
+        if since is not None:
+            filters += cls.HISTORY_SINCE
+            filter_params += (since,)
+        if until is not None:
+            filters += cls.HISTORY_UNTIL
+            filter_params += (until,)
+        params = (user_id,) + filter_params + (user_id, user_id) + filter_params
+        if limit is not None:
+            params += (limit,)
+        sql = cls.HISTORY_SQL.format(filters=filters, limit=' LIMIT ?' if limit is not None else '')
+        return sql, params
+
+    # Histories continue into the archive only once the hot rows run out, carrying the
+    # last hot row on as the keyset cursor, so most pages never open an archive file.
+    def get_transactions_for_user(self, user_id, limit=None, before=None):
+        sql, params = self.history_query(user_id, limit, before)
+        rows = self.db.execute_fetch_all(sql, params)
+        if limit is None or len(rows) < limit:
+            cursor = (rows[-1].timestamp, rows[-1].id) if rows else before
+            rows += self.iter_archived(user_id, None if limit is None else limit - len(rows), cursor)
+        return list(self.with_names(rows))
+
+    def iter_transactions_for_user(self, user_id, limit=None, before=None, since=None, until=None,
+                                   chunk_size=256):
+        sql, params = self.history_query(user_id, limit, before, since, until)
+        rows = self.db.execute_iter(sql, params, chunk_size)
+        count, last = 0, None
+        try:
+            for row in self.with_names(rows, chunk_size):
+                count, last = count + 1, row
+                yield row
+        finally:
+            rows.close()
+        if limit is None or count < limit:
+            cursor = (last.timestamp, last.id) if last else before
+            yield from self.iter_archived(user_id, None if limit is None else limit - count, cursor,
+                                          since, until, chunk_size)
+
+    def with_names(self, rows, chunk_size=256):
+        """Fills in the names of counterparties on other shards, looked up a chunk of rows at a time."""
+        if shards.count == 1:
+            yield from rows
+            return
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            missing = ({row.sender_id for row in chunk if row.sender_name is None} |
+                       {row.receiver_id for row in chunk if row.receiver_name is None})
+            names = user_names(missing) if missing else {}
+            for row in chunk:
+                if row.sender_name is None or row.receiver_name is None:
+                    row = row._replace(sender_name=row.sender_name or names.get(row.sender_id),
+                                       receiver_name=row.receiver_name or names.get(row.receiver_id))
+                yield row
+
+    def iter_archived(self, user_id, limit=None, before=None, since=None, until=None, chunk_size=256):
+        """Archived history rows in the hot query's shape, with names looked up from users."""
+        rows = transaction_archive.iter_history(user_id, limit, before, since, until)
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                names = user_names({row.sender_id for row in chunk} | {row.receiver_id for row in chunk}, self.db)
+                for row in chunk:
+                    yield HistoryRow(row.id, row.amount, row.timestamp, names.get(row.sender_id),
+                                     names.get(row.receiver_id), row.type, row.sender_id, row.receiver_id)
+        finally:
+            rows.close()
+
+    def oldest(self, after_id, limit):
+        sql = """
+            SELECT id, sender_id, receiver_id, amount, amount_cents, timestamp, status
+            FROM transactions WHERE id > ? ORDER BY id LIMIT ?;
+        """
+        return self.db.execute_fetch_all(sql, (after_id, limit))
+
+    def delete_range(self, first_id, last_id, older_than):
+        sql = "DELETE FROM transactions WHERE id BETWEEN ? AND ? AND timestamp < ?;"
+        return self.db.execute_update(sql, (first_id, last_id, older_than))
+
+    def for_party(self, column, user_id, after, limit):
+        """A user's rows as sender or receiver (`column`), in (timestamp, id) order after the `after` pair."""
+        sql = f"""
+            SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions
+            WHERE {column} = ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id LIMIT ?;
+        """
+        return self.db.execute_fetch_all(sql, (user_id,) + tuple(after) + (limit,))
+
+    def ids_for_user(self, user_id):
+        sql = "SELECT id FROM transactions WHERE sender_id = ? UNION SELECT id FROM transactions WHERE receiver_id = ?;"
+        return {row.id for row in self.db.execute_fetch_all(sql, (user_id, user_id))}
+
+    def rows_by_id(self, transaction_ids, chunk_size=500):
+        transaction_ids = list(transaction_ids)
+        rows = []
+        for start in range(0, len(transaction_ids), chunk_size):
+            chunk = transaction_ids[start:start + chunk_size]
+            rows += self.db.execute_fetch_all(f"""
+                SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions
+                WHERE id IN ({', '.join('?' * len(chunk))});
+            """, chunk)
+        return rows
+
+    def delete_unowned(self, user_id, limit):
+        """
+        Deletes up to `limit` of a moved user's rows whose other party has no users row
+        on this shard either; rows still in another local user's history stay.
+        """
         sql = """
+            DELETE FROM transactions WHERE id IN (
+                SELECT id FROM transactions WHERE sender_id = ? AND receiver_id NOT IN (SELECT id FROM users)
+                UNION ALL
+                SELECT id FROM transactions WHERE receiver_id = ? AND sender_id NOT IN (SELECT id FROM users)
+                LIMIT ?
+            );
+        """
+        return self.db.execute_update(sql, (user_id, user_id, limit))
+
+
+class Ledger:
+    """
+    Append-only, double-entry record of every balance movement in integer cents.
+    Each movement is written as entries that sum to zero; periodic per-user
+    snapshots let a balance be rebuilt from the nearest checkpoint instead of
+    replaying the whole ledger.
+    """
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    def _record(self, entries):
+        sql = "INSERT INTO ledger_entries (transaction_id, user_id, amount_cents, entry_type) VALUES (?, ?, ?, ?);"
+        self.db.execute_many(sql, entries)
+
+    def record_transfer(self, transaction_id, sender_id, receiver_id, amount_cents):
+        self._record([
+            (transaction_id, sender_id, -amount_cents, 'transfer'),
+            (transaction_id, receiver_id, amount_cents, 'transfer'),
+        ])
+
+    def record_transfers(self, transfers):
+        """Records both legs of many (transaction_id, sender_id, receiver_id, amount_cents) transfers at once."""
+        entries = []
+        for transaction_id, sender_id, receiver_id, amount_cents in transfers:
+            entries.append((transaction_id, sender_id, -amount_cents, 'transfer'))
+            entries.append((transaction_id, receiver_id, amount_cents, 'transfer'))
+        self._record(entries)
+
+    # A cross-shard transfer is balanced on each shard through the transit account:
+    # the sender's shard moves the money into it and the receiver's shard out of it.
+    def record_outgoing(self, credits):
+        """Sender legs of (transaction_id, sender_id, receiver_id, amount_cents, timestamp) credits."""
+        entries = []
+        for transaction_id, sender_id, _, amount_cents, _ in credits:
+            entries.append((transaction_id, sender_id, -amount_cents, 'transfer'))
+            entries.append((transaction_id, SHARD_TRANSIT_ACCOUNT_ID, amount_cents, 'shard_transfer_out'))
+        self._record(entries)
+
+    def record_incoming(self, credits):
+        """Receiver legs of the same credits, written on the receivers' shard."""
+        entries = []
+        for transaction_id, _, receiver_id, amount_cents, _ in credits:
+            entries.append((transaction_id, SHARD_TRANSIT_ACCOUNT_ID, -amount_cents, 'shard_transfer_in'))
+            entries.append((transaction_id, receiver_id, amount_cents, 'transfer'))
+        self._record(entries)
+
+    def record_move_out(self, user_id, amount_cents):
+        self._record([
+            (None, user_id, -amount_cents, 'shard_move_out'),
+            (None, SHARD_TRANSIT_ACCOUNT_ID, amount_cents, 'shard_move_out'),
+        ])
+
+    def record_move_in(self, user_id, amount_cents):
+        self._record([
+            (None, SHARD_TRANSIT_ACCOUNT_ID, -amount_cents, 'shard_move_in'),
+            (None, user_id, amount_cents, 'shard_move_in'),
+        ])
+
+    def record_signup_credit(self, user_id, amount_cents):
+        self._record([
+            (None, SYSTEM_ACCOUNT_ID, -amount_cents, 'signup_credit'),
+            (None, user_id, amount_cents, 'signup_credit'),
+        ])
+
+    def balance_as_of(self, user_id, as_of=None):
+        """Balance in cents at a UTC 'YYYY-MM-DD HH:MM:SS' time (default now)."""
+        as_of = as_of or datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        snapshot = self.db.execute_fetch_one("""
+            SELECT ledger_entry_id, balance_cents FROM balance_snapshots
+            WHERE user_id = ? AND taken_at <= ?
+            ORDER BY ledger_entry_id DESC
+            LIMIT 1;
+        """, (user_id, as_of))
+        start_entry_id, start_cents = (snapshot.ledger_entry_id, snapshot.balance_cents) if snapshot else (0, 0)
+        delta = self.db.execute_fetch_one("""
+            SELECT COALESCE(SUM(amount_cents), 0) AS cents FROM ledger_entries
+            WHERE user_id = ? AND id > ? AND created_at <= ?;
+        """, (user_id, start_entry_id, as_of))
+        return start_cents + delta.cents
+
+    def snapshot_balances(self):
+        """
+        Checkpoints every account with entries since the last run. After each run,
+        every account's latest snapshot covers all of its entries up to the highest
+        snapshotted entry id, so only entries past that id need to be read.
+        """
+        return self.db.execute_update("""
+            INSERT INTO balance_snapshots (user_id, ledger_entry_id, balance_cents)
             SELECT
-                t.amount,
-                t.timestamp,
-                u_sender.name AS sender_name,
-                u_receiver.name AS receiver_name,
-                CASE
-                    WHEN t.sender_id = ? THEN 'Sent'
-                    ELSE 'Received'
-                END AS type
-            FROM transactions t
-            JOIN users u_sender ON t.sender_id = u_sender.id
-            JOIN users u_receiver ON t.receiver_id = u_receiver.id
-            WHERE t.sender_id = ? OR t.receiver_id = ?
-            ORDER BY t.timestamp DESC;
+                e.user_id,
+                MAX(e.id),
+                COALESCE((SELECT s.balance_cents FROM balance_snapshots s
+                          WHERE s.user_id = e.user_id
+                          ORDER BY s.ledger_entry_id DESC LIMIT 1), 0) + SUM(e.amount_cents)
+            FROM ledger_entries e
+            WHERE e.id > (SELECT COALESCE(MAX(ledger_entry_id), 0) FROM balance_snapshots)
+            GROUP BY e.user_id;
+        """)
+
+
+class ActivitySummary:
+    """
+    Per-user dashboard analytics kept in one row per user: lifetime and monthly
+    sent/received totals plus the top counterparties by volume. Rows are updated
+    in the same transaction as the transfers they count, from running per-pair
+    totals in user_counterparties, so reading them is a single primary-key lookup.
+    """
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    COLUMNS = 'user_id, sent_count, sent_cents, received_count, received_cents, months, top_counterparties'
+
+    def get(self, user_id):
+        row = self.db.execute_fetch_one(f"SELECT {self.COLUMNS} FROM activity_summaries WHERE user_id = ?;",
+                                        (user_id,))
+        return self._load(row) if row else empty_summary(user_id)
+
+    # Summaries are updated in place by record_transfers, so they are loaded as dicts.
+    @staticmethod
+    def _load(row):
+        summary = row._asdict()
+        summary['months'] = json.loads(row.months)
+        summary['top_counterparties'] = json.loads(row.top_counterparties)
+        return summary
+
+    def get_many(self, user_ids, chunk_size=500):
+        user_ids = list(user_ids)
+        found = {}
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            sql = f"SELECT {self.COLUMNS} FROM activity_summaries WHERE user_id IN ({', '.join('?' * len(chunk))});"
+            found.update((row.user_id, self._load(row)) for row in self.db.execute_fetch_all(sql, chunk))
+        return {user_id: found.get(user_id) or empty_summary(user_id) for user_id in user_ids}
+
+    def save_many(self, summaries):
+        sql = """
+            INSERT OR REPLACE INTO activity_summaries
+                (user_id, sent_count, sent_cents, received_count, received_cents, months, top_counterparties, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP);
+        """
+        self.db.execute_many(sql, [
+            (s['user_id'], s['sent_count'], s['sent_cents'], s['received_count'], s['received_cents'],
+             json.dumps(s['months'], separators=(',', ':')),
+             json.dumps(s['top_counterparties'], separators=(',', ':')))
+            for s in summaries])
+
+    def record_transfers(self, transfers, only_users=None):
+        """
+        Counts (sender_id, receiver_id, amount_cents, month) transfers into both
+        parties' summaries, or only into those of `only_users` when given.
+        """
+        month_deltas, pair_deltas = {}, {}
+        for sender_id, receiver_id, amount_cents, month in transfers:
+            for user_id, counterparty_id, totals in ((sender_id, receiver_id, [1, amount_cents, 0, 0]),
+                                                     (receiver_id, sender_id, [0, 0, 1, amount_cents])):
+                if only_users is not None and user_id not in only_users:
+                    continue
+                current = month_deltas.setdefault((user_id, month), [0, 0, 0, 0])
+                for index, value in enumerate(totals):
+                    current[index] += value
+                pair = pair_deltas.setdefault((user_id, counterparty_id), [0, 0])
+                pair[0] += 1
+                pair[1] += amount_cents
+        if not pair_deltas:
+            return
+
+        self.db.execute_many("""
+            INSERT INTO user_counterparties (user_id, counterparty_id, count, cents) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, counterparty_id) DO UPDATE SET
+                count = count + excluded.count, cents = cents + excluded.cents;
+        """, [(user_id, counterparty_id, count, cents)
+              for (user_id, counterparty_id), (count, cents) in pair_deltas.items()])
+
+        touched = {}
+        for user_id, counterparty_id in pair_deltas:
+            touched.setdefault(user_id, []).append(counterparty_id)
+        summaries = self.get_many(touched)
+        totals = self.pair_totals(pair_deltas)
+        names = user_names({counterparty_id for _, counterparty_id in pair_deltas}, self.db)
+        for (user_id, month), month_totals in month_deltas.items():
+            add_month(summaries[user_id], month, month_totals)
+        for user_id, counterparty_ids in touched.items():
+            candidates = [{'id': counterparty_id, 'name': names.get(counterparty_id),
+                           'count': totals[user_id, counterparty_id][0], 'cents': totals[user_id, counterparty_id][1]}
+                          for counterparty_id in counterparty_ids]
+            trim_months(summaries[user_id], ACTIVITY_MONTHS)
+            merge_top(summaries[user_id], candidates, ACTIVITY_TOP_COUNTERPARTIES)
+        self.save_many(summaries.values())
+
+    def pair_totals(self, pairs, chunk_size=500):
+        """
+        Current (count, cents) for each (user_id, counterparty_id) pair. Each pair is
+        looked up alongside whichever of its two ids it shares with more pairs, so a
+        payout's pairs (one sender, many receivers, both directions) take a handful
+        of IN queries rather than one per receiver.
+        """
+        user_pairs, counterparty_pairs = {}, {}
+        for user_id, counterparty_id in pairs:
+            user_pairs[user_id] = user_pairs.get(user_id, 0) + 1
+            counterparty_pairs[counterparty_id] = counterparty_pairs.get(counterparty_id, 0) + 1
+        groups = {}
+        for user_id, counterparty_id in pairs:
+            if user_pairs[user_id] >= counterparty_pairs[counterparty_id]:
+                groups.setdefault(('user_id', 'counterparty_id', user_id), []).append(counterparty_id)
+            else:
+                groups.setdefault(('counterparty_id', 'user_id', counterparty_id), []).append(user_id)
+
+        totals = {}
+        for (fixed_column, listed_column, fixed_id), listed_ids in groups.items():
+            for start in range(0, len(listed_ids), chunk_size):
+                chunk = listed_ids[start:start + chunk_size]
+                rows = self.db.execute_fetch_all(f"""
+                    SELECT user_id, counterparty_id, count, cents FROM user_counterparties
+                    WHERE {fixed_column} = ? AND {listed_column} IN ({', '.join('?' * len(chunk))});
+                """, [fixed_id] + chunk)
+                totals.update(((row.user_id, row.counterparty_id), (row.count, row.cents)) for row in rows)
+        return totals
+
+    def replace_range(self, first_user_id, last_user_id, summaries, pairs):
+        """Swaps in rebuilt summaries and counterparty totals for a user id range."""
+        self.db.execute_update("DELETE FROM activity_summaries WHERE user_id BETWEEN ? AND ?;",
+                               (first_user_id, last_user_id))
+        self.db.execute_update("DELETE FROM user_counterparties WHERE user_id BETWEEN ? AND ?;",
+                               (first_user_id, last_user_id))
+        self.save_many(summaries)
+        self.db.execute_many("INSERT INTO user_counterparties (user_id, counterparty_id, count, cents) "
+                             "VALUES (?, ?, ?, ?);", pairs)
+
+
+class IdempotencyKey:
+    """Stored results of idempotent requests, keyed by (user_id, key) and kept for a retention window."""
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    def get(self, user_id, key, created_after):
+        sql = """
+            SELECT request_hash, response FROM idempotency_keys
+            WHERE user_id = ? AND key = ? AND created_at > ?;
+        """
+        return self.db.execute_fetch_one(sql, (user_id, key, created_after))
+
+    def save(self, user_id, key, request_hash, response):
+        sql = """
+            INSERT OR REPLACE INTO idempotency_keys (user_id, key, request_hash, response, created_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP);
+        """
+        self.db.execute_update(sql, (user_id, key, request_hash, json.dumps(response)))
+
+    def delete_expired(self, created_before, limit):
+        sql = """
+            DELETE FROM idempotency_keys WHERE (user_id, key) IN (
+                SELECT user_id, key FROM idempotency_keys WHERE created_at <= ? LIMIT ?
+            );
         """
-        return self.db.execute_fetch_all(sql, (user_id, user_id, user_id))
+        return self.db.execute_update(sql, (created_before, limit))
+
+
+class UserDirectory:
+    """
+    Kept on the first shard: the shard and email of every user registered or moved
+    while more than one shard was configured. Emails stay unique across shards
+    because new ones are reserved here before the user's row is written.
+    """
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    def find(self, email):
+        return self.db.execute_fetch_one("SELECT user_id, shard FROM user_directory WHERE email = ?;", (email,))
+
+    def shards_for(self, user_ids, chunk_size=500):
+        user_ids = list(user_ids)
+        found = {}
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            sql = f"SELECT user_id, shard FROM user_directory WHERE user_id IN ({', '.join('?' * len(chunk))});"
+            found.update(self.db.execute_fetch_all(sql, chunk))
+        return found
+
+    def reserve(self, email, shard_count):
+        """
+        Allocates the id and shard of a new user as (user_id, shard). An entry left by an
+        earlier attempt with this email is returned again; the caller finds out whether
+        that registration completed. None if the email belongs to a user who signed up
+        here before sharding.
+        """
+        entry = self.find(email)
+        if entry:
+            return entry.user_id, entry.shard
+        if User(self.db).get_user_by_email(email):
+            return None
+        user_id = self.db.execute_fetch_one("""
+            SELECT MAX(id) + 1 AS id FROM (
+                SELECT COALESCE(MAX(user_id), 0) AS id FROM user_directory
+                UNION ALL
+                SELECT COALESCE(MAX(id), 0) FROM users
+            );
+        """).id
+        shard = user_id % shard_count
+        self.place(user_id, email, shard)
+        return user_id, shard
+
+    def place(self, user_id, email, shard):
+        self.db.execute_update("""
+            INSERT INTO user_directory (user_id, email, shard) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard;
+        """, (user_id, email, shard))
+
+
+class ShardTransferLog:
+    """
+    Recovery log for cross-shard transfers, kept on the sender's shard. Phase one
+    writes a row in the same transaction as the sender's debit; phase two deletes it
+    once every credit has been applied on the receivers' shards. A row still here is
+    a transfer whose credits may not have landed, which recover_shard_transfers finishes.
+    """
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    def prepare(self, credits):
+        """Logs (transaction_id, sender_id, receiver_id, amount_cents, timestamp) credits; returns the log id."""
+        xid = credits[0][0]
+        self.db.execute_update("INSERT INTO shard_transfers (xid, credits) VALUES (?, ?);",
+                               (xid, json.dumps(credits, separators=(',', ':'))))
+        return xid
+
+    def pending(self, created_before):
+        sql = "SELECT xid, credits FROM shard_transfers WHERE created_at <= ? ORDER BY created_at;"
+        return self.db.execute_fetch_all(sql, (created_before,))
+
+    def resolve(self, xid):
+        return self.db.execute_update("DELETE FROM shard_transfers WHERE xid = ?;", (xid,))
+
+
+class ShardCredits:
+    """
+    Receiving side of cross-shard transfers. Every credit applied leaves a row keyed
+    by its transaction id, which moves along with the receiver, so a credit retried
+    after a crash or a move is never paid twice.
+    """
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    def applied(self, transaction_ids, chunk_size=500):
+        transaction_ids = list(transaction_ids)
+        found = set()
+        for start in range(0, len(transaction_ids), chunk_size):
+            chunk = transaction_ids[start:start + chunk_size]
+            sql = f"SELECT transaction_id FROM shard_credits WHERE transaction_id IN ({', '.join('?' * len(chunk))});"
+            found.update(row.transaction_id for row in self.db.execute_fetch_all(sql, chunk))
+        return found
+
+    def apply(self, credits):
+        """
+        Pays the credits whose receiver is on this shard and that were not paid before:
+        balance, history row, ledger legs and the receiver's activity. Returns the
+        credits whose receiver is not on this shard.
+        """
+        applied = self.applied({credit[0] for credit in credits})
+        credits = [credit for credit in credits if credit[0] not in applied]
+        present = User(self.db).existing_ids({credit[2] for credit in credits})
+        due = [credit for credit in credits if credit[2] in present]
+        if due:
+            totals = {}
+            for _, _, receiver_id, amount_cents, _ in due:
+                totals[receiver_id] = totals.get(receiver_id, 0) + amount_cents
+            User(self.db).credit_many(list(totals.items()))
+            Transaction(self.db).insert_rows([
+                (transaction_id, sender_id, receiver_id, from_cents(amount_cents), amount_cents, timestamp, 'Completed')
+                for transaction_id, sender_id, receiver_id, amount_cents, timestamp in due], ignore_existing=True)
+            Ledger(self.db).record_incoming(due)
+            ActivitySummary(self.db).record_transfers([
+                (sender_id, receiver_id, amount_cents, timestamp[:7])
+                for _, sender_id, receiver_id, amount_cents, timestamp in due], only_users=set(totals))
+            self.db.execute_many("INSERT INTO shard_credits (transaction_id, receiver_id) VALUES (?, ?);",
+                                 [(credit[0], credit[2]) for credit in due])
+            notify_transfers(self.db, due)
+        return [credit for credit in credits if credit[2] not in present]
+
+
+class ShardMoves:
+    """Users cut over from this shard whose rows (the payload) are not yet confirmed on their new shard."""
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    def add(self, user_id, target_shard, payload):
+        sql = "INSERT OR REPLACE INTO shard_moves (user_id, target_shard, payload) VALUES (?, ?, ?);"
+        self.db.execute_update(sql, (user_id, target_shard, json.dumps(payload, separators=(',', ':'))))
+
+    def pending(self, created_before):
+        sql = "SELECT user_id, target_shard, payload FROM shard_moves WHERE created_at <= ? ORDER BY created_at;"
+        return self.db.execute_fetch_all(sql, (created_before,))
+
+    def resolve(self, user_id):
+        return self.db.execute_update("DELETE FROM shard_moves WHERE user_id = ?;", (user_id,))
+
+
+class ScheduledTransfer:
+    """
+    Standing orders, kept on the sender's shard and moved along with the sender.
+    Only active schedules are in the next_run index, so finding what is due is a
+    range scan over exactly those rows, however many have finished or been cancelled.
+    """
+    COLUMNS = ('id, sender_id, receiver_id, amount_cents, frequency, day_of_month, next_run, status, '
+               'failure_count, last_run_at, last_transaction_id, last_error, created_at')
+
+    def __init__(self, db_conn):
+        self.db = db_conn
+
+    def create(self, sender_id, receiver_id, amount_cents, frequency, next_run):
+        """Adds an active schedule first due at next_run; ids come from the shard sequence, like transactions."""
+        schedule_id = allocate_ids(self.db, 'scheduled_transfers', 1)[0]
+        sql = """
+            INSERT INTO scheduled_transfers (id, sender_id, receiver_id, amount_cents, frequency, day_of_month, next_run)
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+        """
+        self.db.execute_update(sql, (schedule_id, sender_id, receiver_id, amount_cents, frequency,
+                                     int(next_run[8:10]), next_run))
+        return self.get(sender_id, schedule_id)
+
+    def get(self, sender_id, schedule_id):
+        sql = f"SELECT {self.COLUMNS} FROM scheduled_transfers WHERE id = ? AND sender_id = ?;"
+        return self.db.execute_fetch_one(sql, (schedule_id, sender_id))
+
+    def for_sender(self, sender_id):
+        sql = f"SELECT {self.COLUMNS} FROM scheduled_transfers WHERE sender_id = ? ORDER BY next_run, id;"
+        return self.db.execute_fetch_all(sql, (sender_id,))
+
+    def count_open(self, sender_id):
+        sql = """
+            SELECT COUNT(*) AS open FROM scheduled_transfers
+            WHERE sender_id = ? AND status IN ('active', 'suspended');
+        """
+        return self.db.execute_fetch_one(sql, (sender_id,)).open
+
+    def cancel(self, sender_id, schedule_id):
+        sql = """
+            UPDATE scheduled_transfers SET status = 'cancelled'
+            WHERE id = ? AND sender_id = ? AND status IN ('active', 'suspended');
+        """
+        return self.db.execute_update(sql, (schedule_id, sender_id))
+
+    def due(self, now, limit):
+        sql = f"""
+            SELECT {self.COLUMNS} FROM scheduled_transfers
+            WHERE status = 'active' AND next_run <= ? ORDER BY next_run LIMIT ?;
+        """
+        return self.db.execute_fetch_all(sql, (now, limit))
+
+    def record_runs(self, runs):
+        """Applies (next_run, status, failure_count, last_run_at, last_transaction_id, last_error, id) with one executemany."""
+        sql = """
+            UPDATE scheduled_transfers
+            SET next_run = ?, status = ?, failure_count = ?, last_run_at = ?, last_transaction_id = ?, last_error = ?
+            WHERE id = ?;
+        """
+        self.db.execute_many(sql, runs)
 
 
 class DatabaseConnection:
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool=None):
         self.db_path = db_path
+        self.pool = pool or get_pool(db_path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, pragmas=DB_PRAGMAS)
         self.connection = None
         self.cursor = None
+        self.commit_callbacks = []
+
+    # Sessions on the shard holding a user's rows, or on a shard by index.
+    @classmethod
+    def for_user(cls, user_id):
+        return cls(shards.path_for(user_id))
+
+    @classmethod
+    def for_shard(cls, shard):
+        return cls(shards.paths[shard])
 
     def __enter__(self):
-        self.connection = sqlite3.connect(self.db_path)
-        self.connection.row_factory = sqlite3.Row
+        self.connection = self.pool.acquire()
         self.cursor = self.connection.cursor()
+        self.cursor.row_factory = None
+        self.commit_callbacks = []
+        query_metrics.count_session()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is None:
-            self.connection.commit()
-        else:
-            self.connection.rollback()
-        self.connection.close()
-
+        committed = False
+        try:
+            if exc_type is None:
+                self.connection.commit()
+                committed = True
+            else:
+                self.connection.rollback()
+        finally:
+            self.cursor.close()
+            self.pool.release(self.connection)
+        if committed:
+            for callback in self.commit_callbacks:
+                callback()
+
+    def on_commit(self, callback):
+        """Runs callback once this connection's transaction has committed (e.g. cache invalidation)."""
+        self.commit_callbacks.append(callback)
+
+    # Rows are fetched as plain tuples and wrapped in a Record type built once per column list.
     def execute_fetch_one(self, sql, params=()):
-        self.cursor.execute(sql, params)
+        query_metrics.execute(self.cursor, sql, params)
         row = self.cursor.fetchone()
-        return dict(row) if row else None
+        if not row:
+            return None
+        query_metrics.count_rows(1)
+        return tuple.__new__(record_type_for(self.cursor), row)
 
     def execute_fetch_all(self, sql, params=()):
-        self.cursor.execute(sql, params)
-        return [dict(row) for row in self.cursor.fetchall()]
+        query_metrics.execute(self.cursor, sql, params)
+        rows = self.cursor.fetchall()
+        query_metrics.count_rows(len(rows))
+        return to_records(self.cursor, rows)
+
+    def execute_iter(self, sql, params=(), chunk_size=256):
+        """Yields rows lazily, fetchmany(chunk_size) at a time, from a cursor of its own."""
+        cursor = self.connection.cursor()
+        cursor.row_factory = None
+        try:
+            query_metrics.execute(cursor, sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                query_metrics.count_rows(len(rows))
+                yield from to_records(cursor, rows)
+        finally:
+            cursor.close()
 
     def execute_update(self, sql, params=()):
-        self.cursor.execute(sql, params)
+        query_metrics.execute(self.cursor, sql, params)
+        return self.cursor.rowcount
+
+    def execute_many(self, sql, seq_of_params):
+        query_metrics.executemany(self.cursor, sql, seq_of_params)
+        return self.cursor.rowcount
 
     def execute_insert(self, sql, params=()):
-        self.cursor.execute(sql, params)
+        query_metrics.execute(self.cursor, sql, params)
         return self.cursor.lastrowid
 
 
-def init_db():
+# Password hashing runs in worker processes; when too many are queued, requests get a 503.
+hasher = PasswordHasher(method=PASSWORD_HASH_METHOD, max_workers=PASSWORD_HASH_WORKERS,
+                        max_pending=PASSWORD_HASH_MAX_PENDING, start_method=WORKER_START_METHOD)
+
+# All writes go through a single writer thread holding the only write connection.
+# IMMEDIATE transactions take the write lock up front, so a job never fails half-way
+# through on a lock upgrade. Each shard has its own writer, started on first use;
+# `writer` is the first shard's, which also holds the user directory.
+WRITER_POOL = ConnectionPool(DB_PATH, size=1, pragmas=DB_PRAGMAS, isolation_level='IMMEDIATE')
+writer = WriteQueue(lambda: DatabaseConnection(DB_PATH, pool=WRITER_POOL), maxsize=WRITE_QUEUE_SIZE,
+                    batch_size=WRITE_BATCH_SIZE)
+shard_writers = {DB_PATH: (WRITER_POOL, writer)}
+shard_writers_lock = threading.Lock()
+
+
+def writer_for_shard(shard):
+    path = shards.paths[shard]
+    entry = shard_writers.get(path)
+    if entry is None:
+        with shard_writers_lock:
+            entry = shard_writers.get(path)
+            if entry is None:
+                pool = ConnectionPool(path, size=1, pragmas=DB_PRAGMAS, isolation_level='IMMEDIATE')
+                entry = shard_writers[path] = (pool, WriteQueue(lambda: DatabaseConnection(path, pool=pool),
+                                                                maxsize=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE,
+                                                                name=f'quickpay-writer-{shard}'))
+    return entry[1]
+
+
+def writer_for(user_id):
+    return writer_for_shard(shards.shard_for(user_id))
+
+
+def load_placements(user_ids):
+    with DatabaseConnection(shards.paths[0]) as db:
+        return UserDirectory(db).shards_for(user_ids)
+
+
+def user_names(user_ids, local=None):
+    """
+    Maps user ids on any shard to their names. Ids found through `local`, an open
+    session, are not looked up again; the rest are read from their own shards.
+    """
+    names = User(local).names_for(user_ids) if local is not None else {}
+    missing = [user_id for user_id in user_ids if user_id not in names]
+    if missing and (local is None or shards.count > 1):
+        for shard, shard_ids in shards.group(missing).items():
+            with DatabaseConnection.for_shard(shard) as db:
+                names.update(User(db).names_for(shard_ids))
+    return names
+
+
+HISTORY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transactions_sender_ts ON transactions (sender_id, timestamp, id, receiver_id, amount);",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_receiver_ts ON transactions (receiver_id, timestamp, id, sender_id, amount);",
+]
+
+
+# Full-text index over name and email for recipient typeahead. It is an external-content
+# table, so it stores only the index; the triggers keep it in step with users.
+USER_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        name, email, content='users', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name, email ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+    END;
+    """,
+]
+
+
+LEDGER_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS ledger_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id INTEGER,
+        user_id INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        entry_type TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_ledger_entries_user ON ledger_entries (user_id, id, created_at, amount_cents);",
+    """
+    CREATE TRIGGER IF NOT EXISTS ledger_entries_no_update BEFORE UPDATE ON ledger_entries BEGIN
+        SELECT RAISE(ABORT, 'ledger_entries is append-only');
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ledger_entries_no_delete BEFORE DELETE ON ledger_entries BEGIN
+        SELECT RAISE(ABORT, 'ledger_entries is append-only');
+    END;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS balance_snapshots (
+        user_id INTEGER NOT NULL,
+        ledger_entry_id INTEGER NOT NULL,
+        balance_cents INTEGER NOT NULL,
+        taken_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, ledger_entry_id)
+    ) WITHOUT ROWID;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_balance_snapshots_entry ON balance_snapshots (ledger_entry_id);",
+]
+
+
+IDEMPOTENCY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, key)
+    ) WITHOUT ROWID;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);",
+]
+
+
+ACTIVITY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS activity_summaries (
+        user_id INTEGER PRIMARY KEY,
+        sent_count INTEGER NOT NULL DEFAULT 0,
+        sent_cents INTEGER NOT NULL DEFAULT 0,
+        received_count INTEGER NOT NULL DEFAULT 0,
+        received_cents INTEGER NOT NULL DEFAULT 0,
+        months TEXT NOT NULL DEFAULT '{}',
+        top_counterparties TEXT NOT NULL DEFAULT '[]',
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_counterparties (
+        user_id INTEGER NOT NULL,
+        counterparty_id INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        cents INTEGER NOT NULL,
+        PRIMARY KEY (user_id, counterparty_id)
+    ) WITHOUT ROWID;
+    """,
+]
+
+
+# Cross-shard bookkeeping, on every shard: the transaction id sequence, the recovery
+# log of transfers this shard sent, the credits it received and users moving away.
+SHARD_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS shard_sequences (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS shard_transfers (
+        xid INTEGER PRIMARY KEY,
+        credits TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS shard_credits (
+        transaction_id INTEGER PRIMARY KEY,
+        receiver_id INTEGER NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_shard_credits_receiver ON shard_credits (receiver_id);",
+    """
+    CREATE TABLE IF NOT EXISTS shard_moves (
+        user_id INTEGER PRIMARY KEY,
+        target_shard INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+]
+
+
+SCHEDULE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS scheduled_transfers (
+        id INTEGER PRIMARY KEY,
+        sender_id INTEGER NOT NULL,
+        receiver_id INTEGER NOT NULL,
+        amount_cents INTEGER NOT NULL,
+        frequency TEXT NOT NULL,
+        day_of_month INTEGER NOT NULL,
+        next_run DATETIME NOT NULL,
+        status TEXT NOT NULL DEFAULT 'active',
+        failure_count INTEGER NOT NULL DEFAULT 0,
+        last_run_at DATETIME,
+        last_transaction_id INTEGER,
+        last_error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_transfers_due ON scheduled_transfers (next_run) WHERE status = 'active';",
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_transfers_sender ON scheduled_transfers (sender_id);",
+]
+
+
+# Only on the first shard.
+USER_DIRECTORY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS user_directory (
+        user_id INTEGER PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        shard INTEGER NOT NULL
+    );
+    """,
+]
+
+
+def ensure_column(db, table, column, definition):
+    """Adds a column to an existing table if it is missing; returns True when it was added."""
+    columns = {row.name for row in db.execute_fetch_all(f"PRAGMA table_info({table});")}
+    if column in columns:
+        return False
+    db.execute_update(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return True
+
+
+def check_history_query_plan(db):
+    """Fails loudly if the history query would scan or sort the transactions table."""
+    details = []
+    for sql, params in (Transaction.history_query(0),
+                        Transaction.history_query(0, limit=1, before=('', 0)),
+                        Transaction.history_query(0, since='', until='')):
+        details += [row.detail for row in db.execute_fetch_all("EXPLAIN QUERY PLAN " + sql, params)]
+    bad = [d for d in details if d.startswith('SCAN t') or 'TEMP B-TREE FOR ORDER BY' in d]
+    if bad:
+        raise RuntimeError(f"History query is not using the transaction indexes: {'; '.join(bad)}")
+    return details
+
+
+def init_db(db_path=DB_PATH):
+    """
+    Creates or upgrades the schema in one IMMEDIATE transaction, stamping
+    SCHEMA_VERSION as its last step, so a failure part-way leaves the database as
+    it was. Errors are re-raised after printing, so startup fails instead of
+    serving against a half-built schema.
+    """
     try:
-        with DatabaseConnection(DB_PATH) as db:
+        with DatabaseConnection(db_path) as db:
+            # Python only opens transactions implicitly before DML; DDL would otherwise autocommit.
+            db.connection.execute("BEGIN IMMEDIATE")
             db.execute_update("""
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -115,7 +1311,9 @@ def init_db():
                     email TEXT UNIQUE NOT NULL,
                     password TEXT NOT NULL,
                     balance REAL DEFAULT 1000.00,
+                    balance_cents INTEGER DEFAULT 100000,
                     verification_status TEXT DEFAULT 'Unverified',
+                    version INTEGER NOT NULL DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
@@ -125,18 +1323,107 @@ def init_db():
                     sender_id INTEGER NOT NULL,
                     receiver_id INTEGER NOT NULL,
                     amount REAL NOT NULL,
+                    amount_cents INTEGER,
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                     status TEXT NOT NULL,
                     FOREIGN KEY (sender_id) REFERENCES users (id) ON DELETE CASCADE,
                     FOREIGN KEY (receiver_id) REFERENCES users (id) ON DELETE CASCADE
                 );
             """)
+            if ensure_column(db, 'users', 'balance_cents', 'INTEGER DEFAULT 100000'):
+                db.execute_update("UPDATE users SET balance_cents = CAST(ROUND(balance * 100) AS INTEGER);")
+            ensure_column(db, 'users', 'version', 'INTEGER NOT NULL DEFAULT 0')
+            if ensure_column(db, 'transactions', 'amount_cents', 'INTEGER'):
+                db.execute_update("UPDATE transactions SET amount_cents = CAST(ROUND(amount * 100) AS INTEGER);")
+            for ddl in HISTORY_INDEXES:
+                db.execute_update(ddl)
+            check_history_query_plan(db)
+            for ddl in IDEMPOTENCY_DDL:
+                db.execute_update(ddl)
+            for ddl in ACTIVITY_DDL:
+                db.execute_update(ddl)
+            for ddl in SHARD_DDL:
+                db.execute_update(ddl)
+            for ddl in SCHEDULE_DDL:
+                db.execute_update(ddl)
+            if db_path == shards.paths[0]:
+                for ddl in USER_DIRECTORY_DDL:
+                    db.execute_update(ddl)
+
+            ledger_exists = db.execute_fetch_one(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ledger_entries';")
+            for ddl in LEDGER_DDL:
+                db.execute_update(ddl)
+            if not ledger_exists:
+                # Existing balances enter the ledger as opening balances drawn from the system account.
+                db.execute_update("""
+                    INSERT INTO ledger_entries (user_id, amount_cents, entry_type)
+                    SELECT id, balance_cents, 'opening_balance' FROM users;
+                """)
+                db.execute_update("""
+                    INSERT INTO ledger_entries (user_id, amount_cents, entry_type)
+                    SELECT ?, -total, 'opening_balance' FROM (SELECT SUM(balance_cents) AS total FROM users)
+                    WHERE total IS NOT NULL;
+                """, (SYSTEM_ACCOUNT_ID,))
+
+            search_index_exists = db.execute_fetch_one(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts';")
+            for ddl in USER_SEARCH_DDL:
+                db.execute_update(ddl)
+            if not search_index_exists:
+                db.execute_update("INSERT INTO users_fts (users_fts) VALUES ('rebuild');")
+            db.execute_update(f"PRAGMA user_version = {SCHEMA_VERSION};")
     except sqlite3.Error as e:
         print(f"Database initialization FAILED: {e}")
+        raise
+
+
+schema_ready = False
+# The error of a failed bootstrap, kept so requests answer 503 instead of retrying the DDL each time.
+schema_error = None
 
 
-with app.app_context():
-    init_db()
+def bootstrap(force=False):
+    """
+    Brings every shard's schema up to SCHEMA_VERSION once per process; see
+    utils.bootstrap.ensure_schema. It then starts the scheduler and, with more
+    than one shard, the recovery pass for cross-shard work a previous process
+    left unfinished. A failed upgrade raises (and is remembered in schema_error).
+    """
+    global schema_ready, schema_error
+    if force or not schema_ready:
+        try:
+            schema_ready = all([ensure_schema(path, SCHEMA_VERSION, lambda path=path: init_db(path), force=force)
+                                for path in shards.paths])
+        except Exception as e:
+            schema_error = e
+            raise
+        schema_error = None
+        if schema_ready:
+            scheduler.ensure_started()
+        if schema_ready and shards.count > 1:
+            shard_recovery.ensure_started()
+    return schema_ready
+
+
+def create_app():
+    """
+    Returns the app with its database schema in place. Importing this module
+    touches no files, so servers load `app:create_app()`, which bootstraps a new
+    or outdated database once before the first request is accepted.
+    """
+    bootstrap()
+    return app
+
+
+@app.before_request
+def bootstrap_before_first_request():
+    # Covers servers that import `app` directly; after the first request this is a flag check.
+    # After a failed upgrade, fix the database and restart (or run `flask init-db`).
+    if schema_error is not None:
+        return "The database schema could not be upgraded; see the server log.", 503
+    if not schema_ready:
+        bootstrap()
 
 
 @app.context_processor
@@ -144,15 +1431,1139 @@ def inject_now():
     return {'now': datetime.utcnow()}
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.teardown_request
+def observe_request_latency(exc):
+    # Teardown runs after a streamed body has been sent, so /history includes its streaming time.
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_latency.labels(request.method, route).observe(time.perf_counter() - started)
+
+
+def load_user_data(user_id):
+    with DatabaseConnection.for_user(user_id) as db:
+        user = User(db).get_user_by_id(user_id)
+    # A user missing from a cached shard may have been moved; route once more from the directory.
+    if user is None and shards.forget(user_id):
+        with DatabaseConnection.for_user(user_id) as db:
+            user = User(db).get_user_by_id(user_id)
+    return user
+
+
 def get_current_user_data(user_id):
     try:
-        with DatabaseConnection(DB_PATH) as db:
-            user_model = User(db)
-            return user_model.get_user_by_id(user_id)
+        return user_cache.get_or_load(user_id, lambda: load_user_data(user_id))
     except sqlite3.Error:
         return None
 
 
+def encode_history_cursor(row):
+    raw = f"{row.timestamp}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_history_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        timestamp, _, row_id = raw.rpartition('|')
+        return timestamp, int(row_id)
+    except ValueError:
+        return None
+
+
+class HistoryPage:
+    """
+    One page of a user's history, read lazily while the template renders.
+    Fetches a single row past the page size to learn whether an older page exists.
+    """
+    def __init__(self, user_id, page_size, before=None):
+        self.user_id = user_id
+        self.page_size = page_size
+        self.before = before
+        self.next_cursor = None
+
+    def __iter__(self):
+        try:
+            with DatabaseConnection.for_user(self.user_id) as db:
+                rows = Transaction(db).iter_transactions_for_user(self.user_id, limit=self.page_size + 1,
+                                                                  before=self.before)
+                try:
+                    last = None
+                    for count, row in enumerate(rows):
+                        if count == self.page_size:
+                            self.next_cursor = encode_history_cursor(last)
+                            break
+                        last = row
+                        yield row
+                finally:
+                    rows.close()
+        except sqlite3.Error as e:
+            print(f"Transaction history stream FAILED: {e}")
+
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_COLUMNS = ('id', 'timestamp', 'type', 'counterparty', 'amount')
+
+
+def statement_record(row):
+    is_sent = row.type == 'Sent'
+    return (row.id, row.timestamp, row.type, row.receiver_name if is_sent else row.sender_name,
+            f"{-row.amount if is_sent else row.amount:.2f}")
+
+
+def iter_statement(user_id, export_format, since=None, until=None):
+    """
+    Streams a user's statement as CSV or NDJSON text chunks of EXPORT_CHUNK_SIZE rows.
+    Rows come straight off a read cursor in fetchmany batches, so memory stays flat
+    however long the history is; in WAL mode the read never blocks the writer.
+    """
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer)
+    if export_format == 'csv':
+        csv_writer.writerow(EXPORT_COLUMNS)
+    try:
+        with DatabaseConnection.for_user(user_id) as db:
+            rows = Transaction(db).iter_transactions_for_user(user_id, since=since, until=until,
+                                                              chunk_size=EXPORT_CHUNK_SIZE)
+            try:
+                for count, row in enumerate(rows, 1):
+                    record = statement_record(row)
+                    if export_format == 'csv':
+                        csv_writer.writerow(record)
+                    else:
+                        buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, record)), separators=(',', ':')) + '\n')
+                    if count % EXPORT_CHUNK_SIZE == 0:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+            finally:
+                rows.close()
+    except sqlite3.Error as e:
+        # Headers are already sent; aborting the stream makes the client see an incomplete download.
+        print(f"Statement export FAILED for user {user_id}: {e}")
+        raise
+    yield buffer.getvalue()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_export_date(value):
+    """Parses a YYYY-MM-DD query value; None when absent."""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def register_user(db, name, email, password_hash, user_id=None):
+    user_model = User(db)
+    if user_model.get_user_by_email(email) or (user_id is not None and user_model.get_user_by_id(user_id)):
+        return None
+    return user_model.create_user(name, email, password_hash, user_id)
+
+
+def create_account(name, email, password_hash):
+    """
+    Registers a user and returns the new id, or None if the email is taken. When
+    sharded, the id, shard and email are first reserved in the user directory and the
+    user's row is then written on that shard; if the second step never happened, the
+    next registration with the email completes it.
+    """
+    if shards.count == 1:
+        return writer.run(lambda db: register_user(db, name, email, password_hash), timeout=WRITE_TIMEOUT)
+    reserved = writer.run(lambda db: UserDirectory(db).reserve(email, shards.count), timeout=WRITE_TIMEOUT)
+    if reserved is None:
+        return None
+    user_id, shard = reserved
+    return writer_for_shard(shard).run(lambda db: register_user(db, name, email, password_hash, user_id),
+                                       timeout=WRITE_TIMEOUT)
+
+
+def find_login(email):
+    """The login row (id, name, email, password) for an email, read from the shard holding the user."""
+    with DatabaseConnection(DB_PATH) as db:
+        entry = UserDirectory(db).find(email) if shards.count > 1 else None
+        if entry is None or entry.shard == 0:
+            return User(db).get_user_by_email(email)
+    with DatabaseConnection.for_shard(entry.shard) as db:
+        return User(db).get_user_by_email(email)
+
+
+def search_recipients(query, current_user_id, limit=RECIPIENT_SEARCH_LIMIT):
+    """
+    Recipient search over every shard. Full-text ranks from different shards do not
+    compare, so each shard's best matches are interleaved instead.
+    """
+    if shards.count == 1:
+        with DatabaseConnection(DB_PATH) as db:
+            return User(db).search_recipients(query, current_user_id, limit)
+    found = []
+    for path in shards.paths:
+        with DatabaseConnection(path) as db:
+            found.append(User(db).search_recipients(query, current_user_id, limit))
+    return [row for rows in itertools.zip_longest(*found) for row in rows if row is not None][:limit]
+
+
+class TransferRejected(Exception):
+    pass
+
+
+class InvalidTransferUser(TransferRejected):
+    pass
+
+
+class InsufficientFunds(TransferRejected):
+    pass
+
+
+class VelocityLimitExceeded(TransferRejected):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        if retry_after is None:
+            super().__init__("This amount is over the transfer limit.")
+        else:
+            super().__init__(f"Transfer limit reached. Try again in {math.ceil(retry_after / 60)} minutes.")
+
+
+def charge_velocity(sender_id, receiver_id, amount_cents):
+    """
+    Counts a transfer against the sender's and the sender->receiver pair's sliding
+    windows (see Limiter.add_within), raising VelocityLimitExceeded if either would
+    go over its limits. Returns the charges, for refund_velocity if the transfer
+    then fails.
+    """
+    charges = []
+    for key, max_count, max_cents in ((f'transfer:{sender_id}', TRANSFER_MAX_COUNT, TRANSFER_MAX_CENTS),
+                                      (f'transfer:{sender_id}:{receiver_id}', TRANSFER_PAIR_MAX_COUNT,
+                                       TRANSFER_PAIR_MAX_CENTS)):
+        retry_after = limiter.add_within(key, TRANSFER_WINDOW, amount_cents, max_count, max_cents)
+        if retry_after != 0:
+            refund_velocity(charges)
+            raise VelocityLimitExceeded(retry_after)
+        charges.append((key, amount_cents))
+    return charges
+
+
+def refund_velocity(charges):
+    for key, amount_cents in charges:
+        limiter.remove_within(key, TRANSFER_WINDOW, amount_cents)
+
+
+def current_month():
+    """The UTC 'YYYY-MM' that CURRENT_TIMESTAMP gives transactions inserted now."""
+    return datetime.utcnow().strftime('%Y-%m')
+
+
+def notify_transfers(db, transfers, senders=()):
+    """
+    Publishes, once `db` commits, a 'payment' event to the receiver of each of
+    `transfers` ((transaction_id, sender_id, receiver_id, amount_cents, timestamp)
+    tuples) and a 'balance' event to each of `senders`. Only users with an event
+    stream open in this process are read, so with nobody listening this costs a
+    few dict lookups. Events carry the new balance and, as their id, the users
+    row version.
+    """
+    receivers = {transfer[2] for transfer in transfers if notifications.has_subscribers(transfer[2])}
+    senders = {sender_id for sender_id in senders if notifications.has_subscribers(sender_id)}
+    if not receivers and not senders:
+        return
+    users = User(db).get_users_by_ids(receivers | senders | {transfer[1] for transfer in transfers
+                                                             if transfer[2] in receivers})
+    events = []
+    for transaction_id, sender_id, receiver_id, amount_cents, timestamp in transfers:
+        receiver = users.get(receiver_id)
+        if receiver_id in receivers and receiver is not None:
+            # A sender on another shard has no row here; the stream names it before sending.
+            sender = users.get(sender_id)
+            events.append((receiver_id, {'event': 'payment', 'id': receiver.version, 'data': {
+                'transaction_id': transaction_id,
+                'sender_id': sender_id,
+                'sender_name': sender.name if sender else None,
+                'amount_cents': amount_cents,
+                'timestamp': timestamp,
+                'balance_cents': receiver.balance_cents,
+            }}))
+    for sender_id in senders:
+        if sender_id in users:
+            events.append((sender_id, balance_event(users[sender_id])))
+
+    def publish():
+        for user_id, event in events:
+            notifications.publish(user_id, event)
+    db.on_commit(publish)
+
+
+def apply_transfer(db, sender_id, receiver_id, amount_cents):
+    """
+    Moves money with a conditional debit, a credit and a ledger insert, with no
+    read-modify-write in Python. Raising rolls the writer back to this job's
+    savepoint, so a rejected transfer never leaves a half-applied debit behind.
+    """
+    user_model = User(db)
+
+    if sender_id == receiver_id or not user_model.credit(receiver_id, amount_cents):
+        raise InvalidTransferUser("Invalid User ID in transfer attempt.")
+
+    if not user_model.debit_if_sufficient(sender_id, amount_cents):
+        if user_model.get_user_by_id(sender_id):
+            raise InsufficientFunds("Insufficient funds for this transfer.")
+        raise InvalidTransferUser("Invalid User ID in transfer attempt.")
+
+    timestamp = utc_timestamp()
+    transaction_id = Transaction(db).record_transaction(sender_id, receiver_id, amount_cents, timestamp)
+    Ledger(db).record_transfer(transaction_id, sender_id, receiver_id, amount_cents)
+    ActivitySummary(db).record_transfers([(sender_id, receiver_id, amount_cents, timestamp[:7])])
+    notify_transfers(db, [(transaction_id, sender_id, receiver_id, amount_cents, timestamp)], senders=[sender_id])
+    parties = {row.id: row for row in db.execute_fetch_all(
+        "SELECT id, name, balance_cents FROM users WHERE id IN (?, ?);", (sender_id, receiver_id))}
+    return {
+        'transaction_id': transaction_id,
+        'sender_id': sender_id,
+        'receiver_id': receiver_id,
+        'receiver_name': parties[receiver_id].name,
+        'amount_cents': amount_cents,
+        'sender_balance_cents': parties[sender_id].balance_cents,
+    }
+
+
+def send_to_other_shards(db, sender_id, payments):
+    """
+    Phase one of transfers to receivers on other shards, after the sender's debit:
+    the sender's transaction rows, ledger legs and activity, and the recovery log row,
+    all in the writer's transaction. Returns (xid, credits) for finish_shard_transfer.
+    """
+    timestamp = utc_timestamp()
+    transaction_ids = Transaction(db).record_transactions(sender_id, payments, timestamp)
+    credits = [(transaction_id, sender_id, receiver_id, amount_cents, timestamp)
+               for transaction_id, (receiver_id, amount_cents) in zip(transaction_ids, payments)]
+    Ledger(db).record_outgoing(credits)
+    ActivitySummary(db).record_transfers([(sender_id, receiver_id, amount_cents, timestamp[:7])
+                                          for receiver_id, amount_cents in payments], only_users={sender_id})
+    return ShardTransferLog(db).prepare(credits), credits
+
+
+def apply_cross_shard_transfer(db, sender_id, receiver, amount_cents):
+    """
+    apply_transfer for a receiver (its users row, read from its own shard) on another
+    shard: only the debit happens here; the credit follows in finish_shard_transfer.
+    Returns (result, (xid, credits)).
+    """
+    user_model = User(db)
+    if not user_model.debit_if_sufficient(sender_id, amount_cents):
+        if user_model.get_user_by_id(sender_id):
+            raise InsufficientFunds("Insufficient funds for this transfer.")
+        raise InvalidTransferUser("Invalid User ID in transfer attempt.")
+
+    prepared = send_to_other_shards(db, sender_id, [(receiver.id, amount_cents)])
+    notify_transfers(db, [], senders=[sender_id])
+    sender = user_model.get_user_by_id(sender_id)
+    return {
+        'transaction_id': prepared[1][0][0],
+        'sender_id': sender_id,
+        'receiver_id': receiver.id,
+        'receiver_name': receiver.name,
+        'amount_cents': amount_cents,
+        'sender_balance_cents': sender.balance_cents,
+    }, prepared
+
+
+def finish_shard_transfer(sender_shard, xid, credits):
+    """
+    Phase two of a cross-shard transfer: applies its credits through the writers of
+    the receivers' shards, then deletes the sender shard's log row. Credits are
+    idempotent (ShardCredits), so running this again, or from recovery at the same
+    time, never pays twice. A receiver found on no shard is being moved right now;
+    the transfer then stays logged for recovery. Returns whether it completed.
+    """
+    remaining = credits
+    for _ in range(2):
+        missing = []
+        for shard, receiver_ids in shards.group({credit[2] for credit in remaining}).items():
+            batch = [credit for credit in remaining if credit[2] in receiver_ids]
+            missing += writer_for_shard(shard).run(lambda db, batch=batch: ShardCredits(db).apply(batch),
+                                                   timeout=WRITE_TIMEOUT)
+        if not missing:
+            writer_for_shard(sender_shard).run(lambda db: ShardTransferLog(db).resolve(xid), timeout=WRITE_TIMEOUT)
+            return True
+        for credit in missing:
+            shards.forget(credit[2])
+        remaining = missing
+    print(f"Cross-shard transfer {xid} left for recovery: {len(remaining)} receivers not found.")
+    return False
+
+
+def complete_shard_transfer(sender_shard, prepared):
+    """Runs phase two right after phase one committed; on failure, recovery retries it later."""
+    shard_recovery.ensure_started()
+    try:
+        finish_shard_transfer(sender_shard, *prepared)
+    except sqlite3.Error as e:
+        print(f"Cross-shard transfer {prepared[0]} left for recovery: {e}")
+
+
+def parse_payout_rows(request):
+    """
+    Reads (receiver_id, amount) pairs from a JSON array (optionally wrapped as
+    {"payouts": [...]}) or from a CSV body with an optional header row.
+    Returns one report entry per input row; rows that fail to parse are already rejected.
+    """
+    if request.mimetype == 'text/csv':
+        records = [record for record in csv.reader(io.StringIO(request.get_data(as_text=True))) if record]
+        if records and not records[0][0].strip().isdigit():
+            records = records[1:]
+        records = [{'receiver_id': record[0], 'amount': record[1] if len(record) > 1 else None}
+                   for record in records]
+    else:
+        payload = request.get_json(silent=True)
+        records = payload.get('payouts') if isinstance(payload, dict) else payload
+        if not isinstance(records, list):
+            return None
+
+    report = []
+    for index, record in enumerate(records, start=1):
+        entry = {'row': index, 'receiver_id': None, 'amount_cents': None, 'status': 'rejected', 'error': None}
+        report.append(entry)
+        if not isinstance(record, dict):
+            entry['error'] = "Expected an object with receiver_id and amount."
+            continue
+        try:
+            entry['receiver_id'] = int(str(record.get('receiver_id')).strip())
+        except ValueError:
+            entry['error'] = "Invalid receiver_id."
+            continue
+        if entry['receiver_id'] <= 0:
+            entry['error'] = "Invalid receiver_id."
+            continue
+        try:
+            entry['amount_cents'] = to_cents(record.get('amount'))
+        except ValueError:
+            entry['error'] = "Invalid amount."
+            continue
+        if entry['amount_cents'] <= 0:
+            entry['error'] = "Amount must be positive."
+            continue
+        entry['status'] = 'pending'
+    return report
+
+
+def apply_payout(db, sender_id, report, remote_ids=frozenset()):
+    """
+    Pays every pending row of a payout report from one sender in a single transaction:
+    one conditional debit for the total, then the credits, transaction rows and
+    ledger entries, each written with a single executemany. Receivers in remote_ids
+    live on other shards and are paid through send_to_other_shards.
+    Returns (report, (xid, credits) or None).
+    """
+    user_model = User(db)
+    pending = [entry for entry in report if entry['status'] == 'pending']
+    known_ids = user_model.existing_ids({entry['receiver_id'] for entry in pending})
+
+    payments, remote_payments = [], []
+    for entry in pending:
+        if entry['receiver_id'] == sender_id or entry['receiver_id'] not in known_ids | remote_ids:
+            entry['status'] = 'rejected'
+            entry['error'] = "Invalid receiver."
+        elif entry['receiver_id'] in known_ids:
+            payments.append(entry)
+        else:
+            remote_payments.append(entry)
+    if not payments and not remote_payments:
+        return report, None
+
+    total_cents = sum(entry['amount_cents'] for entry in payments + remote_payments)
+    # No balance covers a total SQLite could not even store, and binding it would overflow.
+    if total_cents > SQLITE_MAX_INTEGER or not user_model.debit_if_sufficient(sender_id, total_cents):
+        raise InsufficientFunds(f"Insufficient funds for a payout totalling ${from_cents(total_cents):,.2f}.")
+
+    prepared = None
+    if remote_payments:
+        prepared = send_to_other_shards(db, sender_id, [(entry['receiver_id'], entry['amount_cents'])
+                                                        for entry in remote_payments])
+        for credit, entry in zip(prepared[1], remote_payments):
+            entry['status'] = 'paid'
+            entry['transaction_id'] = credit[0]
+    if not payments:
+        notify_transfers(db, [], senders=[sender_id])
+        return report, prepared
+
+    credits = {}
+    for entry in payments:
+        credits[entry['receiver_id']] = credits.get(entry['receiver_id'], 0) + entry['amount_cents']
+    user_model.credit_many(list(credits.items()))
+
+    pairs = [(entry['receiver_id'], entry['amount_cents']) for entry in payments]
+    timestamp = utc_timestamp()
+    transaction_ids = Transaction(db).record_transactions(sender_id, pairs, timestamp)
+    Ledger(db).record_transfers([(transaction_id, sender_id, receiver_id, amount_cents)
+                                 for transaction_id, (receiver_id, amount_cents) in zip(transaction_ids, pairs)])
+    ActivitySummary(db).record_transfers([(sender_id, receiver_id, amount_cents, timestamp[:7])
+                                          for receiver_id, amount_cents in pairs])
+    notify_transfers(db, [(transaction_id, sender_id, receiver_id, amount_cents, timestamp)
+                          for transaction_id, (receiver_id, amount_cents) in zip(transaction_ids, pairs)],
+                     senders=[sender_id])
+
+    for transaction_id, entry in zip(transaction_ids, payments):
+        entry['status'] = 'paid'
+        entry['transaction_id'] = transaction_id
+    return report, prepared
+
+
+def run_payout(sender_id, report):
+    """
+    Pays a payout through the writer of the sender's shard. Receivers on other
+    shards are checked there first, and paid in phase two once the debit commits.
+    Every row counts against the velocity limits as a transfer of its own; if any
+    row would go over them, the whole payout is refused with VelocityLimitExceeded.
+    """
+    charged = []
+    try:
+        for entry in report:
+            if entry['status'] == 'pending':
+                charged.append((entry, charge_velocity(sender_id, entry['receiver_id'], entry['amount_cents'])))
+    except VelocityLimitExceeded:
+        for _, charges in charged:
+            refund_velocity(charges)
+        raise
+
+    sender_shard = shards.shard_for(sender_id)
+    remote_ids = set()
+    if shards.count > 1:
+        receiver_ids = {entry['receiver_id'] for entry in report if entry['status'] == 'pending'}
+        for shard, shard_ids in shards.group(receiver_ids).items():
+            if shard != sender_shard:
+                with DatabaseConnection.for_shard(shard) as db:
+                    remote_ids |= User(db).existing_ids(shard_ids)
+    try:
+        report, prepared = writer_for_shard(sender_shard).run(
+            lambda db: apply_payout(db, sender_id, report, remote_ids), timeout=WRITE_TIMEOUT)
+    except (TransferRejected, sqlite3.Error, OverflowError):
+        for _, charges in charged:
+            refund_velocity(charges)
+        raise
+    for entry, charges in charged:
+        if entry['status'] != 'paid':
+            refund_velocity(charges)
+    if prepared:
+        complete_shard_transfer(sender_shard, prepared)
+    return report
+
+
+def pay_due_schedules(db, now, limit, charges):
+    """
+    Writer job that takes up to `limit` schedules due at `now` on this shard and
+    pays them in one transaction. The writer holds the shard's write lock, so
+    balances are checked in Python against one read; then every balance change,
+    transaction row, ledger leg and activity update is written with one
+    executemany each, and in the same commit every schedule moves on to its next
+    run or records why it failed. Claiming and paying commit together, so no
+    schedule is paid twice, however many processes run the scheduler. Each payment
+    counts against the sender's velocity limits like any transfer, its charges
+    appended to `charges` for refund_velocity should the job fail; a schedule over
+    a limit is not paid and records a failed run. Returns (schedules handled,
+    [(xid, credits)] for receivers on other shards).
+    """
+    schedules = ScheduledTransfer(db).due(now, limit)
+    if not schedules:
+        return 0, []
+    user_model = User(db)
+    balances = {user.id: user.balance_cents
+                for user in user_model.get_users_by_ids({schedule.sender_id for schedule in schedules}).values()}
+    receiver_ids = {schedule.receiver_id for schedule in schedules}
+    local_ids = user_model.existing_ids(receiver_ids)
+    known_ids = set(local_ids)
+    if shards.count > 1:
+        shard = shards.index_of(db.db_path)
+        for other, shard_ids in shards.group(receiver_ids - local_ids).items():
+            if other != shard:
+                with DatabaseConnection.for_shard(other) as other_db:
+                    known_ids |= User(other_db).existing_ids(shard_ids)
+
+    changes, payments, remote_payments, errors = {}, [], {}, {}
+    for schedule in schedules:
+        sender_id, receiver_id, amount_cents = schedule.sender_id, schedule.receiver_id, schedule.amount_cents
+        if sender_id not in balances or receiver_id == sender_id or receiver_id not in known_ids:
+            errors[schedule.id] = "Invalid receiver."
+            continue
+        if balances[sender_id] < amount_cents:
+            errors[schedule.id] = "Insufficient funds."
+            continue
+        try:
+            charges.extend(charge_velocity(sender_id, receiver_id, amount_cents))
+        except VelocityLimitExceeded:
+            errors[schedule.id] = "Transfer limit reached."
+            continue
+        balances[sender_id] -= amount_cents
+        changes[sender_id] = changes.get(sender_id, 0) - amount_cents
+        if receiver_id in local_ids:
+            if receiver_id in balances:
+                balances[receiver_id] += amount_cents
+            changes[receiver_id] = changes.get(receiver_id, 0) + amount_cents
+            payments.append(schedule)
+        else:
+            remote_payments.setdefault(sender_id, []).append(schedule)
+    # Net change per user, debits negative: one UPDATE for each user touched by the batch.
+    user_model.credit_many(list(changes.items()))
+
+    timestamp = utc_timestamp()
+    paid, transfers, prepared = {}, [], []
+    if payments:
+        transaction_ids = Transaction(db).allocate_ids(len(payments))
+        transfers = [(transaction_id, schedule.sender_id, schedule.receiver_id, schedule.amount_cents, timestamp)
+                     for transaction_id, schedule in zip(transaction_ids, payments)]
+        Transaction(db).insert_rows([
+            (transaction_id, sender_id, receiver_id, from_cents(amount_cents), amount_cents, timestamp, 'Completed')
+            for transaction_id, sender_id, receiver_id, amount_cents, timestamp in transfers])
+        Ledger(db).record_transfers([transfer[:4] for transfer in transfers])
+        ActivitySummary(db).record_transfers([(sender_id, receiver_id, amount_cents, timestamp[:7])
+                                              for _, sender_id, receiver_id, amount_cents, _ in transfers])
+        paid.update(zip((schedule.id for schedule in payments), transaction_ids))
+    for sender_id, sent in remote_payments.items():
+        xid, credits = send_to_other_shards(db, sender_id, [(schedule.receiver_id, schedule.amount_cents)
+                                                            for schedule in sent])
+        prepared.append((xid, credits))
+        paid.update((schedule.id, credit[0]) for schedule, credit in zip(sent, credits))
+    notify_transfers(db, transfers, senders={schedule.sender_id for schedule in schedules if schedule.id in paid})
+
+    runs, next_runs = [], {}
+    for schedule in schedules:
+        error = errors.get(schedule.id)
+        failures = schedule.failure_count + 1 if error else 0
+        if schedule.frequency == 'once':
+            next_run, status = schedule.next_run, 'failed' if error else 'completed'
+        else:
+            # Schedules due at the same moment mostly share a next run; work each one out once.
+            key = (schedule.frequency, schedule.next_run, schedule.day_of_month)
+            next_run = next_runs.get(key)
+            if next_run is None:
+                next_run = next_runs[key] = next_run_after(*key, now)
+            status = 'suspended' if failures >= SCHEDULE_MAX_FAILURES else 'active'
+        runs.append((next_run, status, failures, timestamp, paid.get(schedule.id, schedule.last_transaction_id),
+                     error, schedule.id))
+    ScheduledTransfer(db).record_runs(runs)
+    return len(schedules), prepared
+
+
+def run_scheduled_transfers(batch_size=SCHEDULE_BATCH_SIZE):
+    """
+    Pays every schedule due now, shard by shard, in writer jobs of batch_size
+    (pay_due_schedules), so live transfers get the writer in between batches.
+    A read of the due index first skips shards with nothing due without queuing a
+    job. Returns the number of schedules handled.
+    """
+    now = utc_timestamp()
+    handled = 0
+    for shard in range(shards.count):
+        with DatabaseConnection.for_shard(shard) as db:
+            if not ScheduledTransfer(db).due(now, 1):
+                continue
+        shard_writer = writer_for_shard(shard)
+        while True:
+            charges = []
+            try:
+                count, prepared = shard_writer.run(lambda db: pay_due_schedules(db, now, batch_size, charges),
+                                                   timeout=WRITE_TIMEOUT)
+            except sqlite3.Error:
+                refund_velocity(charges)
+                raise
+            for entry in prepared:
+                complete_shard_transfer(shard, entry)
+            handled += count
+            if count < batch_size:
+                break
+    return handled
+
+
+class ScheduleLimitReached(TransferRejected):
+    pass
+
+
+def create_schedule(sender_id, receiver_id, amount_cents, frequency, next_run):
+    """
+    Adds a schedule through the writer of the sender's shard, after checking the
+    receiver on its own shard. Raises InvalidTransferUser or ScheduleLimitReached.
+    """
+    if receiver_id == sender_id:
+        raise InvalidTransferUser("Invalid User ID in transfer attempt.")
+    with DatabaseConnection.for_user(receiver_id) as db:
+        if not User(db).existing_ids({receiver_id}):
+            raise InvalidTransferUser("Invalid User ID in transfer attempt.")
+
+    def job(db):
+        schedules = ScheduledTransfer(db)
+        if schedules.count_open(sender_id) >= SCHEDULE_MAX_PER_USER:
+            raise ScheduleLimitReached(f"You can have at most {SCHEDULE_MAX_PER_USER} scheduled transfers.")
+        return schedules.create(sender_id, receiver_id, amount_cents, frequency, next_run)
+    return writer_for(sender_id).run(job, timeout=WRITE_TIMEOUT)
+
+
+class IdempotencyKeyReused(TransferRejected):
+    pass
+
+
+def idempotency_cutoff():
+    return (datetime.utcnow() - IDEMPOTENCY_KEY_RETENTION).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def stored_idempotent_result(stored, request_hash):
+    if stored.request_hash != request_hash:
+        raise IdempotencyKeyReused("This idempotency key was already used for a different request.")
+    return json.loads(stored.response)
+
+
+def run_transfer(sender_id, receiver_id, amount_cents, idempotency_key=None):
+    """
+    Applies a transfer through the writer of the sender's shard. With an idempotency
+    key, a repeat of a request that already succeeded returns the stored result from
+    a primary-key lookup and never reaches the balances. A receiver on another shard
+    is credited in a second phase (finish_shard_transfer).
+    """
+    try:
+        return route_transfer(sender_id, receiver_id, amount_cents, idempotency_key)
+    except InvalidTransferUser:
+        # Either party may have moved since its shard was cached; route once more from the directory.
+        if not (shards.forget(sender_id) | shards.forget(receiver_id)):
+            raise
+        return route_transfer(sender_id, receiver_id, amount_cents, idempotency_key)
+
+
+def route_transfer(sender_id, receiver_id, amount_cents, idempotency_key):
+    sender_shard, receiver_shard = shards.shard_for(sender_id), shards.shard_for(receiver_id)
+    if sender_shard == receiver_shard:
+        def apply(db):
+            return apply_transfer(db, sender_id, receiver_id, amount_cents), None
+    else:
+        with DatabaseConnection.for_shard(receiver_shard) as db:
+            receiver = User(db).get_user_by_id(receiver_id)
+        if receiver is None:
+            raise InvalidTransferUser("Invalid User ID in transfer attempt.")
+
+        def apply(db):
+            return apply_cross_shard_transfer(db, sender_id, receiver, amount_cents)
+    shard_writer = writer_for_shard(sender_shard)
+
+    if not idempotency_key:
+        job = apply
+    else:
+        idempotency_sweeper.ensure_started()
+        request_hash = f"transfer:{receiver_id}:{amount_cents}"
+        cutoff = idempotency_cutoff()
+
+        with DatabaseConnection.for_shard(sender_shard) as db:
+            stored = IdempotencyKey(db).get(sender_id, idempotency_key, cutoff)
+        if stored:
+            return stored_idempotent_result(stored, request_hash)
+
+        def job(db):
+            # Checked again on the writer: the first attempt may still have been queued above.
+            keys = IdempotencyKey(db)
+            stored = keys.get(sender_id, idempotency_key, cutoff)
+            if stored:
+                return stored_idempotent_result(stored, request_hash), None
+            result, prepared = apply(db)
+            keys.save(sender_id, idempotency_key, request_hash, result)
+            return result, prepared
+
+    # Replays answered above are not counted against the velocity limits.
+    charges = charge_velocity(sender_id, receiver_id, amount_cents)
+    try:
+        result, prepared = shard_writer.run(job, timeout=WRITE_TIMEOUT)
+    except (TransferRejected, sqlite3.Error):
+        refund_velocity(charges)
+        raise
+
+    if prepared:
+        complete_shard_transfer(sender_shard, prepared)
+    return result
+
+
+def sweep_idempotency_keys():
+    """Deletes expired idempotency keys in small batches so no shard's writer is held for long."""
+    cutoff = idempotency_cutoff()
+    for shard in range(shards.count):
+        shard_writer = writer_for_shard(shard)
+        while shard_writer.run(lambda db: IdempotencyKey(db).delete_expired(cutoff, IDEMPOTENCY_SWEEP_BATCH),
+                               timeout=WRITE_TIMEOUT) == IDEMPOTENCY_SWEEP_BATCH:
+            pass
+
+
+def recover_shard_transfers(older_than=SHARD_RECOVERY_GRACE):
+    """
+    Finishes cross-shard work that a crash or an error left half-done: transfers
+    still in a sender shard's log, and users cut over from a shard but not yet
+    confirmed on their new one, once older than `older_than`. Both steps are
+    idempotent, so any number of processes may run this at once.
+    Returns (transfers finished, moves finished).
+    """
+    cutoff = (datetime.utcnow() - older_than).strftime('%Y-%m-%d %H:%M:%S')
+    transfers = moves = 0
+    for shard in range(shards.count):
+        with DatabaseConnection.for_shard(shard) as db:
+            logged = ShardTransferLog(db).pending(cutoff)
+            moving = ShardMoves(db).pending(cutoff)
+        for row in logged:
+            transfers += finish_shard_transfer(shard, row.xid, json.loads(row.credits))
+        for row in moving:
+            finish_user_move(shard, row.user_id, row.target_shard, json.loads(row.payload))
+            moves += 1
+    return transfers, moves
+
+
+def archive_transactions(older_than=ARCHIVE_AFTER, batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_PAUSE):
+    """
+    Moves transactions older than `older_than` into the monthly archive, oldest
+    first, one shard after another. Ids and timestamps rise together, so each batch
+    is a contiguous id range read from the front of the table. A batch is first
+    committed to the archive and then deleted from the hot table through the writer,
+    pausing in between so live traffic keeps the writer. If a run is interrupted,
+    the next run copies the same rows again (the archive ignores duplicates, which
+    also covers a cross-shard transfer's two copies) and deletes them.
+    """
+    cutoff = (datetime.utcnow() - older_than).strftime('%Y-%m-%d %H:%M:%S')
+    moved = 0
+    for shard in range(shards.count):
+        shard_writer, last_id = writer_for_shard(shard), 0
+        while True:
+            with DatabaseConnection.for_shard(shard) as db:
+                rows = Transaction(db).oldest(last_id, batch_size)
+            batch = list(itertools.takewhile(lambda row: row.timestamp < cutoff, rows))
+            if not batch:
+                break
+            transaction_archive.store(batch)
+            first_id, last_id = batch[0].id, batch[-1].id
+            moved += shard_writer.run(lambda db: Transaction(db).delete_range(first_id, last_id, cutoff),
+                                      timeout=WRITE_TIMEOUT)
+            if len(batch) < len(rows):
+                break
+            time.sleep(pause)
+    return moved
+
+
+def activity_swap_job(first_user_id, last_user_id, summaries, pairs, snapshot_id):
+    """
+    Writer job that swaps in one rebuilt chunk and then re-counts, for those users
+    only, the transfers committed after the rebuild's snapshot, which the old rows
+    had already counted incrementally.
+    """
+    def job(db):
+        activity = ActivitySummary(db)
+        activity.replace_range(first_user_id, last_user_id, summaries, pairs)
+        late = db.execute_fetch_all(
+            "SELECT sender_id, receiver_id, amount_cents, timestamp FROM transactions WHERE id > ?;", (snapshot_id,))
+        users = {user_id for row in late for user_id in (row.sender_id, row.receiver_id)
+                 if first_user_id <= user_id <= last_user_id}
+        if shards.count > 1:
+            # Rows mirrored for cross-shard transfers also name users of other shards.
+            users = User(db).existing_ids(users)
+        activity.record_transfers([(row.sender_id, row.receiver_id, row.amount_cents, row.timestamp[:7])
+                                   for row in late if row.sender_id in users or row.receiver_id in users],
+                                  only_users=users)
+        return len(summaries)
+    return job
+
+
+def rebuild_activity(workers=ACTIVITY_REBUILD_WORKERS, chunk_size=ACTIVITY_REBUILD_CHUNK):
+    """
+    Recomputes every activity summary from the hot tables and the archive. Each
+    shard's users are split into id chunks summarised in parallel worker processes
+    on read-only connections, up to a snapshot transaction id; each chunk is then
+    swapped in through its shard's writer, so live transfers keep flowing throughout.
+    """
+    # Process pools are only needed by offline jobs like this one; importing them lazily
+    # keeps ~10 ms off every web worker's startup.
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    archive_paths = transaction_archive.paths()
+    rebuilt = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context(WORKER_START_METHOD)) as pool:
+        for shard, path in enumerate(shards.paths):
+            with DatabaseConnection(path) as db:
+                max_user_id = db.execute_fetch_one("SELECT COALESCE(MAX(id), 0) AS id FROM users;").id
+                snapshot_id = db.execute_fetch_one("SELECT COALESCE(MAX(id), 0) AS id FROM transactions;").id
+            ranges = [(first, min(first + chunk_size - 1, max_user_id))
+                      for first in range(1, max_user_id + 1, chunk_size)]
+            futures = [(first, last, pool.submit(summarize_users, path, archive_paths, first, last, snapshot_id,
+                                                 ACTIVITY_MONTHS, ACTIVITY_TOP_COUNTERPARTIES))
+                       for first, last in ranges]
+            for first, last, future in futures:
+                summaries, pairs = future.result()
+                # Counterparties on other shards have no name in this shard's users table.
+                unnamed = {entry['id'] for summary in summaries for entry in summary['top_counterparties']
+                           if entry['name'] is None}
+                if unnamed:
+                    names = user_names(unnamed)
+                    for summary in summaries:
+                        for entry in summary['top_counterparties']:
+                            entry['name'] = entry['name'] or names.get(entry['id'])
+                rebuilt += writer_for_shard(shard).run(activity_swap_job(first, last, summaries, pairs, snapshot_id),
+                                                       timeout=WRITE_TIMEOUT)
+    return rebuilt
+
+
+def write_checkpoint(path, checkpoint):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary, path)
+
+
+def reconcile_balances(report_path=RECONCILE_REPORT, checkpoint_path=RECONCILE_CHECKPOINT, resume=False,
+                       workers=RECONCILE_WORKERS, chunk_size=RECONCILE_CHUNK, duty_cycle=RECONCILE_DUTY_CYCLE):
+    """
+    Checks every balance against the signup credit plus net transfers (hot and
+    archived) and against the ledger. Each shard's users are split into id ranges checked by
+    worker processes on read-only connections, each range in its own short read
+    transaction, so writers are never blocked and WAL checkpoints are not held
+    back. Mismatches are appended to an NDJSON report as ranges finish; each
+    finished range is then recorded in a checkpoint file, so an interrupted run
+    can resume where it stopped. Returns (users checked, mismatches found).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    checkpoint = {'chunk_size': chunk_size, 'done': [], 'checked': 0, 'mismatches': 0}
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        chunk_size = checkpoint['chunk_size']
+    else:
+        resume = False
+    # Finished ranges are recorded as [shard, first user id]; checkpoints written before
+    # sharding hold bare ids, which are shard 0's.
+    done = {tuple(entry) if isinstance(entry, list) else (0, entry) for entry in checkpoint['done']}
+
+    archive_paths = transaction_archive.paths()
+    ranges = []
+    for shard, path in enumerate(shards.paths):
+        with DatabaseConnection(path) as db:
+            max_user_id = db.execute_fetch_one("SELECT COALESCE(MAX(id), 0) AS id FROM users;").id
+        ranges += [(shard, first, min(first + chunk_size - 1, max_user_id))
+                   for first in range(1, max_user_id + 1, chunk_size) if (shard, first) not in done]
+
+    with open(report_path, 'a' if resume else 'w') as report, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=get_context(WORKER_START_METHOD),
+                                initializer=lower_priority) as pool:
+        # Only a few ranges are queued ahead of the workers, so results stay small and
+        # an interrupted run has little finished-but-unrecorded work to redo.
+        pending = {}
+        ranges = iter(ranges)
+        while True:
+            for shard, first, last in itertools.islice(ranges, workers * 2 - len(pending)):
+                future = pool.submit(reconcile_range, shards.paths[shard], archive_paths, first, last,
+                                     SIGNUP_CREDIT_CENTS, duty_cycle)
+                pending[future] = shard
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                shard = pending.pop(future)
+                result = future.result()
+                for mismatch in result['mismatches']:
+                    report.write(json.dumps(dict(mismatch, shard=shard)) + '\n')
+                report.flush()
+                os.fsync(report.fileno())
+                checkpoint['done'].append([shard, result['first_user_id']])
+                checkpoint['checked'] += result['checked']
+                checkpoint['mismatches'] += len(result['mismatches'])
+                write_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint['checked'], checkpoint['mismatches']
+
+
+# Rows that follow a user to another shard, as (table, user id column, columns).
+USER_MOVE_TABLES = [
+    ('users', 'id', USER_COLUMNS + ', password'),
+    ('activity_summaries', 'user_id', ActivitySummary.COLUMNS + ', updated_at'),
+    ('user_counterparties', 'user_id', 'user_id, counterparty_id, count, cents'),
+    ('idempotency_keys', 'user_id', 'user_id, key, request_hash, response, created_at'),
+    ('shard_credits', 'receiver_id', 'transaction_id, receiver_id'),
+    ('scheduled_transfers', 'sender_id', ScheduledTransfer.COLUMNS),
+]
+
+
+def cut_over_user(user_id, target_shard, copied_ids):
+    """
+    Writer job on the user's current shard for move_user. In one transaction it
+    collects what the bulk copy did not cover (the USER_MOVE_TABLES rows and any
+    history rows outside copied_ids), deletes those rows here, moves the balance to
+    the transit account and logs everything in shard_moves. Returns that payload.
+    """
+    def job(db):
+        user = User(db).get_user_by_id(user_id)
+        if user is None:
+            raise InvalidTransferUser(f"User {user_id} is not on shard {shards.index_of(db.db_path)}.")
+        transactions = Transaction(db)
+        payload = {
+            'email': user.email,
+            'balance_cents': user.balance_cents,
+            'transactions': [list(row) for row in
+                             transactions.rows_by_id(transactions.ids_for_user(user_id) - copied_ids)],
+            'tables': {},
+        }
+        for table, column, columns in USER_MOVE_TABLES:
+            rows = db.execute_fetch_all(f"SELECT {columns} FROM {table} WHERE {column} = ?;", (user_id,))
+            payload['tables'][table] = [list(row) for row in rows]
+            db.execute_update(f"DELETE FROM {table} WHERE {column} = ?;", (user_id,))
+        Ledger(db).record_move_out(user_id, user.balance_cents)
+        ShardMoves(db).add(user_id, target_shard, payload)
+        db.on_commit(lambda: user_cache.invalidate(user_id))
+        return payload
+    return job
+
+
+def apply_user_move(user_id, payload):
+    """Writer job on the target shard that writes a cut-over payload; does nothing if it already did."""
+    def job(db):
+        if User(db).get_user_by_id(user_id):
+            return False
+        for table, _, columns in USER_MOVE_TABLES:
+            rows = payload['tables'][table]
+            if rows:
+                db.execute_many(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({', '.join('?' * len(rows[0]))});",
+                                rows)
+        Transaction(db).insert_rows(payload['transactions'], ignore_existing=True)
+        Ledger(db).record_move_in(user_id, payload['balance_cents'])
+        db.on_commit(lambda: user_cache.invalidate(user_id))
+        return True
+    return job
+
+
+def finish_user_move(source_shard, user_id, target_shard, payload, batch_size=SHARD_MOVE_BATCH):
+    """
+    The rest of a move after its cutover: writes the payload on the target shard,
+    points the directory there, clears the source's shard_moves row and then deletes
+    the source's history rows that no user left there needs. Every step can be
+    repeated, so recovery simply runs this again.
+    """
+    writer_for_shard(target_shard).run(apply_user_move(user_id, payload), timeout=WRITE_TIMEOUT)
+    writer.run(lambda db: UserDirectory(db).place(user_id, payload['email'], target_shard), timeout=WRITE_TIMEOUT)
+    source_writer = writer_for_shard(source_shard)
+    source_writer.run(lambda db: ShardMoves(db).resolve(user_id), timeout=WRITE_TIMEOUT)
+    shards.forget(user_id)
+    user_cache.invalidate(user_id)
+    while source_writer.run(lambda db: Transaction(db).delete_unowned(user_id, batch_size),
+                            timeout=WRITE_TIMEOUT) == batch_size:
+        pass
+
+
+def move_user(user_id, target_shard, batch_size=SHARD_MOVE_BATCH):
+    """
+    Moves a user to another shard while the app keeps serving. The user's history
+    is first copied to the target in batches with transfers still flowing; the
+    cutover then takes the rest in one short job on the current shard's writer, and
+    finish_user_move applies it on the target. Between the two the user is on
+    neither shard: a transfer in that window is rejected after one retry, and a
+    cross-shard credit waits in its log for recovery. Returns the rows copied.
+    """
+    shards.forget(user_id)
+    source_shard = shards.shard_for(user_id)
+    if source_shard == target_shard:
+        return 0
+
+    target_writer = writer_for_shard(target_shard)
+    copied = set()
+    for column in ('sender_id', 'receiver_id'):
+        after = ('', 0)
+        while True:
+            with DatabaseConnection.for_shard(source_shard) as db:
+                rows = Transaction(db).for_party(column, user_id, after, batch_size)
+            if not rows:
+                break
+            target_writer.run(lambda db, rows=rows: Transaction(db).insert_rows(rows, ignore_existing=True),
+                              timeout=WRITE_TIMEOUT)
+            copied.update(row.id for row in rows)
+            after = (rows[-1].timestamp, rows[-1].id)
+
+    payload = writer_for_shard(source_shard).run(cut_over_user(user_id, target_shard, copied), timeout=WRITE_TIMEOUT)
+    finish_user_move(source_shard, user_id, target_shard, payload, batch_size)
+    return len(copied) + len(payload['transactions'])
+
+
+def rebalance_shards(dry_run=False, batch_size=SHARD_MOVE_BATCH):
+    """
+    Evens out the number of users per shard, moving the newest users off the fullest
+    shards one move_user at a time. Returns the (user_id, from_shard, to_shard)
+    moves, which are only planned with dry_run.
+    """
+    counts = []
+    for shard in range(shards.count):
+        with DatabaseConnection.for_shard(shard) as db:
+            counts.append(db.execute_fetch_one("SELECT COUNT(*) AS users FROM users;").users)
+    total = sum(counts)
+    by_size = sorted(range(shards.count), key=lambda shard: -counts[shard])
+    targets = {shard: total // shards.count + (rank < total % shards.count) for rank, shard in enumerate(by_size)}
+
+    deficits = [[shard, targets[shard] - counts[shard]] for shard in by_size if counts[shard] < targets[shard]]
+    moves = []
+    for shard in by_size:
+        excess = counts[shard] - targets[shard]
+        if excess <= 0:
+            continue
+        with DatabaseConnection.for_shard(shard) as db:
+            user_ids = [row.id for row in db.execute_fetch_all("SELECT id FROM users ORDER BY id DESC LIMIT ?;",
+                                                               (excess,))]
+        for user_id in user_ids:
+            deficit = next(entry for entry in deficits if entry[1] > 0)
+            deficit[1] -= 1
+            moves.append((user_id, shard, deficit[0]))
+
+    if not dry_run:
+        for user_id, _, target_shard in moves:
+            move_user(user_id, target_shard, batch_size)
+    return moves
+
+
+idempotency_sweeper = PeriodicTask(sweep_idempotency_keys, IDEMPOTENCY_SWEEP_INTERVAL,
+                                   name='quickpay-idempotency-sweeper')
+shard_recovery = PeriodicTask(recover_shard_transfers, SHARD_RECOVERY_INTERVAL, name='quickpay-shard-recovery')
+scheduler = PeriodicTask(run_scheduled_transfers, SCHEDULE_INTERVAL, name='quickpay-scheduler')
+
+
+def read_idempotency_key(value):
+    if value is None or value == '':
+        return None
+    if len(value) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"Idempotency keys may be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters.")
+    return value
+
+
+def login_retry_after(email):
+    """
+    Takes one attempt from the client IP's and the account's login buckets; returns
+    0 if the attempt may go ahead, else the seconds to wait. Checked before the
+    password hash, so a flood of guesses never reaches the hasher. Behind a proxy,
+    remote_addr is the client only with werkzeug's ProxyFix installed.
+    """
+    retry_after = limiter.take(f'login-ip:{request.remote_addr}', *LOGIN_IP_BUCKET)
+    if retry_after:
+        return retry_after
+    return limiter.take(f'login:{email.strip().lower()}', *LOGIN_ACCOUNT_BUCKET)
+
+
+def rehash_password(user_id, password):
+    """Upgrades a stored hash to the current method and cost; a busy hasher just defers it to the next login."""
+    try:
+        new_hash = hasher.hash(password)
+        writer_for(user_id).submit(lambda db: User(db).update_password(user_id, new_hash))
+    except (HashQueueFull, sqlite3.Error) as e:
+        print(f"Password rehash deferred for user {user_id}: {e}")
+
+
+@app.errorhandler(HashQueueFull)
+def handle_hash_queue_full(e):
+    return str(e), 503, {'Retry-After': '1'}
+
+
 @app.route('/')
 def index():
     if 'user' in session:
@@ -174,17 +2585,14 @@ def register():
             flash("Password must be at least 6 characters long.", "danger")
             return redirect(url_for('register'))
 
-        hashed_pw = generate_password_hash(password)
+        hashed_pw = hasher.hash(password)
 
         try:
-            with DatabaseConnection(DB_PATH) as db:
-                user_model = User(db)
+            new_user_id = create_account(fullname, email, hashed_pw)
 
-                if user_model.get_user_by_email(email):
-                    flash("Email already registered. Please log in.", "warning")
-                    return redirect(url_for('login'))
-                else:
-                    new_user_id = user_model.create_user(fullname, email, hashed_pw)
+            if new_user_id is None:
+                flash("Email already registered. Please log in.", "warning")
+                return redirect(url_for('login'))
 
             user_data = get_current_user_data(new_user_id)
             if user_data:
@@ -211,18 +2619,23 @@ def login():
         email = request.form['email']
         password = request.form['password']
 
+        retry_after = login_retry_after(email)
+        if retry_after:
+            flash(f"Too many login attempts. Try again in {math.ceil(retry_after)} seconds.", "danger")
+            return render_template('login.html'), 429, {'Retry-After': str(math.ceil(retry_after))}
+
         try:
-            with DatabaseConnection(DB_PATH) as db:
-                user_model = User(db)
-                user = user_model.get_user_by_email(email)
-
-                if user and check_password_hash(user['password'], password):
-                    session['user'] = {'name': user['name'], 'id': user['id']}
-                    flash(f"Welcome back, {user['name']}!", "success")
-                    return redirect(url_for('welcome'))
-                else:
-                    flash("Invalid email or password", "danger")
-                    return redirect(url_for('login'))
+            user = find_login(email)
+
+            if user and hasher.verify(user.password, password):
+                if hasher.needs_rehash(user.password):
+                    rehash_password(user.id, password)
+                session['user'] = {'name': user.name, 'id': user.id}
+                flash(f"Welcome back, {user.name}!", "success")
+                return redirect(url_for('welcome'))
+            else:
+                flash("Invalid email or password", "danger")
+                return redirect(url_for('login'))
 
         except sqlite3.Error as e:
             flash(f"Database Error during login. {e}", "danger")
@@ -253,7 +2666,14 @@ def welcome():
         flash("User data not found. Please log in again.", "danger")
         return redirect(url_for('login'))
 
-    return render_template('welcome.html', user=user_data)
+    try:
+        with DatabaseConnection.for_user(user_id) as db:
+            activity = ActivitySummary(db).get(user_id)
+    except sqlite3.Error as e:
+        print(f"Activity summary unavailable for user {user_id}: {e}")
+        activity = None
+
+    return render_template('welcome.html', user=user_data, activity=activity, this_month=current_month())
 
 
 @app.route('/send')
@@ -270,15 +2690,22 @@ def send_money():
         flash("User data not found. Please log in again.", "danger")
         return redirect(url_for('login'))
 
-    try:
-        with DatabaseConnection(DB_PATH) as db:
-            user_model = User(db)
-            other_users = user_model.get_all_users_except_self(user_id)
+    return render_template('send_money.html', user=user_data, idempotency_key=uuid.uuid4().hex)
+
+
+@app.route('/users/search')
+def search_users():
+    if 'user' not in session:
+        return jsonify(error="Not logged in."), 401
 
-        return render_template('send_money.html', user=user_data, other_users=other_users)
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', RECIPIENT_SEARCH_LIMIT, type=int), RECIPIENT_SEARCH_LIMIT))
+
+    try:
+        results = search_recipients(query, session['user']['id'], limit)
+        return jsonify(results=[row._asdict() for row in results])
     except sqlite3.Error as e:
-        flash(f"Database Error: Could not load recipient data. {e}", "danger")
-        return render_template('send_money.html', user=user_data, other_users=[])
+        return jsonify(error=f"Could not search recipients. {e}"), 500
 
 
 @app.route('/history')
@@ -295,15 +2722,50 @@ def transaction_history():
         flash("User data not found. Please log in again.", "danger")
         return redirect(url_for('login'))
 
+    page_size = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, HISTORY_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    before = decode_history_cursor(cursor) if cursor else None
+    if cursor and before is None:
+        flash("Invalid page link; showing your latest transactions.", "warning")
+
+    # The session is saved before a streamed body is generated, so pop flashes now.
+    get_flashed_messages(with_categories=True)
+    history = HistoryPage(user_id, page_size, before)
+    return stream_template('transaction_history.html', user=user_data, history=history,
+                           is_first_page=before is None,
+                           limit=page_size if page_size != HISTORY_PAGE_SIZE else None)
+
+
+@app.route('/history/export')
+def export_history():
+    if 'user' not in session:
+        flash("You must be logged in to export your history.", "warning")
+        return redirect(url_for('login'))
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        flash("Unsupported export format.", "danger")
+        return redirect(url_for('transaction_history'))
     try:
-        with DatabaseConnection(DB_PATH) as db:
-            transaction_model = Transaction(db)
-            history = transaction_model.get_transactions_for_user(user_id)
+        start = parse_export_date(request.args.get('from'))
+        end = parse_export_date(request.args.get('to'))
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        return redirect(url_for('transaction_history'))
 
-        return render_template('transaction_history.html', user=user_data, history=history)
-    except sqlite3.Error as e:
-        flash(f"Database Error: Could not load transaction history. {e}", "danger")
-        return render_template('transaction_history.html', user=user_data, history=[])
+    # 'to' is inclusive, so the bound is the start of the following day.
+    since = start.strftime('%Y-%m-%d %H:%M:%S') if start else None
+    until = (end + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S') if end else None
+    filename = '-'.join(['quickpay-statement'] + [d.strftime('%Y%m%d') for d in (start, end) if d])
+    filename += f'.{export_format}'
+
+    body = iter_statement(session['user']['id'], export_format, since, until)
+    mimetype = EXPORT_FORMATS[export_format]
+    if request.args.get('gzip'):
+        body, mimetype, filename = gzip_stream(body), 'application/gzip', filename + '.gz'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 
 @app.route('/transfer', methods=['POST'])
@@ -315,13 +2777,13 @@ def transfer():
     receiver_id = request.form.get('receiver_id', type=int)
     amount_str = request.form.get('amount')
 
-    if not receiver_id or not amount_str:
+    if not is_user_id(receiver_id) or not amount_str:
         flash("Missing receiver or amount.", "danger")
         return redirect(url_for('send_money'))
 
     try:
-        amount = float(amount_str)
-        if amount <= 0:
+        amount_cents = to_cents(amount_str)
+        if amount_cents <= 0:
             flash("Amount must be positive.", "danger")
             return redirect(url_for('send_money'))
     except ValueError:
@@ -329,31 +2791,23 @@ def transfer():
         return redirect(url_for('send_money'))
 
     try:
-        with DatabaseConnection(DB_PATH) as db:
-            user_model = User(db)
-            transaction_model = Transaction(db)
-
-            sender = user_model.get_user_by_id(sender_id)
-            receiver = user_model.get_user_by_id(receiver_id)
-
-            if not sender or not receiver:
-                flash("Invalid sender or receiver ID.", "danger")
-                raise Exception("Invalid User ID in transfer attempt.")
-
-            if sender['balance'] < amount:
-                flash("Insufficient funds for this transfer.", "danger")
-                return redirect(url_for('send_money'))
-
-            new_sender_balance = sender['balance'] - amount
-            user_model.update_balance(sender_id, new_sender_balance)
-
-            new_receiver_balance = receiver['balance'] + amount
-            user_model.update_balance(receiver_id, new_receiver_balance)
-
-            transaction_model.record_transaction(sender_id, receiver_id, amount)
+        idempotency_key = read_idempotency_key(request.form.get('idempotency_key'))
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('send_money'))
 
-        flash(f"Successfully sent ${amount:.2f} to {receiver['name']}!", "success")
+    try:
+        result = run_transfer(sender_id, receiver_id, amount_cents, idempotency_key)
+        flash(f"Successfully sent ${from_cents(amount_cents):.2f} to {result['receiver_name']}!", "success")
 
+    except (InsufficientFunds, VelocityLimitExceeded) as e:
+        flash(str(e), "danger")
+        return redirect(url_for('send_money'))
+    except InvalidTransferUser as e:
+        flash("Invalid sender or receiver ID.", "danger")
+        flash(f"Transaction failed: {e}", "danger")
+    except IdempotencyKeyReused as e:
+        flash(f"Transaction failed: {e}", "danger")
     except sqlite3.Error as e:
         flash(f"Transaction failed due to a database error. Funds safe. Error: {e}", "danger")
     except Exception as e:
@@ -371,7 +2825,7 @@ def verify():
     user_id = session['user']['id']
 
     try:
-        with DatabaseConnection(DB_PATH) as db:
+        with DatabaseConnection.for_user(user_id) as db:
             user_model = User(db)
             user_data = user_model.get_user_by_id(user_id)
 
@@ -384,18 +2838,540 @@ def verify():
                 flash("Your account is already fully Verified.", "info")
                 return render_template('verify.html', user=user_data)
 
-            if request.method == 'POST':
-                user_model.update_verification_status(user_id, 'Verified')
+        if request.method == 'POST':
+            writer_for(user_id).run(lambda db: User(db).update_verification_status(user_id, 'Verified'),
+                                    timeout=WRITE_TIMEOUT)
 
-                flash("Identity documents processed and **Verified** instantly! You now have full access.", "success")
-                return redirect(url_for('welcome'))
+            flash("Identity documents processed and **Verified** instantly! You now have full access.", "success")
+            return redirect(url_for('welcome'))
 
-            return render_template('verify.html', user=user_data)
+        return render_template('verify.html', user=user_data)
 
     except sqlite3.Error as e:
         flash(f"Database error during verification process: {e}", "danger")
         return redirect(url_for('welcome'))
 
 
+# --- JSON API (v1) ---
+# Session-authenticated like the HTML pages. Balance and history carry ETags derived
+# from users.version, which every balance or status change bumps, so a poll whose
+# If-None-Match still matches is answered with a 304 from the cached user row alone.
+
+def api_error(message, status):
+    return jsonify(error=message), status
+
+
+def is_user_id(value):
+    # JSON true/false are ints to Python, and ids below 1 are the ledger's system accounts.
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def api_current_user():
+    if 'user' not in session:
+        return None
+    return get_current_user_data(session['user']['id'])
+
+
+def balance_etag(user_data):
+    return f"{user_data['id']}-{user_data['version']}"
+
+
+def balance_payload(user_data):
+    return {'balance_cents': user_data['balance_cents'], 'verification_status': user_data['verification_status']}
+
+
+def balance_event(user_data):
+    return {'event': 'balance', 'id': user_data['version'], 'data': balance_payload(user_data)}
+
+
+def parse_history_args(args):
+    """Reads limit/cursor query arguments; raises ValueError for a cursor that does not decode."""
+    try:
+        page_size = int(args.get('limit', HISTORY_PAGE_SIZE))
+    except ValueError:
+        page_size = HISTORY_PAGE_SIZE
+    page_size = max(1, min(page_size, HISTORY_MAX_PAGE_SIZE))
+    cursor = args.get('cursor') or None
+    before = decode_history_cursor(cursor) if cursor else None
+    if cursor and before is None:
+        raise ValueError("Invalid cursor.")
+    return page_size, cursor, before
+
+
+def history_etag(user_data, cursor, page_size):
+    return f"{user_data['id']}-{user_data['version']}-{cursor or ''}-{page_size}"
+
+
+def load_history_page(db, user_id, page_size, before):
+    rows = Transaction(db).get_transactions_for_user(user_id, limit=page_size + 1, before=before)
+    next_cursor = encode_history_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    transactions = [{
+        'id': row.id,
+        'type': row.type,
+        'amount_cents': to_cents(row.amount),
+        'counterparty': row.receiver_name if row.type == 'Sent' else row.sender_name,
+        'timestamp': row.timestamp,
+    } for row in rows[:page_size]]
+    return {'transactions': transactions, 'next_cursor': next_cursor}
+
+
+def not_modified_or(etag, build_response):
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = build_response()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@app.route('/api/v1/balance')
+def api_balance():
+    user_data = api_current_user()
+    if not user_data:
+        return api_error("Not logged in.", 401)
+
+    return not_modified_or(balance_etag(user_data), lambda: jsonify(balance_payload(user_data)))
+
+
+@app.route('/api/v1/history')
+def api_history():
+    user_data = api_current_user()
+    if not user_data:
+        return api_error("Not logged in.", 401)
+
+    try:
+        page_size, cursor, before = parse_history_args(request.args)
+    except ValueError as e:
+        return api_error(str(e), 400)
+
+    def build_response():
+        with DatabaseConnection.for_user(user_data['id']) as db:
+            return jsonify(load_history_page(db, user_data['id'], page_size, before))
+
+    return not_modified_or(history_etag(user_data, cursor, page_size), build_response)
+
+
+@app.route('/api/v1/transfers', methods=['POST'])
+def api_create_transfer():
+    if 'user' not in session:
+        return api_error("Not logged in.", 401)
+
+    payload = request.get_json(silent=True) or {}
+    receiver_id = payload.get('receiver_id')
+    if not is_user_id(receiver_id) or 'amount' not in payload:
+        return api_error("receiver_id (positive integer) and amount are required.", 400)
+    try:
+        amount_cents = to_cents(payload['amount'])
+    except ValueError:
+        return api_error("Invalid amount.", 400)
+    if amount_cents <= 0:
+        return api_error("Amount must be positive.", 400)
+
+    try:
+        idempotency_key = read_idempotency_key(request.headers.get('Idempotency-Key'))
+    except ValueError as e:
+        return api_error(str(e), 400)
+
+    sender_id = session['user']['id']
+    try:
+        result = run_transfer(sender_id, receiver_id, amount_cents, idempotency_key)
+    except InsufficientFunds as e:
+        return api_error(str(e), 422)
+    except VelocityLimitExceeded as e:
+        if e.retry_after is None:
+            return api_error(str(e), 422)
+        return jsonify(error=str(e)), 429, {'Retry-After': str(math.ceil(e.retry_after))}
+    except InvalidTransferUser as e:
+        return api_error(str(e), 400)
+    except IdempotencyKeyReused as e:
+        return api_error(str(e), 422)
+    except sqlite3.Error as e:
+        return api_error(f"Transaction failed due to a database error. Funds safe. Error: {e}", 503)
+
+    return jsonify(result), 201
+
+
+@app.route('/api/v1/payouts', methods=['POST'])
+def api_create_payout():
+    if 'user' not in session:
+        return api_error("Not logged in.", 401)
+
+    report = parse_payout_rows(request)
+    if report is None:
+        return api_error("Expected a JSON array of {receiver_id, amount} or a text/csv body.", 400)
+    if not report:
+        return api_error("The payout has no rows.", 400)
+    if len(report) > PAYOUT_MAX_ROWS:
+        return api_error(f"A payout may have at most {PAYOUT_MAX_ROWS} rows.", 413)
+
+    sender_id = session['user']['id']
+    try:
+        report = run_payout(sender_id, report)
+    except InsufficientFunds as e:
+        return api_error(str(e), 422)
+    except VelocityLimitExceeded as e:
+        if e.retry_after is None:
+            return api_error(str(e), 422)
+        return jsonify(error=str(e)), 429, {'Retry-After': str(math.ceil(e.retry_after))}
+    except OverflowError:
+        return api_error("An amount in this payout is out of range.", 400)
+    except sqlite3.Error as e:
+        return api_error(f"Payout failed due to a database error. Funds safe. Error: {e}", 503)
+
+    paid = [entry for entry in report if entry['status'] == 'paid']
+    return jsonify(paid=len(paid), rejected=len(report) - len(paid),
+                   total_cents=sum(entry['amount_cents'] for entry in paid), rows=report)
+
+
+def schedule_payload(schedule):
+    return dict(schedule._asdict(), amount=from_cents(schedule.amount_cents))
+
+
+@app.route('/api/v1/scheduled-transfers', methods=['GET'])
+def api_list_scheduled_transfers():
+    if 'user' not in session:
+        return api_error("Not logged in.", 401)
+
+    sender_id = session['user']['id']
+    with DatabaseConnection.for_user(sender_id) as db:
+        schedules = ScheduledTransfer(db).for_sender(sender_id)
+    return jsonify(scheduled_transfers=[schedule_payload(schedule) for schedule in schedules])
+
+
+@app.route('/api/v1/scheduled-transfers', methods=['POST'])
+def api_create_scheduled_transfer():
+    if 'user' not in session:
+        return api_error("Not logged in.", 401)
+
+    payload = request.get_json(silent=True) or {}
+    receiver_id = payload.get('receiver_id')
+    if not is_user_id(receiver_id) or 'amount' not in payload:
+        return api_error("receiver_id (positive integer) and amount are required.", 400)
+    try:
+        amount_cents = to_cents(payload['amount'])
+    except ValueError:
+        return api_error("Invalid amount.", 400)
+    if amount_cents <= 0:
+        return api_error("Amount must be positive.", 400)
+    frequency = payload.get('frequency', 'once')
+    if frequency not in SCHEDULE_FREQUENCIES:
+        return api_error(f"frequency must be one of: {', '.join(SCHEDULE_FREQUENCIES)}.", 400)
+    now = utc_timestamp()
+    try:
+        next_run = parse_start(payload.get('start_at'), now)
+    except ValueError:
+        return api_error("start_at must be an ISO 8601 date or date and time (UTC unless an offset is given).", 400)
+    if next_run < now:
+        # The scheduler would pay it at once, so an old start date is refused, not back-dated.
+        return api_error("start_at is in the past; leave it out to start now.", 400)
+
+    sender_id = session['user']['id']
+    try:
+        schedule = create_schedule(sender_id, receiver_id, amount_cents, frequency, next_run)
+    except InvalidTransferUser as e:
+        return api_error(str(e), 400)
+    except ScheduleLimitReached as e:
+        return api_error(str(e), 422)
+    except sqlite3.Error as e:
+        return api_error(f"Could not save the scheduled transfer due to a database error. Error: {e}", 503)
+
+    return jsonify(schedule_payload(schedule)), 201
+
+
+@app.route('/api/v1/scheduled-transfers/<int:schedule_id>', methods=['DELETE'])
+def api_cancel_scheduled_transfer(schedule_id):
+    if 'user' not in session:
+        return api_error("Not logged in.", 401)
+
+    sender_id = session['user']['id']
+    try:
+        cancelled = writer_for(sender_id).run(lambda db: ScheduledTransfer(db).cancel(sender_id, schedule_id),
+                                              timeout=WRITE_TIMEOUT)
+    except sqlite3.Error as e:
+        return api_error(f"Could not cancel the scheduled transfer due to a database error. Error: {e}", 503)
+    if not cancelled:
+        return api_error("No active scheduled transfer with this id.", 404)
+    return '', 204
+
+
+# --- Event stream ---
+# /api/v1/events streams the user's 'balance' and 'payment' events as Server-Sent
+# Events, published after commit by notify_transfers, so clients can stop polling.
+# asgi.py serves it natively, where an open stream costs a small buffer and a timer,
+# and sets NATIVE_EVENT_STREAMS so the welcome page opens one. Under WSGI every open
+# stream holds a worker thread, so there it is cut short (NOTIFY_WSGI_STREAM_SECONDS).
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+SSE_HEARTBEAT = ': heartbeat\n\n'
+
+
+def format_sse(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class NotificationStream:
+    """
+    Turns one user's subscription into SSE text. A stream opens with the current
+    balance, so a reconnecting client starts in sync. Events dropped from a full
+    buffer are announced with a 'resync' event (refetch the history). An idle
+    stream sends heartbeat comments, and every NOTIFY_RESYNC_INTERVAL re-reads the
+    balance, normally from the user cache, to catch changes committed by other
+    processes, whose events never reach this one. With max_seconds, iterating
+    ends after that long with a `retry:` hint, and the client reconnects.
+    """
+    def __init__(self, user_id, subscription, max_seconds=None):
+        self.user_id = user_id
+        self.subscription = subscription
+        self.max_seconds = max_seconds
+        self.version = None
+        self.checked_at = 0.0
+
+    def opening(self):
+        return self.balance_message() or SSE_HEARTBEAT
+
+    def balance_message(self):
+        self.checked_at = time.monotonic()
+        user_data = get_current_user_data(self.user_id)
+        if user_data is None or user_data['version'] == self.version:
+            return ''
+        self.version = user_data['version']
+        return format_sse('balance', balance_payload(user_data), self.version)
+
+    def idle(self, events, missed):
+        """Whether a wake-up only needs a heartbeat, which touches no database."""
+        return not events and not missed and time.monotonic() - self.checked_at < NOTIFY_RESYNC_INTERVAL
+
+    def messages(self, events, missed):
+        """The text for one wake-up of the subscription: its events, or a heartbeat."""
+        if self.idle(events, missed):
+            return SSE_HEARTBEAT
+        if not events and not missed:
+            return self.balance_message() or SSE_HEARTBEAT
+        chunks = [format_sse('resync', {'missed': missed})] if missed else []
+        unnamed = {event['data']['sender_id'] for event in events
+                   if event['event'] == 'payment' and event['data']['sender_name'] is None}
+        names = user_names(unnamed) if unnamed else {}
+        for event in events:
+            if event['event'] == 'balance' and self.version is not None and event['id'] <= self.version:
+                continue
+            data = event['data']
+            if event['event'] == 'payment' and data['sender_name'] is None:
+                data = dict(data, sender_name=names.get(data['sender_id']))
+            chunks.append(format_sse(event['event'], data, event['id']))
+            self.version = max(self.version or 0, event['id'])
+        return ''.join(chunks) or SSE_HEARTBEAT
+
+    def __iter__(self):
+        ends_at = time.monotonic() + self.max_seconds if self.max_seconds is not None else None
+        try:
+            yield self.opening()
+            while not self.subscription.closed:
+                timeout = NOTIFY_HEARTBEAT
+                if ends_at is not None:
+                    remaining = ends_at - time.monotonic()
+                    if remaining <= 0:
+                        yield f'retry: {NOTIFY_WSGI_RETRY_MS}\n\n'
+                        break
+                    timeout = min(timeout, remaining)
+                yield self.messages(*self.subscription.wait_events(timeout))
+        finally:
+            self.close()
+
+    def close(self):
+        self.subscription.close()
+
+
+@app.route('/api/v1/events')
+def api_events():
+    user_data = api_current_user()
+    if not user_data:
+        return api_error("Not logged in.", 401)
+
+    try:
+        subscription = notifications.subscribe(user_data['id'])
+    except TooManySubscribers as e:
+        return jsonify(error=str(e)), 503, {'Retry-After': '5'}
+    # asgi.py serves this route natively; reaching it here means a WSGI worker thread.
+    return Response(NotificationStream(user_data['id'], subscription, max_seconds=NOTIFY_WSGI_STREAM_SECONDS),
+                    mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+# --- Metrics ---
+# Prometheus text exposition of the in-process counters. Every number here is kept
+# per process, so scrape each worker separately.
+
+def metrics_lines():
+    pools, writers = {}, []
+    for shard, path in enumerate(shards.paths):
+        suffix = f'-{shard}' if shard else ''
+        pools[f'read{suffix}'] = get_pool(path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, pragmas=DB_PRAGMAS)
+        if path in shard_writers:
+            pools[f'write{suffix}'], shard_writer = shard_writers[path]
+            writers.append(({'shard': str(shard)} if shards.count > 1 else {}, shard_writer))
+    pool_stats = {name: pool.stats.as_dict() for name, pool in pools.items()}
+    cache_stats = user_cache.stats.as_dict()
+    limiter_stats = limiter.stats.as_dict()
+
+    lines = request_latency.prometheus('quickpay_request_duration_seconds', "Request latency by route.")
+    lines += query_metrics.durations.prometheus('quickpay_sql_duration_seconds',
+                                                "SQL statement latency by statement label (verb, table, hash).")
+    lines += ['# HELP quickpay_password_hash_duration_seconds Password hash/verify latency.',
+              '# TYPE quickpay_password_hash_duration_seconds histogram']
+    for operation, histogram in sorted(hasher.latency.items()):
+        lines += histogram.prometheus('quickpay_password_hash_duration_seconds', f'operation="{operation}"')
+    lines += render_prometheus([
+        ('quickpay_sql_statement_info', 'gauge', "Normalized SQL text behind each statement label.",
+         [({'statement': label, 'text': text}, 1) for label, text in query_metrics.statement_texts()]),
+        ('quickpay_db_sessions_total', 'counter', "DatabaseConnection sessions opened.",
+         [({}, query_metrics.sessions)]),
+        ('quickpay_db_rows_fetched_total', 'counter', "Rows fetched by SELECT statements.",
+         [({}, query_metrics.rows_fetched)]),
+        ('quickpay_db_slow_queries_total', 'counter', "Statements slower than the slow query threshold.",
+         [({}, query_metrics.slow_queries)]),
+        ('quickpay_db_connections_opened_total', 'counter', "SQLite connections opened by each pool.",
+         [({'pool': name}, stats['created']) for name, stats in pool_stats.items()]),
+        ('quickpay_db_connections_discarded_total', 'counter', "Pooled connections closed as unhealthy.",
+         [({'pool': name}, stats['discarded']) for name, stats in pool_stats.items()]),
+        ('quickpay_db_pool_checkouts_total', 'counter', "Connection checkouts by pool.",
+         [({'pool': name}, stats['checkouts']) for name, stats in pool_stats.items()]),
+        ('quickpay_db_pool_waits_total', 'counter', "Checkouts that had to wait for a free connection.",
+         [({'pool': name}, stats['waits']) for name, stats in pool_stats.items()]),
+        ('quickpay_db_pool_wait_seconds_total', 'counter', "Time spent waiting for a free connection.",
+         [({'pool': name}, stats['wait_time']) for name, stats in pool_stats.items()]),
+        ('quickpay_db_pool_timeouts_total', 'counter', "Checkouts that timed out.",
+         [({'pool': name}, stats['timeouts']) for name, stats in pool_stats.items()]),
+        ('quickpay_user_cache_events_total', 'counter', "Current-user cache events.",
+         [({'event': event}, count) for event, count in cache_stats.items()]),
+        ('quickpay_user_cache_entries', 'gauge', "Entries in the current-user cache.",
+         [({}, len(user_cache))]),
+        ('quickpay_writer_batches_total', 'counter', "Group-commit batches written.",
+         [(labels, shard_writer.batches) for labels, shard_writer in writers]),
+        ('quickpay_writer_jobs_total', 'counter', "Write jobs committed.",
+         [(labels, shard_writer.jobs) for labels, shard_writer in writers]),
+        ('quickpay_writer_queue_depth', 'gauge', "Write jobs waiting for the writer thread.",
+         [(labels, shard_writer.pending()) for labels, shard_writer in writers]),
+        ('quickpay_limiter_decisions_total', 'counter', "Login and transfer limit checks by outcome.",
+         [({'decision': decision}, limiter_stats[decision]) for decision in ('allowed', 'limited')]),
+        ('quickpay_limiter_evictions_total', 'counter', "Limiter keys dropped at the max_keys cap.",
+         [({}, limiter_stats['evictions'])]),
+        ('quickpay_event_streams', 'gauge', "Open /api/v1/events streams.", [({}, len(notifications))]),
+        ('quickpay_events_published_total', 'counter', "Events published to at least one stream.",
+         [({}, notifications.published)]),
+        ('quickpay_events_dropped_total', 'counter', "Events dropped from full stream buffers.",
+         [({}, notifications.dropped)]),
+    ])
+    return lines
+
+
+@app.route('/metrics')
+def metrics():
+    return Response('\n'.join(metrics_lines()) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema (safe to run on a live database)."""
+    try:
+        ready = bootstrap(force=True)
+    except sqlite3.Error:
+        raise SystemExit(1)
+    if not ready:
+        raise SystemExit(1)
+    print(f"Database schema is at version {SCHEMA_VERSION}.")
+
+
+@app.cli.command('snapshot-balances')
+def snapshot_balances_command():
+    """Checkpoint the balance of every account that moved since the last run."""
+    count = sum(writer_for_shard(shard).run(lambda db: Ledger(db).snapshot_balances(), timeout=WRITE_TIMEOUT)
+                for shard in range(shards.count))
+    print(f"Recorded {count} balance snapshots.")
+
+
+@app.cli.command('archive-transactions')
+@click.option('--older-than-days', type=int, default=ARCHIVE_AFTER.days, show_default=True)
+@click.option('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_transactions_command(older_than_days, batch_size):
+    """Move old transactions out of the hot table into monthly archive files."""
+    moved = archive_transactions(timedelta(days=older_than_days), batch_size)
+    print(f"Archived {moved} transactions into {ARCHIVE_DIR}/.")
+
+
+@app.cli.command('rebuild-activity')
+@click.option('--workers', type=int, default=ACTIVITY_REBUILD_WORKERS, show_default=True)
+@click.option('--chunk-size', type=int, default=ACTIVITY_REBUILD_CHUNK, show_default=True)
+def rebuild_activity_command(workers, chunk_size):
+    """Recompute every user's activity summary in parallel chunks."""
+    started = time.perf_counter()
+    count = rebuild_activity(workers, chunk_size)
+    print(f"Rebuilt {count} activity summaries in {time.perf_counter() - started:.1f}s.")
+
+
+@app.cli.command('reconcile-balances')
+@click.option('--report', 'report_path', default=RECONCILE_REPORT, show_default=True)
+@click.option('--checkpoint', 'checkpoint_path', default=RECONCILE_CHECKPOINT, show_default=True)
+@click.option('--resume', is_flag=True, help='Continue an interrupted run from its checkpoint.')
+@click.option('--workers', type=int, default=RECONCILE_WORKERS, show_default=True)
+@click.option('--chunk-size', type=int, default=RECONCILE_CHUNK, show_default=True)
+@click.option('--duty-cycle', type=float, default=RECONCILE_DUTY_CYCLE, show_default=True)
+def reconcile_balances_command(report_path, checkpoint_path, resume, workers, chunk_size, duty_cycle):
+    """Check every balance against its transactions and ledger entries."""
+    started = time.perf_counter()
+    checked, mismatches = reconcile_balances(report_path, checkpoint_path, resume, workers, chunk_size, duty_cycle)
+    print(f"Checked {checked} balances in {time.perf_counter() - started:.1f}s: "
+          f"{mismatches} mismatches written to {report_path}.")
+    if mismatches:
+        raise SystemExit(1)
+
+
+@app.cli.command('move-user')
+@click.argument('user_id', type=int)
+@click.argument('shard', type=int)
+@click.option('--batch-size', type=int, default=SHARD_MOVE_BATCH, show_default=True)
+def move_user_command(user_id, shard, batch_size):
+    """Move one user and their history to another shard."""
+    if not 0 <= shard < shards.count:
+        print(f"Shard must be between 0 and {shards.count - 1}.")
+        raise SystemExit(1)
+    try:
+        copied = move_user(user_id, shard, batch_size)
+    except InvalidTransferUser as e:
+        print(e)
+        raise SystemExit(1)
+    print(f"User {user_id} is on shard {shard} ({copied} transactions copied).")
+
+
+@app.cli.command('rebalance-shards')
+@click.option('--dry-run', is_flag=True, help='Only print the moves that would be made.')
+@click.option('--batch-size', type=int, default=SHARD_MOVE_BATCH, show_default=True)
+def rebalance_shards_command(dry_run, batch_size):
+    """Even out the number of users on each shard."""
+    moves = rebalance_shards(dry_run, batch_size)
+    for user_id, source_shard, target_shard in moves:
+        print(f"User {user_id}: shard {source_shard} -> {target_shard}")
+    print(f"{'Planned' if dry_run else 'Made'} {len(moves)} moves across {shards.count} shards.")
+
+
+@app.cli.command('recover-transfers')
+def recover_transfers_command():
+    """Finish cross-shard transfers and user moves left incomplete."""
+    transfers, moves = recover_shard_transfers(older_than=timedelta(0))
+    print(f"Finished {transfers} cross-shard transfers and {moves} user moves.")
+
+
+@app.cli.command('run-scheduled-transfers')
+@click.option('--batch-size', type=int, default=SCHEDULE_BATCH_SIZE, show_default=True)
+def run_scheduled_transfers_command(batch_size):
+    """Pay the scheduled transfers that are due now."""
+    started = time.perf_counter()
+    handled = run_scheduled_transfers(batch_size)
+    print(f"Handled {handled} scheduled transfers in {time.perf_counter() - started:.2f}s.")
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
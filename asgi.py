@@ -0,0 +1,182 @@
+"""
+ASGI entry point for QuickPay: `uvicorn asgi:application`.
+
+The polling endpoints (/api/v1/balance and /api/v1/history) and the event stream
+(/api/v1/events) are served by native async handlers. An idle or not-modified poll,
+or an open stream, costs a coroutine, not a worker thread, and any SQLite work runs
+on AsyncDatabase's dedicated executor. Every other route is the regular Flask app,
+adapted with asgiref's WsgiToAsgi.
+"""
+import asyncio
+import json
+import sqlite3
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import parse_etags, quote_etag
+
+import app as quickpay
+from utils.aiodb import AsyncDatabase
+
+flask_app = quickpay.app
+flask_app.config['NATIVE_EVENT_STREAMS'] = True
+wsgi_application = WsgiToAsgi(flask_app)
+adb = AsyncDatabase(quickpay.DatabaseConnection.for_user,
+                    max_workers=quickpay.ASYNC_DB_WORKERS, writer=quickpay.writer)
+
+
+def header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def session_user_id(scope):
+    """Reads the logged-in user id from Flask's signed session cookie without a request context."""
+    cookie = SimpleCookie(header(scope, b'cookie') or '')
+    morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        data = serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return None
+    user = data.get('user')
+    return user['id'] if user else None
+
+
+async def respond(send, status, payload=None, headers=()):
+    body = json.dumps(payload, separators=(',', ':')).encode() if payload is not None else b''
+    response_headers = [(b'content-length', str(len(body)).encode())]
+    if payload is not None:
+        response_headers.append((b'content-type', b'application/json'))
+    response_headers += [(name.encode(), value.encode()) for name, value in headers]
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def respond_not_modified_or(scope, send, etag, build_payload):
+    headers = [('etag', quote_etag(etag)), ('cache-control', 'private, no-cache')]
+    if parse_etags(header(scope, b'if-none-match')).contains(etag):
+        await respond(send, 304, headers=headers)
+    else:
+        await respond(send, 200, await build_payload(), headers=headers)
+
+
+async def current_user(scope):
+    user_id = session_user_id(scope)
+    if user_id is None:
+        return None
+    return await quickpay.user_cache.get_or_load_async(user_id, lambda: adb.call(quickpay.load_user_data, user_id))
+
+
+async def balance(scope, receive, send):
+    user_data = await current_user(scope)
+    if not user_data:
+        return await respond(send, 401, {'error': "Not logged in."})
+
+    async def build_payload():
+        return quickpay.balance_payload(user_data)
+
+    await respond_not_modified_or(scope, send, quickpay.balance_etag(user_data), build_payload)
+
+
+async def history(scope, receive, send):
+    user_data = await current_user(scope)
+    if not user_data:
+        return await respond(send, 401, {'error': "Not logged in."})
+
+    args = dict(parse_qsl(scope.get('query_string', b'').decode()))
+    try:
+        page_size, cursor, before = quickpay.parse_history_args(args)
+    except ValueError as e:
+        return await respond(send, 400, {'error': str(e)})
+
+    async def build_payload():
+        return await adb.run(lambda db: quickpay.load_history_page(db, user_data['id'], page_size, before),
+                             user_data['id'])
+
+    await respond_not_modified_or(scope, send, quickpay.history_etag(user_data, cursor, page_size), build_payload)
+
+
+async def close_on_disconnect(receive, subscription):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    subscription.close()
+
+
+async def events(scope, receive, send):
+    user_data = await current_user(scope)
+    if not user_data:
+        return await respond(send, 401, {'error': "Not logged in."})
+
+    try:
+        subscription = quickpay.notifications.subscribe(user_data['id'])
+    except quickpay.TooManySubscribers as e:
+        return await respond(send, 503, {'error': str(e)}, headers=[('retry-after', '5')])
+    stream = quickpay.NotificationStream(user_data['id'], subscription)
+    watcher = asyncio.ensure_future(close_on_disconnect(receive, subscription))
+    headers = [(b'content-type', b'text/event-stream')]
+    headers += [(name.lower().encode(), value.encode()) for name, value in quickpay.SSE_HEADERS.items()]
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        chunk = await adb.call(stream.opening)
+        while not subscription.closed:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            batch = await subscription.next_events(quickpay.NOTIFY_HEARTBEAT)
+            chunk = quickpay.SSE_HEARTBEAT if stream.idle(*batch) else await adb.call(stream.messages, *batch)
+    except OSError:
+        pass  # The client went away.
+    except sqlite3.Error:
+        # End the stream; EventSource reconnects on its own.
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        stream.close()
+
+
+ASYNC_ROUTES = {
+    ('GET', '/api/v1/balance'): balance,
+    ('GET', '/api/v1/history'): history,
+    ('GET', '/api/v1/events'): events,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await adb.call(quickpay.bootstrap)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': f"Database schema upgrade failed: {e}"})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            adb.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is None:
+        return await wsgi_application(scope, receive, send)
+    # Timed like Flask's teardown hook: these paths are also the Flask rules, and an
+    # event stream's time includes all of its streaming.
+    with quickpay.request_latency.labels(scope['method'], scope['path']).time():
+        try:
+            # Servers without lifespan support skip the startup bootstrap; the first request runs it.
+            if quickpay.schema_error is not None:
+                return await respond(send, 503, {'error': "The database schema could not be upgraded."})
+            if not quickpay.schema_ready:
+                await adb.call(quickpay.bootstrap)
+            await handler(scope, receive, send)
+        except sqlite3.Error as e:
+            await respond(send, 503, {'error': f"Database error. {e}"})
@@ -0,0 +1,14 @@
+"""
+Reproducible QuickPay benchmarks.
+
+    python -m benchmarks --users 2000 --transactions 200000 --concurrency 8 \
+        --output results.json --baseline baseline.json
+
+Each run seeds a fresh database in a scratch directory, then measures the routes
+through the Flask test client and through a local threaded HTTP server, plus
+microbenchmarks of the hot data-layer calls, plus a burst of scheduled
+transfers falling due at once. Worker startup (import, schema
+bootstrap and first request, in fresh processes) is checked against the budget
+in benchmarks/startup.py. Results are written as JSON and, given a baseline from
+an earlier run, compared metric by metric.
+"""
@@ -0,0 +1,136 @@
+import argparse
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.harness import PACKAGE_ROOT, load_app
+from benchmarks.load import run_http, run_test_client
+from benchmarks.micro import run_microbenchmarks
+from benchmarks.scheduler import run_scheduler_benchmark
+from benchmarks.report import compare, format_comparison, load_results, write_results
+from benchmarks.seed import seed_database
+from benchmarks.startup import STARTUP_BUDGET_MS, measure_startup, over_budget
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--exponent', type=float, default=1.2, help="Power-law exponent of the sender distribution.")
+    parser.add_argument('--days', type=int, default=365, help="Days of history to spread transactions over.")
+    parser.add_argument('--requests', type=int, default=2000, help="Measured requests per driver.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent logged-in users per driver.")
+    parser.add_argument('--drivers', default='client,http', help="Comma-separated: client, http.")
+    parser.add_argument('--micro', type=int, default=200, help="Calls per microbenchmark (0 to skip).")
+    parser.add_argument('--schedules', type=int, default=10000, help="Scheduled transfers due at once for the "
+                                                                      "scheduler run (0 to skip).")
+    parser.add_argument('--startup-runs', type=int, default=5, help="Fresh processes per startup measurement "
+                                                                   "(0 to skip).")
+    parser.add_argument('--workdir', help="Scratch directory for the seeded database (default: a temp dir).")
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch directory afterwards.")
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', help="Earlier results file to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change that counts as a regression.")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--fail-over-budget', action='store_true', help="Exit non-zero when startup is over budget.")
+    return parser.parse_args(argv)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PACKAGE_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='quickpay-bench-')
+
+    try:
+        quickpay, _ = load_app(workdir)
+        started = time.perf_counter()
+        dataset = seed_database(quickpay.DB_PATH, users=args.users, transactions=args.transactions, seed=args.seed,
+                                exponent=args.exponent, days=args.days,
+                                password_method=quickpay.PASSWORD_HASH_METHOD)
+        dataset['seed_seconds'] = time.perf_counter() - started
+        quickpay.user_cache.clear()
+        print(f"Seeded {dataset['users']} users and {dataset['transactions']} transactions "
+              f"in {dataset['seed_seconds']:.1f}s ({workdir})")
+
+        # The heaviest sender has the longest history; the rest are spread across the id range.
+        heavy_user_id = dataset['heaviest_sender_id']
+        step = max(1, args.users // args.concurrency)
+        user_ids = [heavy_user_id] + [user_id for user_id in range(1, args.users + 1, step)
+                                      if user_id != heavy_user_id][:args.concurrency - 1]
+
+        results = {'load': {}}
+        over = []
+        if args.startup_runs:
+            results['startup'] = measure_startup(args.startup_runs)
+            over = over_budget(results['startup'])
+            print('startup: ' + ', '.join(f"{metric} {value:.1f} (budget {STARTUP_BUDGET_MS[metric]})"
+                                          for metric, value in results['startup'].items()))
+            for metric, value, limit in over:
+                print(f"startup {metric} is over budget: {value:.1f} ms > {limit} ms")
+        drivers = {'client': run_test_client, 'http': run_http}
+        for name in filter(None, (driver.strip() for driver in args.drivers.split(','))):
+            run = drivers[name]
+            results['load'][name] = run(quickpay.app, user_ids, args.users, args.requests, seed=args.seed)
+            overall = results['load'][name]['overall']
+            print(f"{name}: {overall['throughput_rps']:.0f} req/s, p50 {overall['p50_ms']:.2f} ms, "
+                  f"p95 {overall['p95_ms']:.2f} ms, p99 {overall['p99_ms']:.2f} ms")
+        if args.micro:
+            results['micro'] = run_microbenchmarks(quickpay, heavy_user_id, args.users, args.micro, args.seed)
+            for name, summary in results['micro'].items():
+                print(f"{name}: p50 {summary['p50_ms']:.3f} ms, p95 {summary['p95_ms']:.3f} ms")
+        if args.schedules:
+            results['scheduler'] = run_scheduler_benchmark(quickpay, args.users, args.schedules)
+            print(f"scheduler: {results['scheduler']['schedules']} due schedules in "
+                  f"{results['scheduler']['run_ms']:.0f} ms")
+
+        document = {
+            'meta': {
+                'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'args': {key: value for key, value in vars(args).items()
+                         if key not in ('output', 'baseline', 'workdir', 'keep')},
+            },
+            'dataset': dataset,
+            'results': results,
+        }
+        write_results(output, document)
+        print(f"Results written to {output}")
+
+        if baseline:
+            rows = compare(document, load_results(baseline), args.threshold)
+            print(format_comparison(rows))
+            if args.fail_on_regression and any(regressed for *_, regressed in rows):
+                return 1
+        if args.fail_over_budget and over:
+            return 1
+        return 0
+    finally:
+        quickpay = sys.modules.get('app')
+        if quickpay is not None:
+            quickpay.writer.stop(timeout=5)
+            quickpay.hasher.shutdown()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import importlib
+import os
+import sys
+import time
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(workdir):
+    """
+    Imports the QuickPay app and bootstraps its schema in `workdir`.
+    DB_PATH is relative, so the process switches into the scratch directory
+    first. Returns (module, import seconds).
+    """
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    if PACKAGE_ROOT not in sys.path:
+        sys.path.insert(0, PACKAGE_ROOT)
+    if 'app' in sys.modules:
+        raise RuntimeError("The app module is already imported; run each benchmark in a fresh process.")
+    started = time.perf_counter()
+    module = importlib.import_module('app')
+    import_seconds = time.perf_counter() - started
+    lift_limits(module)
+    module.create_app()
+    return module, import_seconds
+
+
+def lift_limits(module):
+    """
+    Raises the login and transfer limits out of the way: every simulated user logs
+    in from 127.0.0.1 and sends far more often than a person would. The checks
+    themselves still run, so their cost stays in the measurements.
+    """
+    module.LOGIN_IP_BUCKET = module.LOGIN_ACCOUNT_BUCKET = (1e12, 1e12)
+    module.TRANSFER_MAX_COUNT = module.TRANSFER_PAIR_MAX_COUNT = 10 ** 12
+    module.TRANSFER_MAX_CENTS = module.TRANSFER_PAIR_MAX_CENTS = 10 ** 15
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Nearest-rank percentiles of a list of samples, in the samples' own unit."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {f'p{point}': 0.0 for point in points}
+    return {f'p{point}': ordered[min(len(ordered) - 1, max(0, round(point / 100 * len(ordered)) - 1))]
+            for point in points}
+
+
+def summarize(latencies, errors=0, elapsed=None):
+    """Summarizes latencies (seconds) as milliseconds, plus throughput when elapsed is given."""
+    summary = {'count': len(latencies), 'errors': errors}
+    if latencies:
+        summary['mean_ms'] = sum(latencies) / len(latencies) * 1000
+        summary['min_ms'] = min(latencies) * 1000
+        summary.update({f'{name}_ms': value * 1000 for name, value in percentiles(latencies).items()})
+    if elapsed:
+        summary['throughput_rps'] = len(latencies) / elapsed
+    return summary
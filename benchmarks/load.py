@@ -0,0 +1,171 @@
+import http.client
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks.harness import summarize
+from benchmarks.seed import BENCH_PASSWORD
+
+# Relative weight of each route in the generated traffic: mostly page views and
+# API polls, with a steady trickle of transfers.
+ROUTE_MIX = (
+    ('GET /welcome', 3),
+    ('GET /send', 1),
+    ('GET /history', 3),
+    ('GET /api/v1/balance', 4),
+    ('GET /api/v1/history', 2),
+    ('POST /transfer', 2),
+)
+
+
+def build_request(route, user_id, user_count, rng):
+    """Returns (method, path, form) for one request of the given route label."""
+    method, path = route.split(' ', 1)
+    if path != '/transfer':
+        return method, path, None
+    receiver_id = rng.randint(1, user_count - 1)
+    if receiver_id >= user_id:
+        receiver_id += 1
+    return method, path, {
+        'receiver_id': str(receiver_id),
+        'amount': f"{rng.randint(1, 500) / 100:.2f}",
+        'idempotency_key': uuid.uuid4().hex,
+    }
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+class TestClientSession:
+    """One logged-in user driving the app in-process through Flask's test client."""
+
+    def __init__(self, app, user_id):
+        self.client = app.test_client()
+        response = self.client.post('/login', data={'email': f'user{user_id}@bench.quickpay',
+                                                    'password': BENCH_PASSWORD})
+        if response.status_code != 302 or self.client.get_cookie('session') is None:
+            raise RuntimeError(f"Benchmark login failed for user {user_id}")
+
+    def request(self, method, path, form):
+        response = self.client.open(path, method=method, data=form)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPSession:
+    """One logged-in user driving a local HTTP server over a keep-alive connection."""
+
+    def __init__(self, host, port, user_id):
+        self.host = host
+        self.port = port
+        self.cookie = None
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        status = self.request('POST', '/login', {'email': f'user{user_id}@bench.quickpay',
+                                                 'password': BENCH_PASSWORD})
+        if status != 302 or self.cookie is None:
+            raise RuntimeError(f"Benchmark login failed for user {user_id}")
+
+    def request(self, method, path, form):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server dropped the keep-alive connection; reconnect and retry once.
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie and set_cookie.startswith('session='):
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status
+
+    def close(self):
+        self.connection.close()
+
+
+def run_workers(make_session, user_ids, user_count, requests, warmup, seed):
+    """
+    Runs `requests` requests spread over one thread per user id and returns
+    per-route summaries plus the overall throughput.
+    """
+    routes = [route for route, _ in ROUTE_MIX]
+    weights = [weight for _, weight in ROUTE_MIX]
+    per_worker = max(1, requests // len(user_ids))
+    # Logins and warm-up happen before the barrier, so the clock only covers measured requests.
+    clock = {}
+    start_barrier = threading.Barrier(len(user_ids), action=lambda: clock.setdefault('started', time.perf_counter()))
+
+    def worker(index, user_id):
+        rng = random.Random(seed + index)
+        session = make_session(user_id)
+        samples = []
+        try:
+            for route in rng.choices(routes, weights, k=warmup):
+                session.request(*build_request(route, user_id, user_count, rng))
+            start_barrier.wait()
+            for route in rng.choices(routes, weights, k=per_worker):
+                request = build_request(route, user_id, user_count, rng)
+                started = time.perf_counter()
+                status = session.request(*request)
+                samples.append((route, time.perf_counter() - started, status))
+        finally:
+            session.close()
+        return samples
+
+    with ThreadPoolExecutor(max_workers=len(user_ids)) as executor:
+        results = list(executor.map(worker, range(len(user_ids)), user_ids))
+    elapsed = time.perf_counter() - clock['started']
+
+    by_route = {}
+    for samples in results:
+        for route, latency, status in samples:
+            latencies, errors = by_route.setdefault(route, ([], [0]))
+            latencies.append(latency)
+            if status >= 500:
+                errors[0] += 1
+    all_latencies = [latency for samples in results for _, latency, _ in samples]
+    return {
+        'requests': len(all_latencies),
+        'concurrency': len(user_ids),
+        'elapsed_s': elapsed,
+        'overall': summarize(all_latencies, sum(errors[0] for _, errors in by_route.values()), elapsed),
+        'routes': {route: summarize(latencies, errors[0], elapsed)
+                   for route, (latencies, errors) in sorted(by_route.items())},
+    }
+
+
+def run_test_client(app, user_ids, user_count, requests, warmup=5, seed=0):
+    """Drives the app in-process; measures the Flask and data layers without socket overhead."""
+    return run_workers(lambda user_id: TestClientSession(app, user_id), user_ids, user_count,
+                       requests, warmup, seed)
+
+
+def run_http(app, user_ids, user_count, requests, warmup=5, seed=0):
+    """Drives the app through a threaded local HTTP server, one keep-alive connection per user."""
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='bench-http', daemon=True)
+    thread.start()
+    try:
+        return run_workers(lambda user_id: HTTPSession('127.0.0.1', server.port, user_id), user_ids,
+                           user_count, requests, warmup, seed)
+    finally:
+        server.shutdown()
+        thread.join()
@@ -0,0 +1,51 @@
+import random
+import time
+
+from benchmarks.harness import summarize
+
+
+def measure(fn, number):
+    """Calls fn() `number` times and summarizes the per-call latencies."""
+    latencies = []
+    for _ in range(number):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def run_microbenchmarks(quickpay, heavy_user_id, user_count, number=200, seed=0):
+    """
+    Times the data-layer calls behind the hot routes, each in its own session as
+    the routes use them: the full and first-page history of the heaviest sender,
+    the recipient list and a complete transfer through the writer queue.
+    """
+    rng = random.Random(seed)
+    DatabaseConnection, DB_PATH = quickpay.DatabaseConnection, quickpay.DB_PATH
+
+    def full_history():
+        with DatabaseConnection(DB_PATH) as db:
+            quickpay.Transaction(db).get_transactions_for_user(heavy_user_id)
+
+    def first_history_page():
+        with DatabaseConnection(DB_PATH) as db:
+            quickpay.Transaction(db).get_transactions_for_user(heavy_user_id, limit=quickpay.HISTORY_PAGE_SIZE)
+
+    def recipients():
+        with DatabaseConnection(DB_PATH) as db:
+            quickpay.User(db).get_all_users_except_self(heavy_user_id)
+
+    def transfer():
+        sender_id = rng.randint(1, user_count)
+        receiver_id = sender_id % user_count + 1
+        try:
+            quickpay.run_transfer(sender_id, receiver_id, 1)
+        except quickpay.InsufficientFunds:
+            pass
+
+    return {
+        'get_transactions_for_user.full': measure(full_history, max(1, number // 10)),
+        'get_transactions_for_user.page': measure(first_history_page, number),
+        'get_all_users_except_self': measure(recipients, max(1, number // 10)),
+        'transfer': measure(transfer, number),
+    }
@@ -0,0 +1,53 @@
+import json
+
+
+def flatten(results, prefix=''):
+    """Flattens nested results into {'load.http.routes.GET /history.p95_ms': value, ...}."""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def is_compared(metric):
+    return metric.endswith(('_ms', '_rps')) and not metric.endswith('min_ms')
+
+
+def compare(results, baseline, threshold=0.10):
+    """
+    Compares latency (`*_ms`, lower is better) and throughput (`*_rps`, higher is
+    better) metrics against a baseline. Returns rows of
+    (metric, baseline, current, relative change, regressed).
+    """
+    current, previous = flatten(results.get('results', {})), flatten(baseline.get('results', {}))
+    rows = []
+    for metric in sorted(current):
+        if not is_compared(metric) or metric not in previous or not previous[metric]:
+            continue
+        change = (current[metric] - previous[metric]) / previous[metric]
+        worse = -change if metric.endswith('_rps') else change
+        rows.append((metric, previous[metric], current[metric], change, worse > threshold))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'metric':<70} {'baseline':>12} {'current':>12} {'change':>9}"]
+    for metric, previous, current, change, regressed in rows:
+        flag = '  REGRESSED' if regressed else ''
+        lines.append(f"{metric:<70} {previous:>12.3f} {current:>12.3f} {change:>+8.1%}{flag}")
+    return '\n'.join(lines)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
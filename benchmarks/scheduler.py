@@ -0,0 +1,27 @@
+import time
+
+
+def run_scheduler_benchmark(quickpay, user_count, due=10000):
+    """
+    Times the scheduler paying `due` daily schedules that fall due at once, as at
+    midnight: each seeded user pays its neighbour a cent.
+    """
+    # The background scheduler would race the measured run for the same rows.
+    quickpay.scheduler.stop()
+    now = quickpay.utc_timestamp()
+
+    def seed(db):
+        schedule_ids = quickpay.allocate_ids(db, 'scheduled_transfers', due)
+        db.execute_many("""
+            INSERT INTO scheduled_transfers (id, sender_id, receiver_id, amount_cents, frequency, day_of_month, next_run)
+            VALUES (?, ?, ?, 1, 'daily', ?, ?);
+        """, [(schedule_id, index % user_count + 1, (index + 1) % user_count + 1, int(now[8:10]), now)
+              for index, schedule_id in enumerate(schedule_ids)])
+    quickpay.writer.run(seed, timeout=quickpay.WRITE_TIMEOUT)
+
+    started = time.perf_counter()
+    handled = quickpay.run_scheduled_transfers()
+    elapsed = time.perf_counter() - started
+    if handled != due:
+        raise RuntimeError(f"The scheduler handled {handled} of {due} due schedules")
+    return {'schedules': due, 'run_ms': elapsed * 1000, 'throughput_rps': due / elapsed}
@@ -0,0 +1,126 @@
+import bisect
+import itertools
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+BENCH_PASSWORD = 'benchmark'
+SIGNUP_CREDIT_CENTS = 100000
+SYSTEM_ACCOUNT_ID = 0
+# Seeded history ends here, so two runs with the same seed produce identical databases.
+SEED_EPOCH = datetime(2025, 1, 1)
+
+
+def sender_weights(count, exponent):
+    """Zipf weights: the sender of rank r is picked in proportion to 1 / r**exponent."""
+    return list(itertools.accumulate(1.0 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def generate_transfers(user_ids, count, rng, exponent=1.2, max_amount_cents=5000):
+    """
+    Yields (sender_id, receiver_id, amount_cents) for `count` transfers.
+    Senders follow a power law over a shuffled ranking of the users and receivers
+    are uniform. Balances are tracked so that, like the real transfer path, no
+    transfer overdraws its sender; a sender with nothing left hands the turn to a
+    uniformly chosen user instead.
+    """
+    ranked = list(user_ids)
+    rng.shuffle(ranked)
+    cumulative = sender_weights(len(ranked), exponent)
+    total = cumulative[-1]
+    balances = dict.fromkeys(ranked, SIGNUP_CREDIT_CENTS)
+
+    produced = 0
+    while produced < count:
+        sender_id = ranked[bisect.bisect_left(cumulative, rng.random() * total)]
+        if balances[sender_id] <= 0:
+            sender_id = rng.choice(ranked)
+            if balances[sender_id] <= 0:
+                continue
+        receiver_id = rng.choice(ranked)
+        if receiver_id == sender_id:
+            continue
+        amount_cents = min(rng.randint(1, max_amount_cents), balances[sender_id])
+        balances[sender_id] -= amount_cents
+        balances[receiver_id] += amount_cents
+        produced += 1
+        yield sender_id, receiver_id, amount_cents
+
+
+def seed_database(db_path, users=1000, transactions=50000, seed=42, exponent=1.2, days=365,
+                  password_method='scrypt:32768:8:1', batch_size=10000):
+    """
+    Fills an initialised, empty QuickPay database with `users` accounts and
+    `transactions` completed transfers spread evenly over the `days` before
+    SEED_EPOCH. Balances, transactions and ledger entries are kept consistent:
+    every balance equals the signup credit plus the user's net transfers.
+    All users share BENCH_PASSWORD, hashed once.
+    """
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(BENCH_PASSWORD, method=password_method)
+    signed_up_at = (SEED_EPOCH - timedelta(days=days + 1)).strftime('%Y-%m-%d %H:%M:%S')
+
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+            raise ValueError(f"{db_path} already has users; benchmarks need an empty database.")
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO users (id, name, email, password, balance, balance_cents, verification_status, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((user_id, f"User {user_id}", f"user{user_id}@bench.quickpay", password_hash,
+              SIGNUP_CREDIT_CENTS / 100, SIGNUP_CREDIT_CENTS, 'Verified' if user_id % 3 else 'Unverified',
+              signed_up_at)
+             for user_id in range(1, users + 1)))
+        connection.executemany(
+            "INSERT INTO ledger_entries (user_id, amount_cents, entry_type, created_at) VALUES (?, ?, 'signup_credit', ?)",
+            itertools.chain.from_iterable(
+                ((SYSTEM_ACCOUNT_ID, -SIGNUP_CREDIT_CENTS, signed_up_at), (user_id, SIGNUP_CREDIT_CENTS, signed_up_at))
+                for user_id in range(1, users + 1)))
+
+        start = SEED_EPOCH - timedelta(days=days)
+        step = timedelta(days=days) / max(transactions, 1)
+        balances = dict.fromkeys(range(1, users + 1), SIGNUP_CREDIT_CENTS)
+        sent = dict.fromkeys(range(1, users + 1), 0)
+        transfers = generate_transfers(range(1, users + 1), transactions, rng, exponent)
+        transaction_id = 0
+        while True:
+            batch = list(itertools.islice(transfers, batch_size))
+            if not batch:
+                break
+            rows, entries = [], []
+            for sender_id, receiver_id, amount_cents in batch:
+                transaction_id += 1
+                timestamp = (start + step * transaction_id).strftime('%Y-%m-%d %H:%M:%S')
+                rows.append((transaction_id, sender_id, receiver_id, amount_cents / 100, amount_cents, timestamp))
+                entries.append((transaction_id, sender_id, -amount_cents, timestamp))
+                entries.append((transaction_id, receiver_id, amount_cents, timestamp))
+                balances[sender_id] -= amount_cents
+                balances[receiver_id] += amount_cents
+                sent[sender_id] += 1
+            connection.executemany(
+                "INSERT INTO transactions (id, sender_id, receiver_id, amount, amount_cents, timestamp, status)"
+                " VALUES (?, ?, ?, ?, ?, ?, 'Completed')", rows)
+            connection.executemany(
+                "INSERT INTO ledger_entries (transaction_id, user_id, amount_cents, entry_type, created_at)"
+                " VALUES (?, ?, ?, 'transfer', ?)", entries)
+
+        connection.executemany(
+            "UPDATE users SET balance_cents = ?, balance = ? WHERE id = ?",
+            ((cents, cents / 100, user_id) for user_id, cents in balances.items()))
+        connection.execute("COMMIT")
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+
+    heaviest_sender_id = max(sent, key=sent.get)
+    return {
+        'users': users,
+        'transactions': transaction_id,
+        'seed': seed,
+        'exponent': exponent,
+        'heaviest_sender_id': heaviest_sender_id,
+        'heaviest_sender_transactions': sent[heaviest_sender_id],
+    }
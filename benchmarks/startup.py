@@ -0,0 +1,76 @@
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.harness import PACKAGE_ROOT
+
+# Upper bounds (ms) for a worker process coming up; `python -m benchmarks` reports
+# any metric over its budget and, with --fail-over-budget, exits non-zero.
+STARTUP_BUDGET_MS = {
+    'import_ms': 500,
+    'cold_bootstrap_ms': 100,
+    'warm_bootstrap_ms': 5,
+    'first_request_ms': 100,
+}
+
+# Runs in a fresh interpreter, as a prefork worker would: import the module, bootstrap
+# through create_app() and serve one request (the login page, which compiles a template).
+PROBE = """
+import json, os, sys, time
+os.chdir(sys.argv[1])
+sys.path.insert(0, sys.argv[2])
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+bootstrapped = time.perf_counter()
+response = app.app.test_client().get('/')
+response.close()
+answered = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'bootstrap_ms': (bootstrapped - imported) * 1000,
+    'first_request_ms': (answered - bootstrapped) * 1000,
+    'status': response.status_code,
+}))
+"""
+
+
+def probe(workdir):
+    output = subprocess.run([sys.executable, '-c', PROBE, workdir, PACKAGE_ROOT], capture_output=True,
+                            text=True, check=True).stdout
+    sample = json.loads(output.strip().splitlines()[-1])
+    if sample['status'] != 200:
+        raise RuntimeError(f"Startup probe got HTTP {sample['status']} for its first request")
+    return sample
+
+
+def measure_startup(runs=5):
+    """
+    Starts `runs` fresh processes against a new database (cold: the schema is
+    created) and `runs` against an existing one (warm: the schema check only),
+    and returns the median of each phase.
+    """
+    cold, warm = [], []
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix='quickpay-startup-')
+        try:
+            cold.append(probe(workdir))
+            warm.append(probe(workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'import_ms': statistics.median(sample['import_ms'] for sample in cold + warm),
+        'cold_bootstrap_ms': statistics.median(sample['bootstrap_ms'] for sample in cold),
+        'warm_bootstrap_ms': statistics.median(sample['bootstrap_ms'] for sample in warm),
+        'first_request_ms': statistics.median(sample['first_request_ms'] for sample in warm),
+    }
+
+
+def over_budget(startup, budget=STARTUP_BUDGET_MS):
+    """Returns (metric, measured, budget) for every startup metric over its budget."""
+    return [(metric, startup[metric], limit) for metric, limit in budget.items()
+            if metric in startup and startup[metric] > limit]
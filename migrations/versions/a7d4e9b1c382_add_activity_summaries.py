@@ -0,0 +1,44 @@
+"""Add activity_summaries and user_counterparties tables
+
+Revision ID: a7d4e9b1c382
+Revises: f3c8d2e7a146
+Create Date: 2026-10-16 16:05:12.417390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4e9b1c382'
+down_revision = 'f3c8d2e7a146'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('activity_summaries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('sent_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('sent_cents', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('received_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('received_cents', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('months', sa.Text(), server_default='{}', nullable=False),
+    sa.Column('top_counterparties', sa.Text(), server_default='[]', nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('user_counterparties',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('counterparty_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('cents', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'counterparty_id'),
+    sqlite_with_rowid=False
+    )
+    # Existing history is summarised afterwards with `flask rebuild-activity`.
+
+
+def downgrade():
+    op.drop_table('user_counterparties')
+    op.drop_table('activity_summaries')
@@ -0,0 +1,61 @@
+"""Add user_directory and the shard bookkeeping tables
+
+Revision ID: b6e2f0c4d913
+Revises: a7d4e9b1c382
+Create Date: 2026-10-16 18:42:37.905214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2f0c4d913'
+down_revision = 'a7d4e9b1c382'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # user_directory is only read on the first shard; `flask init-db` creates the rest on every shard.
+    op.create_table('user_directory',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('email')
+    )
+    op.create_table('shard_sequences',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name'),
+    sqlite_with_rowid=False
+    )
+    op.create_table('shard_transfers',
+    sa.Column('xid', sa.Integer(), nullable=False),
+    sa.Column('credits', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.PrimaryKeyConstraint('xid')
+    )
+    op.create_table('shard_credits',
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('receiver_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('transaction_id')
+    )
+    op.create_index('idx_shard_credits_receiver', 'shard_credits', ['receiver_id'], unique=False)
+    op.create_table('shard_moves',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('target_shard', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('shard_moves')
+    op.drop_index('idx_shard_credits_receiver', table_name='shard_credits')
+    op.drop_table('shard_credits')
+    op.drop_table('shard_transfers')
+    op.drop_table('shard_sequences')
+    op.drop_table('user_directory')
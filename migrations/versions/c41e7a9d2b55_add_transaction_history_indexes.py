@@ -0,0 +1,30 @@
+"""Add covering history indexes to transactions table
+
+Revision ID: c41e7a9d2b55
+Revises: 80cfa52956d1
+Create Date: 2026-10-16 09:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7a9d2b55'
+down_revision = '80cfa52956d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index('idx_transactions_sender_ts',
+                              ['sender_id', 'timestamp', 'id', 'receiver_id', 'amount'], unique=False)
+        batch_op.create_index('idx_transactions_receiver_ts',
+                              ['receiver_id', 'timestamp', 'id', 'sender_id', 'amount'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('idx_transactions_receiver_ts')
+        batch_op.drop_index('idx_transactions_sender_ts')
@@ -0,0 +1,45 @@
+"""Add scheduled_transfers
+
+Revision ID: c9a3e5f1b207
+Revises: b6e2f0c4d913
+Create Date: 2026-10-16 21:07:53.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9a3e5f1b207'
+down_revision = 'b6e2f0c4d913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scheduled_transfers',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sender_id', sa.Integer(), nullable=False),
+    sa.Column('receiver_id', sa.Integer(), nullable=False),
+    sa.Column('amount_cents', sa.Integer(), nullable=False),
+    sa.Column('frequency', sa.String(), nullable=False),
+    sa.Column('day_of_month', sa.Integer(), nullable=False),
+    sa.Column('next_run', sa.DateTime(), nullable=False),
+    sa.Column('status', sa.String(), server_default='active', nullable=False),
+    sa.Column('failure_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_run_at', sa.DateTime(), nullable=True),
+    sa.Column('last_transaction_id', sa.Integer(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Only active schedules are indexed by next run, so the scheduler's scan skips finished ones.
+    op.create_index('idx_scheduled_transfers_due', 'scheduled_transfers', ['next_run'], unique=False,
+                    sqlite_where=sa.text("status = 'active'"))
+    op.create_index('idx_scheduled_transfers_sender', 'scheduled_transfers', ['sender_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_scheduled_transfers_sender', table_name='scheduled_transfers')
+    op.drop_index('idx_scheduled_transfers_due', table_name='scheduled_transfers')
+    op.drop_table('scheduled_transfers')
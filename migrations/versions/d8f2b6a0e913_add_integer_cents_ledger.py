@@ -0,0 +1,81 @@
+"""Add integer-cents columns, ledger entries and balance snapshots
+
+Revision ID: d8f2b6a0e913
+Revises: c41e7a9d2b55
+Create Date: 2026-10-16 11:40:07.518342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2b6a0e913'
+down_revision = 'c41e7a9d2b55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('balance_cents', sa.Integer(), server_default='100000', nullable=True))
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('amount_cents', sa.Integer(), nullable=True))
+    op.execute("UPDATE users SET balance_cents = CAST(ROUND(balance * 100) AS INTEGER)")
+    op.execute("UPDATE transactions SET amount_cents = CAST(ROUND(amount * 100) AS INTEGER)")
+
+    op.create_table('ledger_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount_cents', sa.Integer(), nullable=False),
+    sa.Column('entry_type', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('idx_ledger_entries_user', 'ledger_entries',
+                    ['user_id', 'id', 'created_at', 'amount_cents'], unique=False)
+    op.execute("""
+        CREATE TRIGGER ledger_entries_no_update BEFORE UPDATE ON ledger_entries BEGIN
+            SELECT RAISE(ABORT, 'ledger_entries is append-only');
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER ledger_entries_no_delete BEFORE DELETE ON ledger_entries BEGIN
+            SELECT RAISE(ABORT, 'ledger_entries is append-only');
+        END
+    """)
+    # Existing balances enter the ledger as opening balances drawn from the system account (id 0).
+    op.execute("""
+        INSERT INTO ledger_entries (user_id, amount_cents, entry_type)
+        SELECT id, balance_cents, 'opening_balance' FROM users
+    """)
+    op.execute("""
+        INSERT INTO ledger_entries (user_id, amount_cents, entry_type)
+        SELECT 0, -total, 'opening_balance' FROM (SELECT SUM(balance_cents) AS total FROM users)
+        WHERE total IS NOT NULL
+    """)
+
+    op.create_table('balance_snapshots',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('ledger_entry_id', sa.Integer(), nullable=False),
+    sa.Column('balance_cents', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.PrimaryKeyConstraint('user_id', 'ledger_entry_id'),
+    sqlite_with_rowid=False
+    )
+    op.create_index('idx_balance_snapshots_entry', 'balance_snapshots', ['ledger_entry_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_balance_snapshots_entry', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.execute("DROP TRIGGER IF EXISTS ledger_entries_no_delete")
+    op.execute("DROP TRIGGER IF EXISTS ledger_entries_no_update")
+    op.drop_index('idx_ledger_entries_user', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_column('amount_cents')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('balance_cents')
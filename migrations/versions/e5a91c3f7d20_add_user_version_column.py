@@ -0,0 +1,26 @@
+"""Add version column to users table
+
+Revision ID: e5a91c3f7d20
+Revises: d8f2b6a0e913
+Create Date: 2026-10-16 13:05:52.661409
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a91c3f7d20'
+down_revision = 'd8f2b6a0e913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,34 @@
+"""Add idempotency_keys table
+
+Revision ID: f3c8d2e7a146
+Revises: e5a91c3f7d20
+Create Date: 2026-10-16 14:22:48.903115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d2e7a146'
+down_revision = 'e5a91c3f7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_keys',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('request_hash', sa.Text(), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.PrimaryKeyConstraint('user_id', 'key'),
+    sqlite_with_rowid=False
+    )
+    op.create_index('idx_idempotency_keys_created', 'idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_idempotency_keys_created', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+# Counter-account for money entering the ledger from outside (signup credits, opening balances).
+SYSTEM_ACCOUNT_ID = 0
+
+
+class Ledger:
+    """
+    Manages the append-only, double-entry ledger for QuickPay.
+    Amounts are integer cents; every movement is written as entries that sum to zero.
+    """
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def _record(self, entries):
+        query = "INSERT INTO ledger_entries (transaction_id, user_id, amount_cents, entry_type) VALUES (?, ?, ?, ?)"
+        for entry in entries:
+            self.db.execute_update(query, entry)
+
+    def record_transfer(self, transaction_id, sender_id, receiver_id, amount_cents):
+        """Records the debit and credit legs of a transfer."""
+        self._record([
+            (transaction_id, sender_id, -amount_cents, 'transfer'),
+            (transaction_id, receiver_id, amount_cents, 'transfer'),
+        ])
+
+    def record_signup_credit(self, user_id, amount_cents):
+        """Records a signup credit drawn from the system account."""
+        self._record([
+            (None, SYSTEM_ACCOUNT_ID, -amount_cents, 'signup_credit'),
+            (None, user_id, amount_cents, 'signup_credit'),
+        ])
+
+    def balance_as_of(self, user_id, as_of=None):
+        """
+        Returns a user's balance in cents at a UTC 'YYYY-MM-DD HH:MM:SS' time (default now),
+        starting from the nearest snapshot and summing only the entries after it.
+        """
+        as_of = as_of or datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        query = """
+            SELECT ledger_entry_id, balance_cents FROM balance_snapshots
+            WHERE user_id = ? AND taken_at <= ?
+            ORDER BY ledger_entry_id DESC
+            LIMIT 1
+        """
+        result = self.db.execute_query(query, (user_id, as_of))
+        start_entry_id, start_cents = (result[0]['ledger_entry_id'], result[0]['balance_cents']) if result else (0, 0)
+        query = """
+            SELECT COALESCE(SUM(amount_cents), 0) AS cents FROM ledger_entries
+            WHERE user_id = ? AND id > ? AND created_at <= ?
+        """
+        return start_cents + self.db.execute_query(query, (user_id, start_entry_id, as_of))[0]['cents']
@@ -1,3 +1,7 @@
+from models.ledger import Ledger
+from utils.money import from_cents
+
+
 class Transaction:
     """
     Manages transaction-related database operations for QuickPay.
@@ -5,35 +9,49 @@ class Transaction:
     def __init__(self, db_connection):
         self.db = db_connection
 
-    def record_transaction(self, sender_id, receiver_id, amount, status="Completed"):
-        """Records a new transaction."""
+    def record_transaction(self, sender_id, receiver_id, amount_cents, status="Completed"):
+        """Records a new transaction and its two balancing ledger entries."""
         query = """
-            INSERT INTO transactions (sender_id, receiver_id, amount, status) 
-            VALUES (?, ?, ?, ?)
+            INSERT INTO transactions (sender_id, receiver_id, amount, amount_cents, status)
+            VALUES (?, ?, ?, ?, ?)
         """
-        return self.db.execute_update(query, (sender_id, receiver_id, amount, status))
+        transaction_id = self.db.execute_update(query, (sender_id, receiver_id, from_cents(amount_cents),
+                                                        amount_cents, status))
+        Ledger(self.db).record_transfer(transaction_id, sender_id, receiver_id, amount_cents)
+        return transaction_id
 
-    def get_transactions_for_user(self, user_id):
+    def get_transactions_for_user(self, user_id, limit=None, before=None):
         """
-        Retrieves all transactions (sent and received) for a specific user.
-        Joins with the users table to get sender/receiver names.
+        Retrieves transactions (sent and received) for a specific user, newest first.
+        Merges two index range scans (sender side and receiver side) by timestamp
+        and joins with the users table to get sender/receiver names.
+        Pass `limit` and a `before` (timestamp, id) cursor taken from the last row
+        of the previous page to read the history one page at a time.
         """
+        keyset = " AND (t.timestamp, t.id) < (?, ?)" if before else ""
+        cursor_params = tuple(before) if before else ()
         query = """
-            SELECT 
-                t.id, 
-                t.amount, 
-                t.timestamp,
-                t.status,
+            SELECT
+                t.id AS id,
+                t.amount AS amount,
+                t.timestamp AS timestamp,
+                t.status AS status,
                 sender.name AS sender_name,
                 receiver.name AS receiver_name,
-                CASE 
-                    WHEN t.sender_id = ? THEN 'Sent' 
-                    ELSE 'Received' 
-                END AS type
+                'Sent' AS type
             FROM transactions t
-            JOIN users sender ON t.sender_id = sender.id
-            JOIN users receiver ON t.receiver_id = receiver.id
-            WHERE t.sender_id = ? OR t.receiver_id = ?
-            ORDER BY t.timestamp DESC
-        """
-        return self.db.execute_query(query, (user_id, user_id, user_id))
\ No newline at end of file
+            JOIN users sender ON sender.id = t.sender_id
+            JOIN users receiver ON receiver.id = t.receiver_id
+            WHERE t.sender_id = ?{keyset}
+            UNION ALL
+            SELECT t.id, t.amount, t.timestamp, t.status, sender.name, receiver.name, 'Received'
+            FROM transactions t
+            JOIN users sender ON sender.id = t.sender_id
+            JOIN users receiver ON receiver.id = t.receiver_id
+            WHERE t.receiver_id = ? AND t.sender_id != ?{keyset}
+            ORDER BY timestamp DESC, id DESC{limit}
+        """.format(keyset=keyset, limit=" LIMIT ?" if limit is not None else "")
+        params = (user_id,) + cursor_params + (user_id, user_id) + cursor_params
+        if limit is not None:
+            params += (limit,)
+        return self.db.execute_query(query, params)
\ No newline at end of file
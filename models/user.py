@@ -1,3 +1,11 @@
+import re
+
+from models.ledger import Ledger
+from utils.money import from_cents, to_cents
+
+SIGNUP_CREDIT_CENTS = 100000
+
+
 class User:
     """
     Manages user-related database operations for QuickPay.
@@ -8,22 +16,33 @@ class User:
         self.db = db_connection
 
     def create_user(self, name, email, password_hash):
-        """Inserts a new user with an initial balance of 1000.00 and 'Unverified' status."""
-        initial_balance = 1000.00
+        """
+        Inserts a new user with an initial balance of 1000.00 and 'Unverified' status,
+        and records the signup credit in the ledger.
+        """
         verification_status = 'Unverified'
-        query = "INSERT INTO users (name, email, password, balance, verification_status) VALUES (?, ?, ?, ?, ?)"
-        return self.db.execute_update(query, (name, email, password_hash, initial_balance, verification_status))
+        query = """
+            INSERT INTO users (name, email, password, balance, balance_cents, verification_status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """
+        user_id = self.db.execute_update(query, (name, email, password_hash, from_cents(SIGNUP_CREDIT_CENTS),
+                                                 SIGNUP_CREDIT_CENTS, verification_status))
+        Ledger(self.db).record_signup_credit(user_id, SIGNUP_CREDIT_CENTS)
+        return user_id
 
     def get_user_by_email(self, email):
         """Retrieves a user's data by email address."""
         # Ensure 'verification_status' is selected here too for complete user object
-        query = "SELECT id, name, email, password, balance, verification_status FROM users WHERE email = ?"
+        query = """
+            SELECT id, name, email, password, balance, balance_cents, verification_status, version
+            FROM users WHERE email = ?
+        """
         result = self.db.execute_query(query, (email,))
         return result[0] if result else None
 
     def get_user_by_id(self, user_id):
         """Retrieves a user's data by ID, including verification status."""
-        query = "SELECT id, name, email, balance, verification_status FROM users WHERE id = ?"
+        query = "SELECT id, name, email, balance, balance_cents, verification_status, version FROM users WHERE id = ?"
         result = self.db.execute_query(query, (user_id,))
         return result[0] if result else None
 
@@ -32,12 +51,50 @@ class User:
         query = "SELECT id, name, email FROM users WHERE id != ? ORDER BY name ASC"
         return self.db.execute_query(query, (current_user_id,))
 
+    def search_recipients(self, query, current_user_id, limit=10):
+        """Prefix-searches other users by name or email through the users_fts index, best matches first."""
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        query = """
+            SELECT u.id, u.name, u.email
+            FROM users_fts
+            JOIN users u ON u.id = users_fts.rowid
+            WHERE users_fts MATCH ? AND u.id != ?
+            ORDER BY users_fts.rank
+            LIMIT ?
+        """
+        return self.db.execute_query(query, (match, current_user_id, limit))
+
     def update_balance(self, user_id, new_balance):
-        """Updates the balance for a given user ID."""
-        query = "UPDATE users SET balance = ? WHERE id = ?"
-        return self.db.execute_update(query, (new_balance, user_id))
+        """
+        Sets the balance from an amount in units, as app.User.update_balance does;
+        balance_cents is authoritative and balance is kept alongside it for display.
+        """
+        query = "UPDATE users SET balance_cents = ?, balance = ?, version = version + 1 WHERE id = ?"
+        new_balance_cents = to_cents(new_balance)
+        return self.db.execute_update(query, (new_balance_cents, from_cents(new_balance_cents), user_id))
+
+    def debit_if_sufficient(self, user_id, amount_cents):
+        """Atomically debits a user only if the balance covers the amount; returns the affected row count."""
+        query = """
+            UPDATE users
+            SET balance_cents = balance_cents - ?, balance = (balance_cents - ?) / 100.0, version = version + 1
+            WHERE id = ? AND balance_cents >= ?
+        """
+        return self.db.execute_update(query, (amount_cents, amount_cents, user_id, amount_cents))
+
+    def credit(self, user_id, amount_cents):
+        """Atomically credits a user's balance; returns the affected row count."""
+        query = """
+            UPDATE users
+            SET balance_cents = balance_cents + ?, balance = (balance_cents + ?) / 100.0, version = version + 1
+            WHERE id = ?
+        """
+        return self.db.execute_update(query, (amount_cents, amount_cents, user_id))
 
     def update_verification_status(self, user_id, status):
         """Updates the user's verification status."""
-        query = "UPDATE users SET verification_status = ? WHERE id = ?"
+        query = "UPDATE users SET verification_status = ?, version = version + 1 WHERE id = ?"
         return self.db.execute_update(query, (status, user_id))
\ No newline at end of file
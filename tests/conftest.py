@@ -0,0 +1,71 @@
+"""
+Shared fixtures. The app keeps its database paths, writer threads and caches in
+module globals, so one copy is imported per test session, in a scratch directory
+(DB_PATH is relative). Each test makes its own users, so tests never share a
+balance or a velocity window. Checks that need a fresh interpreter or a sharded
+layout run a script in a subprocess instead (run_script).
+"""
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PACKAGE_ROOT not in sys.path:
+    sys.path.insert(0, PACKAGE_ROOT)
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def quickpay(tmp_path_factory):
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('quickpay'))
+    import app
+    app.create_app()
+    yield app
+    os.chdir(previous)
+
+
+@pytest.fixture
+def make_user(quickpay):
+    """Registers a user with the signup credit and returns its id. The password hash is never checked."""
+    def make(name=None):
+        number = next(_user_numbers)
+        return quickpay.create_account(name or f'Test User {number}', f'user{number}@example.com', 'unused')
+    return make
+
+
+@pytest.fixture
+def login(quickpay):
+    """Returns a test client whose session is logged in as a user, without hashing a password."""
+    def login(user_id):
+        client = quickpay.app.test_client()
+        with client.session_transaction() as session:
+            session['user'] = {'name': 'Test User', 'id': user_id}
+        return client
+    return login
+
+
+@pytest.fixture
+def balance_of(quickpay):
+    def balance_of(user_id):
+        return quickpay.load_user_data(user_id).balance_cents
+    return balance_of
+
+
+@pytest.fixture
+def run_script(tmp_path):
+    """
+    Runs Python source in a fresh interpreter inside tmp_path, with the package
+    importable, and returns the JSON object its last line of output prints.
+    """
+    def run(source):
+        result = subprocess.run([sys.executable, '-c', source], cwd=tmp_path, capture_output=True, text=True,
+                                env=dict(os.environ, PYTHONPATH=PACKAGE_ROOT), timeout=120)
+        assert result.returncode == 0, result.stderr
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    return run
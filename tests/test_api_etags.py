@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/api/v1/balance', '/api/v1/history?limit=5'])
+def test_unchanged_resource_answers_304(make_user, login, path):
+    client = login(make_user())
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    repeat = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert repeat.status_code == 304
+    assert repeat.data == b''
+    assert repeat.headers['ETag'] == first.headers['ETag']
+
+
+@pytest.mark.parametrize('path', ['/api/v1/balance', '/api/v1/history?limit=5'])
+def test_transfer_changes_the_etag(quickpay, make_user, login, path):
+    user, other = make_user(), make_user()
+    client = login(user)
+    etag = client.get(path).headers['ETag']
+
+    quickpay.run_transfer(other, user, 1234)
+
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_history_pages_have_their_own_etags(quickpay, make_user, login):
+    user, other = make_user(), make_user()
+    for cents in (100, 200, 300):
+        quickpay.run_transfer(user, other, cents)
+    client = login(user)
+
+    first = client.get('/api/v1/history?limit=2')
+    second = client.get('/api/v1/history', query_string={'limit': 2, 'cursor': first.get_json()['next_cursor']})
+    assert first.headers['ETag'] != second.headers['ETag']
+    assert client.get('/api/v1/history?limit=1', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+def test_balance_needs_a_login(quickpay):
+    assert quickpay.app.test_client().get('/api/v1/balance').status_code == 401
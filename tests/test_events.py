@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def short_streams(quickpay, monkeypatch):
+    monkeypatch.setattr(quickpay, 'NOTIFY_WSGI_STREAM_SECONDS', 0.5)
+    monkeypatch.setattr(quickpay, 'NOTIFY_HEARTBEAT', 0.1)
+
+
+def test_stream_opens_with_the_balance_and_delivers_payments(quickpay, make_user, login, short_streams):
+    user, sender = make_user(), make_user()
+    response = login(user).get('/api/v1/events', buffered=False)
+    body = response.iter_encoded()
+
+    assert response.mimetype == 'text/event-stream'
+    assert next(body).startswith(b'event: balance\n')
+    quickpay.run_transfer(sender, user, 4200)
+    chunk = next(chunk for chunk in body if chunk.startswith(b'event: payment\n'))
+    payment = json.loads(chunk.split(b'data: ', 1)[1].split(b'\n', 1)[0])
+    assert (payment['sender_id'], payment['amount_cents'], payment['balance_cents']) == (sender, 4200, 104200)
+    response.close()
+
+
+def test_wsgi_stream_ends_with_a_retry_hint(quickpay, make_user, login, short_streams):
+    client = login(make_user())
+    streams = len(quickpay.notifications)
+
+    chunks = list(client.get('/api/v1/events', buffered=False).iter_encoded())
+
+    assert chunks[-1] == f'retry: {quickpay.NOTIFY_WSGI_RETRY_MS}\n\n'.encode()
+    assert len(quickpay.notifications) == streams
+
+
+def test_welcome_page_opens_a_stream_only_when_served_natively(quickpay, make_user, login, monkeypatch):
+    client = login(make_user())
+    monkeypatch.setitem(quickpay.app.config, 'NATIVE_EVENT_STREAMS', False)
+    assert b'EventSource' not in client.get('/welcome').data
+    monkeypatch.setitem(quickpay.app.config, 'NATIVE_EVENT_STREAMS', True)
+    assert b'EventSource' in client.get('/welcome').data
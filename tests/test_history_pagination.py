@@ -0,0 +1,58 @@
+import pytest
+
+
+@pytest.fixture
+def history_client(quickpay, make_user, login):
+    """A logged-in user who has sent seven transfers, most of them within the same second."""
+    sender, receiver = make_user(), make_user()
+    for cents in range(101, 108):
+        quickpay.run_transfer(sender, receiver, cents)
+    return login(sender), sender, receiver
+
+
+def read_pages(client, limit):
+    pages, cursor = [], None
+    while True:
+        query = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+        page = client.get('/api/v1/history', query_string=query).get_json()
+        pages.append(page['transactions'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('limit, sizes', [(3, [3, 3, 1]), (7, [7]), (1, [1] * 7), (100, [7])])
+def test_pages_cover_the_history_once_in_order(history_client, limit, sizes):
+    client, _, _ = history_client
+    pages = read_pages(client, limit)
+
+    assert [len(page) for page in pages] == sizes
+    amounts = [row['amount_cents'] for page in pages for row in page]
+    assert amounts == list(range(107, 100, -1))
+
+
+def test_a_full_last_page_has_no_next_cursor(history_client):
+    client, _, _ = history_client
+    assert client.get('/api/v1/history?limit=7').get_json()['next_cursor'] is None
+
+
+def test_new_transfers_do_not_shift_later_pages(quickpay, history_client):
+    client, sender, receiver = history_client
+    first = client.get('/api/v1/history?limit=3').get_json()
+    quickpay.run_transfer(receiver, sender, 999)
+
+    second = client.get('/api/v1/history', query_string={'limit': 3, 'cursor': first['next_cursor']}).get_json()
+    assert [row['amount_cents'] for row in second['transactions']] == [104, 103, 102]
+
+
+def test_page_size_is_clamped(history_client):
+    client, _, _ = history_client
+    assert len(client.get('/api/v1/history?limit=0').get_json()['transactions']) == 1
+    assert len(client.get('/api/v1/history?limit=nope').get_json()['transactions']) == 7
+
+
+def test_invalid_cursor_is_rejected(history_client):
+    client, _, _ = history_client
+    response = client.get('/api/v1/history?cursor=%25%25')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "Invalid cursor."}
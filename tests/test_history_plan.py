@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.mark.parametrize('query', [
+    {},
+    {'limit': 50, 'before': ('2026-01-01 00:00:00', 100)},
+    {'since': '2026-01-01 00:00:00', 'until': '2026-02-01 00:00:00'},
+], ids=['full', 'keyset-page', 'date-range'])
+def test_history_query_reads_both_covering_indexes(quickpay, tmp_path, query):
+    db_path = str(tmp_path / 'plan.db')
+    quickpay.init_db(db_path)
+    sql, params = quickpay.Transaction.history_query(1, **query)
+
+    with quickpay.DatabaseConnection(db_path) as db:
+        plan = [row.detail for row in db.execute_fetch_all("EXPLAIN QUERY PLAN " + sql, params)]
+
+    assert any(detail.startswith('SEARCH t USING COVERING INDEX idx_transactions_sender_ts') for detail in plan)
+    assert any(detail.startswith('SEARCH t USING COVERING INDEX idx_transactions_receiver_ts') for detail in plan)
+    assert not [detail for detail in plan if 'USE TEMP B-TREE' in detail or detail.startswith('SCAN t')]
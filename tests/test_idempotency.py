@@ -0,0 +1,64 @@
+import threading
+
+
+def post_transfer(client, receiver, amount, key):
+    return client.post('/api/v1/transfers', json={'receiver_id': receiver, 'amount': amount},
+                       headers={'Idempotency-Key': key})
+
+
+def test_replay_returns_the_first_result_without_paying_again(make_user, login, balance_of):
+    sender, receiver = make_user(), make_user()
+    client = login(sender)
+
+    first = post_transfer(client, receiver, '12.34', 'order-1')
+    replay = post_transfer(client, receiver, '12.34', 'order-1')
+
+    assert first.status_code == replay.status_code == 201
+    assert replay.get_json() == first.get_json()
+    assert balance_of(sender) == 100000 - 1234
+    assert balance_of(receiver) == 100000 + 1234
+
+
+def test_reusing_a_key_for_another_transfer_is_refused(make_user, login, balance_of):
+    sender, receiver = make_user(), make_user()
+    client = login(sender)
+    post_transfer(client, receiver, '5', 'order-2')
+
+    response = post_transfer(client, receiver, '6', 'order-2')
+
+    assert response.status_code == 422
+    assert balance_of(sender) == 100000 - 500
+
+
+def test_keys_belong_to_their_sender(make_user, login, balance_of):
+    first_sender, second_sender, receiver = make_user(), make_user(), make_user()
+    post_transfer(login(first_sender), receiver, '1', 'shared-key')
+    post_transfer(login(second_sender), receiver, '1', 'shared-key')
+
+    assert balance_of(receiver) == 100000 + 200
+
+
+def test_concurrent_retries_pay_once(quickpay, make_user, balance_of):
+    sender, receiver = make_user(), make_user()
+    start = threading.Barrier(8)
+    results = []
+
+    def send():
+        start.wait()
+        results.append(quickpay.run_transfer(sender, receiver, 700, 'order-3'))
+
+    threads = [threading.Thread(target=send) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    assert len({result['transaction_id'] for result in results}) == 1
+    assert balance_of(sender) == 100000 - 700
+
+
+def test_overlong_key_is_rejected(quickpay, make_user, login):
+    client = login(make_user())
+    response = post_transfer(client, make_user(), '1', 'k' * (quickpay.IDEMPOTENCY_KEY_MAX_LENGTH + 1))
+    assert response.status_code == 400
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import limits
+
+WINDOW = 3600.0
+WINDOW_START = 1000 * WINDOW
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=WINDOW_START + 10)
+    monkeypatch.setattr(limits, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture(params=['memory', 'file'])
+def limiter(request, tmp_path):
+    if request.param == 'memory':
+        return limits.MemoryLimiter()
+    return limits.FileLimiter(str(tmp_path / 'limits.db'))
+
+
+def add(limiter, amount=1, key='sender'):
+    return limiter.add_within(key, WINDOW, amount, 3, 1000)
+
+
+def test_count_limit_and_when_it_clears(limiter, clock):
+    assert [add(limiter) for _ in range(3)] == [0, 0, 0]
+    retry_after = add(limiter)
+
+    # Three events of the previous window still weigh 2 or more until a third of the next one has passed.
+    assert retry_after == pytest.approx(WINDOW - 10 + WINDOW / 3)
+    clock.now += retry_after - 1
+    assert add(limiter) > 0
+    clock.now += 1.001
+    assert add(limiter) == 0
+
+
+def test_total_limit_is_inclusive(limiter, clock):
+    assert add(limiter, 999) == 0
+    assert add(limiter, 1) == 0
+    assert add(limiter, 1) > 0
+
+
+def test_amount_over_the_total_never_fits(limiter, clock):
+    assert add(limiter, 1001) is None
+    assert add(limiter, 1000) == 0
+
+
+def test_refused_events_are_not_recorded(limiter, clock):
+    add(limiter, 600)
+    assert add(limiter, 600) > 0
+    assert add(limiter, 400) == 0
+
+
+def test_removed_event_frees_its_room(limiter, clock):
+    for _ in range(3):
+        add(limiter, 100)
+    limiter.remove_within('sender', WINDOW, 100)
+    assert add(limiter, 100) == 0
+    assert add(limiter, 100) > 0
+
+
+def test_window_empties_after_two_windows(limiter, clock):
+    for _ in range(3):
+        add(limiter)
+    clock.now = WINDOW_START + 2 * WINDOW
+    assert [add(limiter) for _ in range(3)] == [0, 0, 0]
+
+
+def test_keys_are_independent(limiter, clock):
+    for _ in range(3):
+        add(limiter)
+    assert add(limiter, key='other') == 0
+
+
+@pytest.fixture
+def pair_limit(quickpay, monkeypatch):
+    monkeypatch.setattr(quickpay, 'TRANSFER_PAIR_MAX_COUNT', 3)
+
+
+def test_transfers_over_the_pair_limit_get_429(make_user, login, pair_limit):
+    sender, receiver = make_user(), make_user()
+    client = login(sender)
+    statuses = [client.post('/api/v1/transfers', json={'receiver_id': receiver, 'amount': '1'}).status_code
+                for _ in range(4)]
+
+    assert statuses == [201, 201, 201, 429]
+    assert client.post('/api/v1/transfers', json={'receiver_id': make_user(), 'amount': '1'}).status_code == 201
+
+
+def test_payout_over_a_limit_is_refused_whole(make_user, login, balance_of, pair_limit):
+    sender, receiver, other = make_user(), make_user(), make_user()
+    client = login(sender)
+    rows = [{'receiver_id': other, 'amount': '1'}] + [{'receiver_id': receiver, 'amount': '1'}] * 4
+
+    response = client.post('/api/v1/payouts', json=rows)
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert balance_of(sender) == 100000
+    # Nothing of the refused payout was counted against the windows.
+    assert client.post('/api/v1/payouts', json=rows[:4]).get_json()['paid'] == 4
+
+
+def test_payout_rows_to_invalid_receivers_are_refunded(make_user, login, pair_limit):
+    sender, receiver = make_user(), make_user()
+    client = login(sender)
+    missing = receiver + 10 ** 6
+
+    report = client.post('/api/v1/payouts', json=[{'receiver_id': missing, 'amount': '1'}] * 3).get_json()
+
+    assert report['rejected'] == 3
+    assert client.post('/api/v1/payouts', json=[{'receiver_id': missing, 'amount': '1'}] * 3).status_code == 200
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+from utils.metrics import QueryMetrics, statement_label
+
+
+def test_statement_label_is_stable_and_ignores_literals():
+    label = statement_label("SELECT name FROM users WHERE id = 5")
+    assert label == statement_label("SELECT name\n  FROM users WHERE id = 42;")
+    assert label != statement_label("SELECT email FROM users WHERE id = 5")
+    assert label.split()[:2] == ['SELECT', 'users']
+    assert statement_label("PRAGMA journal_mode") is None
+    assert statement_label("CREATE INDEX i ON t (a)") is None
+
+
+def test_statements_past_the_cap_share_one_label():
+    metrics = QueryMetrics(max_statements=2)
+    for table in ('a', 'b', 'c', 'd'):
+        metrics.observe(f"SELECT x FROM {table}", 0.001)
+
+    assert len(metrics.statements) == 2
+    assert metrics.durations.labels('other').count == 2
+
+
+def test_counters_do_not_lose_updates_across_threads():
+    metrics = QueryMetrics()
+
+    def count():
+        for _ in range(10000):
+            metrics.count_session()
+            metrics.count_rows(2)
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert (metrics.sessions, metrics.rows_fetched) == (80000, 160000)
+
+
+def test_metrics_export_statement_texts(quickpay, make_user, login):
+    client = login(make_user())
+    client.get('/api/v1/history')
+
+    lines = quickpay.app.test_client().get('/metrics').data.decode().splitlines()
+
+    labels = {line.split('statement="')[1].split('"')[0]
+              for line in lines if line.startswith('quickpay_sql_duration_seconds_count')}
+    info = [line for line in lines if line.startswith('quickpay_sql_statement_info{')]
+    assert labels and labels <= {line.split('statement="')[1].split('"')[0] for line in info} | {'other'}
+    assert all(line.endswith('} 1') and 'text="' in line for line in info)
+
+
+def test_native_asgi_routes_record_request_latency(quickpay, make_user, login, monkeypatch):
+    # Importing asgi switches the shared app to native event streams; switch it back afterwards.
+    monkeypatch.setitem(quickpay.app.config, 'NATIVE_EVENT_STREAMS', quickpay.app.config['NATIVE_EVENT_STREAMS'])
+    import asgi
+    client = login(make_user())
+    cookie = client.get_cookie('session').value
+    histogram = quickpay.request_latency.labels('GET', '/api/v1/balance')
+    before = histogram.count
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/api/v1/balance', 'query_string': b'',
+             'headers': [(b'cookie', f'session={cookie}'.encode())]}
+    asyncio.run(asgi.application(scope, receive, send))
+
+    assert sent[0]['status'] == 200
+    assert histogram.count == before + 1
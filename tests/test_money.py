@@ -0,0 +1,27 @@
+import pytest
+
+from utils.money import MAX_AMOUNT_CENTS, from_cents, to_cents
+
+
+@pytest.mark.parametrize('amount, cents', [
+    ('12.34', 1234),
+    (' 5 ', 500),
+    (7, 700),
+    (0.1, 10),
+    ('0.005', 1),
+    ('-0.005', -1),
+    ('1e3', 100000),
+    (str(MAX_AMOUNT_CENTS // 100), MAX_AMOUNT_CENTS),
+])
+def test_to_cents_rounds_half_up(amount, cents):
+    assert to_cents(amount) == cents
+
+
+@pytest.mark.parametrize('amount', ['', 'abc', 'NaN', 'inf', None, '1e20', '-1e30', f'{MAX_AMOUNT_CENTS // 100}.01'])
+def test_to_cents_rejects_invalid_or_out_of_range_amounts(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+
+def test_from_cents_round_trips():
+    assert from_cents(to_cents('1234.56')) == 1234.56
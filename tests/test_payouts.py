@@ -0,0 +1,61 @@
+def test_payout_pays_valid_rows_and_reports_the_rest(make_user, login, balance_of):
+    sender, first, second = make_user(), make_user(), make_user()
+    client = login(sender)
+
+    response = client.post('/api/v1/payouts', json={'payouts': [
+        {'receiver_id': first, 'amount': '10'},
+        {'receiver_id': second, 'amount': '2.50'},
+        {'receiver_id': first, 'amount': '1'},
+        {'receiver_id': sender, 'amount': '1'},
+        {'receiver_id': 0, 'amount': '1'},
+        {'receiver_id': second, 'amount': 'lots'},
+        {'receiver_id': second, 'amount': '-1'},
+    ]})
+
+    report = response.get_json()
+    assert response.status_code == 200
+    assert (report['paid'], report['rejected'], report['total_cents']) == (3, 4, 1350)
+    assert [row['error'] for row in report['rows']] == [
+        None, None, None, "Invalid receiver.", "Invalid receiver_id.", "Invalid amount.", "Amount must be positive."]
+    assert [balance_of(user) for user in (sender, first, second)] == [100000 - 1350, 100000 + 1100, 100000 + 250]
+
+
+def test_csv_payout(make_user, login, balance_of):
+    sender, receiver = make_user(), make_user()
+    body = f"receiver_id,amount\n{receiver},1.25\n{receiver},2\n"
+
+    response = login(sender).post('/api/v1/payouts', data=body, content_type='text/csv')
+
+    assert response.get_json()['paid'] == 2
+    assert balance_of(receiver) == 100000 + 325
+
+
+def test_payout_over_the_balance_pays_nothing(make_user, login, balance_of):
+    sender, first, second = make_user(), make_user(), make_user()
+
+    response = login(sender).post('/api/v1/payouts', json=[{'receiver_id': first, 'amount': '600'},
+                                                            {'receiver_id': second, 'amount': '600'}])
+
+    assert response.status_code == 422
+    assert [balance_of(user) for user in (sender, first, second)] == [100000] * 3
+
+
+def test_payout_total_beyond_sqlite_integers_is_refused(quickpay, make_user, login, balance_of, monkeypatch):
+    monkeypatch.setattr(quickpay, 'TRANSFER_MAX_CENTS', 10 ** 30)
+    monkeypatch.setattr(quickpay, 'TRANSFER_PAIR_MAX_CENTS', 10 ** 30)
+    monkeypatch.setattr(quickpay, 'TRANSFER_MAX_COUNT', 10 ** 6)
+    monkeypatch.setattr(quickpay, 'TRANSFER_PAIR_MAX_COUNT', 10 ** 6)
+    sender, receiver = make_user(), make_user()
+
+    response = login(sender).post('/api/v1/payouts', json=[{'receiver_id': receiver, 'amount': '100000000000'}] * 2000)
+
+    assert response.status_code == 422
+    assert balance_of(sender) == 100000
+
+
+def test_payout_limits(quickpay, make_user, login):
+    client = login(make_user())
+    assert client.post('/api/v1/payouts', json=[]).status_code == 400
+    assert client.post('/api/v1/payouts', json={'rows': []}).status_code == 400
+    too_many = [{'receiver_id': 1, 'amount': '1'}] * (quickpay.PAYOUT_MAX_ROWS + 1)
+    assert client.post('/api/v1/payouts', json=too_many).status_code == 413
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+
+def schedules_of(quickpay, sender):
+    with quickpay.DatabaseConnection.for_user(sender) as db:
+        return quickpay.ScheduledTransfer(db).for_sender(sender)
+
+
+def test_start_in_the_past_is_refused_and_writes_nothing(quickpay, make_user, login):
+    sender, receiver = make_user(), make_user()
+    client = login(sender)
+    yesterday = (datetime.utcnow() - timedelta(days=1)).isoformat(timespec='seconds')
+
+    response = client.post('/api/v1/scheduled-transfers',
+                           json={'receiver_id': receiver, 'amount': '5', 'start_at': yesterday})
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "start_at is in the past; leave it out to start now."}
+    assert schedules_of(quickpay, sender) == []
+
+
+def test_future_start_is_kept(quickpay, make_user, login):
+    sender, receiver = make_user(), make_user()
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).replace(microsecond=0)
+
+    response = login(sender).post('/api/v1/scheduled-transfers',
+                                  json={'receiver_id': receiver, 'amount': '5', 'start_at': tomorrow.isoformat()})
+
+    assert response.status_code == 201
+    assert [schedule.next_run for schedule in schedules_of(quickpay, sender)] == [str(tomorrow)]
+
+
+def test_schedules_over_the_velocity_limit_are_not_paid(quickpay, make_user, login, balance_of, monkeypatch):
+    monkeypatch.setattr(quickpay, 'TRANSFER_PAIR_MAX_COUNT', 3)
+    sender, receiver = make_user(), make_user()
+    client = login(sender)
+    for _ in range(5):
+        assert client.post('/api/v1/scheduled-transfers',
+                           json={'receiver_id': receiver, 'amount': '1', 'frequency': 'daily'}).status_code == 201
+
+    quickpay.run_scheduled_transfers()
+
+    runs = sorted((schedule.last_error or '', schedule.failure_count, schedule.status)
+                  for schedule in schedules_of(quickpay, sender))
+    assert runs == [('', 0, 'active')] * 3 + [("Transfer limit reached.", 1, 'active')] * 2
+    assert balance_of(sender) == 100000 - 300
+    assert balance_of(receiver) == 100000 + 300
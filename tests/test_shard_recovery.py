@@ -0,0 +1,53 @@
+# Two shards. Phase one of a cross-shard transfer commits on the sender's shard, but
+# phase two (the credit) never runs, as if the process died in between; recovery
+# must then pay the receiver exactly once, however often it or phase two runs.
+RECOVERY_SCRIPT = """
+import json
+from datetime import timedelta
+import app
+
+app.shards.paths = ['quickpay.db', 'quickpay-1.db']
+app.create_app()
+users = [app.create_account(f'User {n}', f'user{n}@example.com', 'unused') for n in range(4)]
+sender = users[0]
+receiver = next(user for user in users if app.shards.shard_for(user) != app.shards.shard_for(sender))
+sender_shard = app.shards.shard_for(sender)
+
+def balances():
+    return [app.load_user_data(sender).balance_cents, app.load_user_data(receiver).balance_cents]
+
+def pending():
+    with app.DatabaseConnection.for_shard(sender_shard) as db:
+        return len(app.ShardTransferLog(db).pending('9999-12-31 23:59:59'))
+
+result, prepared = app.writer_for(sender).run(
+    lambda db: app.apply_cross_shard_transfer(db, sender, app.load_user_data(receiver), 300), timeout=5)
+report = {'after_phase_one': balances(), 'logged': pending()}
+report['recovered_within_grace'] = app.recover_shard_transfers()
+report['recovered'] = app.recover_shard_transfers(older_than=timedelta(0))
+report['after_recovery'] = balances()
+report['logged_after_recovery'] = pending()
+app.finish_shard_transfer(sender_shard, *prepared)
+report['recovered_again'] = app.recover_shard_transfers(older_than=timedelta(0))
+report['after_repeats'] = balances()
+with app.DatabaseConnection.for_user(receiver) as db:
+    report['receiver_rows'] = [row.amount_cents for row in
+                               db.execute_fetch_all("SELECT amount_cents FROM transactions WHERE receiver_id = ?;",
+                                                    (receiver,))]
+print(json.dumps(report))
+"""
+
+
+def test_recovery_finishes_an_interrupted_transfer_once(run_script):
+    report = run_script(RECOVERY_SCRIPT)
+
+    assert report['after_phase_one'] == [99700, 100000]
+    assert report['logged'] == 1
+    # A fresh log row is left to the request that wrote it until the grace period passes.
+    assert report['recovered_within_grace'] == [0, 0]
+    assert report['recovered'] == [1, 0]
+    assert report['after_recovery'] == [99700, 100300]
+    assert report['logged_after_recovery'] == 0
+    assert report['recovered_again'] == [0, 0]
+    assert report['after_repeats'] == [99700, 100300]
+    assert report['receiver_rows'] == [300]
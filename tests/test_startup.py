@@ -0,0 +1,71 @@
+from benchmarks.startup import STARTUP_BUDGET_MS
+
+# Counts every SQLite connection the process opens, then imports the app, bootstraps
+# a new database through create_app() and serves the login page.
+STARTUP_SCRIPT = """
+import json, os, sqlite3, time
+connects = []
+connect = sqlite3.connect
+sqlite3.connect = lambda *args, **kwargs: connects.append(args[0]) or connect(*args, **kwargs)
+import app
+imported = {'connections': len(connects), 'files': sorted(os.listdir('.'))}
+started = time.perf_counter()
+app.create_app()
+bootstrapped = time.perf_counter()
+status = app.app.test_client().get('/').status_code
+answered = time.perf_counter()
+print(json.dumps({
+    'import': imported,
+    'bootstrap_ms': (bootstrapped - started) * 1000,
+    'first_request_ms': (answered - bootstrapped) * 1000,
+    'status': status,
+}))
+"""
+
+
+def test_import_opens_no_database(run_script):
+    result = run_script(STARTUP_SCRIPT)
+    assert result['import'] == {'connections': 0, 'files': []}
+
+
+def test_create_app_and_first_request_fit_the_startup_budget(run_script):
+    result = run_script(STARTUP_SCRIPT)
+    assert result['status'] == 200
+    assert result['bootstrap_ms'] <= STARTUP_BUDGET_MS['cold_bootstrap_ms']
+    assert result['first_request_ms'] <= STARTUP_BUDGET_MS['first_request_ms']
+
+
+# Bootstraps with one broken statement at the end of the DDL, then again without it.
+FAILED_BOOTSTRAP_SCRIPT = """
+import json, sqlite3
+import app
+
+def schema():
+    with sqlite3.connect('quickpay.db') as connection:
+        return [connection.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0],
+                connection.execute("PRAGMA user_version").fetchone()[0]]
+
+app.USER_SEARCH_DDL = app.USER_SEARCH_DDL + ["CREATE TABLE broken (;"]
+try:
+    app.create_app()
+    raised = False
+except sqlite3.Error:
+    raised = True
+report = {'raised': raised, 'schema': schema(), 'status': app.app.test_client().get('/').status_code}
+app.USER_SEARCH_DDL = app.USER_SEARCH_DDL[:-1]
+report['retried'] = app.bootstrap(force=True)
+report['status_after_retry'] = app.app.test_client().get('/').status_code
+report['version_after_retry'] = schema()[1]
+print(json.dumps(report))
+"""
+
+
+def test_failed_bootstrap_leaves_no_partial_schema(quickpay, run_script):
+    report = run_script(FAILED_BOOTSTRAP_SCRIPT)
+
+    assert report['raised'] is True
+    assert report['schema'] == [0, 0]
+    assert report['status'] == 503
+    assert report['retried'] is True
+    assert report['status_after_retry'] == 200
+    assert report['version_after_retry'] == quickpay.SCHEMA_VERSION
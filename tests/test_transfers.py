@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+
+def test_concurrent_transfers_never_overdraw(quickpay, make_user, balance_of):
+    sender, receiver = make_user(), make_user()
+    start = threading.Barrier(10)
+    outcomes = []
+
+    def send():
+        start.wait()
+        try:
+            quickpay.run_transfer(sender, receiver, 30000)
+            outcomes.append('paid')
+        except quickpay.InsufficientFunds:
+            outcomes.append('refused')
+
+    threads = [threading.Thread(target=send) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The signup credit of 100000 cents covers three of the ten debits.
+    assert sorted(outcomes) == ['paid'] * 3 + ['refused'] * 7
+    assert balance_of(sender) == 10000
+    assert balance_of(receiver) == 190000
+
+
+def test_refused_transfer_writes_nothing(quickpay, make_user, balance_of):
+    sender, receiver = make_user(), make_user()
+
+    with pytest.raises(quickpay.InsufficientFunds):
+        quickpay.run_transfer(sender, receiver, 100001)
+
+    assert balance_of(sender) == balance_of(receiver) == 100000
+    with quickpay.DatabaseConnection.for_user(sender) as db:
+        assert quickpay.Transaction(db).get_transactions_for_user(sender) == []
+
+
+@pytest.mark.parametrize('receiver_id', [True, False, 0, -1, 1.0, '2', None])
+def test_api_refuses_receiver_ids_that_are_not_positive_integers(make_user, login, balance_of, receiver_id):
+    sender = make_user()
+    client = login(sender)
+
+    assert client.post('/api/v1/transfers', json={'receiver_id': receiver_id, 'amount': '1'}).status_code == 400
+    assert client.post('/api/v1/scheduled-transfers',
+                       json={'receiver_id': receiver_id, 'amount': '1'}).status_code == 400
+    assert balance_of(sender) == 100000
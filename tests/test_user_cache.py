@@ -0,0 +1,48 @@
+import pytest
+
+
+def cached(quickpay, user_id):
+    """The cached entry for a user, or 'missing' when the cache would have to load it."""
+    return quickpay.user_cache.get_or_load(user_id, lambda: 'missing')
+
+
+def test_transfer_invalidates_both_users_after_commit(quickpay, make_user):
+    sender, receiver = make_user(), make_user()
+    assert quickpay.get_current_user_data(sender).balance_cents == 100000
+    assert quickpay.get_current_user_data(receiver).balance_cents == 100000
+
+    quickpay.run_transfer(sender, receiver, 2500)
+
+    assert quickpay.get_current_user_data(sender).balance_cents == 97500
+    assert quickpay.get_current_user_data(receiver).balance_cents == 102500
+
+
+def test_cache_is_kept_until_the_job_commits(quickpay, make_user):
+    sender, receiver = make_user(), make_user()
+    quickpay.get_current_user_data(sender)
+    seen_inside_job = []
+
+    def job(db):
+        quickpay.apply_transfer(db, sender, receiver, 2500)
+        seen_inside_job.append(cached(quickpay, sender))
+
+    quickpay.writer_for(sender).run(job, timeout=quickpay.WRITE_TIMEOUT)
+
+    assert seen_inside_job[0].balance_cents == 100000
+    assert cached(quickpay, sender) == 'missing'
+
+
+def test_rolled_back_job_leaves_the_cache_alone(quickpay, make_user, balance_of):
+    sender, receiver = make_user(), make_user()
+    quickpay.get_current_user_data(sender)
+    invalidations = quickpay.user_cache.stats.invalidations
+
+    def job(db):
+        quickpay.apply_transfer(db, sender, receiver, 2500)
+        raise RuntimeError("rolled back")
+
+    with pytest.raises(RuntimeError):
+        quickpay.writer_for(sender).run(job, timeout=quickpay.WRITE_TIMEOUT)
+
+    assert quickpay.user_cache.stats.invalidations == invalidations
+    assert cached(quickpay, sender).balance_cents == balance_of(sender) == 100000
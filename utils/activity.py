@@ -0,0 +1,164 @@
+import sqlite3
+
+from utils.archive import OVERLAP_SQL, not_hot
+
+# Per-month totals are stored as [sent_count, sent_cents, received_count, received_cents].
+SENT_COUNT, SENT_CENTS, RECEIVED_COUNT, RECEIVED_CENTS = range(4)
+
+
+def empty_summary(user_id):
+    return {
+        'user_id': user_id,
+        'sent_count': 0,
+        'sent_cents': 0,
+        'received_count': 0,
+        'received_cents': 0,
+        'months': {},
+        'top_counterparties': [],
+    }
+
+
+def add_month(summary, month, totals):
+    """Adds [sent_count, sent_cents, received_count, received_cents] to a month and to the lifetime totals."""
+    current = summary['months'].setdefault(month, [0, 0, 0, 0])
+    for index, value in enumerate(totals):
+        current[index] += value
+    summary['sent_count'] += totals[SENT_COUNT]
+    summary['sent_cents'] += totals[SENT_CENTS]
+    summary['received_count'] += totals[RECEIVED_COUNT]
+    summary['received_cents'] += totals[RECEIVED_CENTS]
+
+
+def trim_months(summary, keep_months):
+    """Drops all but the newest keep_months months; lifetime totals are unaffected."""
+    for stale in sorted(summary['months'])[:-keep_months]:
+        del summary['months'][stale]
+
+
+def merge_top(summary, candidates, keep):
+    """
+    Merges counterparties with their new pair totals ({'id', 'name', 'count', 'cents'})
+    into the top list. Pair totals only ever grow, so a counterparty can only
+    enter the top list when its own total changes, which keeps the list exact.
+    """
+    top = {entry['id']: entry for entry in summary['top_counterparties']}
+    for candidate in candidates:
+        top[candidate['id']] = dict(candidate, name=candidate.get('name') or top.get(candidate['id'], {}).get('name'))
+    summary['top_counterparties'] = sorted(top.values(), key=lambda entry: (-entry['cents'], entry['id']))[:keep]
+
+
+# Aggregates read straight off the (sender_id, timestamp) and (receiver_id, timestamp)
+# covering indexes; amount_cents is not in them, so cents are derived from amount per row.
+SENT_BY_MONTH_SQL = """
+    SELECT sender_id AS user_id, substr(timestamp, 1, 7) AS month, COUNT(*) AS count,
+           SUM(CAST(ROUND(amount * 100) AS INTEGER)) AS cents
+    FROM transactions WHERE sender_id BETWEEN ? AND ? AND id <= ?
+    GROUP BY sender_id, month
+"""
+RECEIVED_BY_MONTH_SQL = """
+    SELECT receiver_id AS user_id, substr(timestamp, 1, 7) AS month, COUNT(*) AS count,
+           SUM(CAST(ROUND(amount * 100) AS INTEGER)) AS cents
+    FROM transactions WHERE receiver_id BETWEEN ? AND ? AND id <= ?
+    GROUP BY receiver_id, month
+"""
+SENT_PAIRS_SQL = """
+    SELECT sender_id AS user_id, receiver_id AS counterparty_id, COUNT(*) AS count,
+           SUM(CAST(ROUND(amount * 100) AS INTEGER)) AS cents
+    FROM transactions WHERE sender_id BETWEEN ? AND ? AND id <= ?
+    GROUP BY sender_id, receiver_id
+"""
+RECEIVED_PAIRS_SQL = """
+    SELECT receiver_id AS user_id, sender_id AS counterparty_id, COUNT(*) AS count,
+           SUM(CAST(ROUND(amount * 100) AS INTEGER)) AS cents
+    FROM transactions WHERE receiver_id BETWEEN ? AND ? AND id <= ?
+    GROUP BY receiver_id, sender_id
+"""
+
+
+def summarize_users(db_path, archive_paths, first_user_id, last_user_id, max_transaction_id, keep_months, keep_top):
+    """
+    Recomputes the activity summaries and counterparty totals of users
+    first_user_id..last_user_id from the hot database and every archive file,
+    counting transactions up to max_transaction_id. Only users of this database
+    get a summary: on a shard, rows mirrored for a transfer to or from another
+    shard also name the other party. Runs in a worker process on its own
+    read-only connections; returns (summaries, pairs) for the caller to write.
+    """
+    summaries = {}
+    pairs = {}
+
+    def add(user_id, month, counterparty_id, count, cents, sent):
+        summary = summaries.setdefault(user_id, empty_summary(user_id))
+        add_month(summary, month, [count, cents, 0, 0] if sent else [0, 0, count, cents])
+        totals = pairs.setdefault((user_id, counterparty_id), [0, 0])
+        totals[0] += count
+        totals[1] += cents
+
+    def accumulate(connection, max_id):
+        params = (first_user_id, last_user_id, max_id)
+        for sql, sent in ((SENT_BY_MONTH_SQL, True), (RECEIVED_BY_MONTH_SQL, False)):
+            for user_id, month, count, cents in connection.execute(sql, params):
+                summary = summaries.setdefault(user_id, empty_summary(user_id))
+                add_month(summary, month, [count, cents, 0, 0] if sent else [0, 0, count, cents])
+        for sql in (SENT_PAIRS_SQL, RECEIVED_PAIRS_SQL):
+            for user_id, counterparty_id, count, cents in connection.execute(sql, params):
+                totals = pairs.setdefault((user_id, counterparty_id), [0, 0])
+                totals[0] += count
+                totals[1] += cents
+
+    # All hot-table reads share one snapshot, held open while the archives are read:
+    # archives count in full below the hot table's oldest id and, above it, only
+    # rows that snapshot no longer holds (see utils.archive.OVERLAP_SQL).
+    hot = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, isolation_level=None)
+    try:
+        hot.execute("BEGIN")
+        residents = {row[0] for row in hot.execute("SELECT id FROM users WHERE id BETWEEN ? AND ?",
+                                                   (first_user_id, last_user_id))}
+        oldest_hot_id = hot.execute("SELECT MIN(id) FROM transactions").fetchone()[0]
+        accumulate(hot, max_transaction_id)
+        archive_max_id = max_transaction_id if oldest_hot_id is None else min(max_transaction_id, oldest_hot_id - 1)
+        overlap = []
+        for path in archive_paths:
+            connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                accumulate(connection, archive_max_id)
+                if oldest_hot_id is not None and oldest_hot_id <= max_transaction_id:
+                    overlap += connection.execute(OVERLAP_SQL, (first_user_id, last_user_id, oldest_hot_id,
+                                                                max_transaction_id) * 2).fetchall()
+            finally:
+                connection.close()
+        for _, sender_id, receiver_id, timestamp, cents in not_hot(hot, overlap):
+            if first_user_id <= sender_id <= last_user_id:
+                add(sender_id, timestamp[:7], receiver_id, 1, cents, True)
+            if first_user_id <= receiver_id <= last_user_id:
+                add(receiver_id, timestamp[:7], sender_id, 1, cents, False)
+        hot.execute("COMMIT")
+    finally:
+        hot.close()
+    summaries = {user_id: summary for user_id, summary in summaries.items() if user_id in residents}
+    pairs = {key: totals for key, totals in pairs.items() if key[0] in residents}
+
+    by_user = {}
+    for (user_id, counterparty_id), (count, cents) in pairs.items():
+        by_user.setdefault(user_id, []).append({'id': counterparty_id, 'name': None, 'count': count, 'cents': cents})
+    for user_id, summary in summaries.items():
+        trim_months(summary, keep_months)
+        merge_top(summary, by_user.get(user_id, []), keep_top)
+
+    if summaries:
+        connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        try:
+            wanted = sorted({entry['id'] for summary in summaries.values() for entry in summary['top_counterparties']})
+            names = {}
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                names.update(connection.execute(
+                    f"SELECT id, name FROM users WHERE id IN ({', '.join('?' * len(chunk))})", chunk).fetchall())
+        finally:
+            connection.close()
+        for summary in summaries.values():
+            for entry in summary['top_counterparties']:
+                entry['name'] = names.get(entry['id'])
+
+    return list(summaries.values()), [(user_id, counterparty_id, count, cents)
+                                      for (user_id, counterparty_id), (count, cents) in pairs.items()]
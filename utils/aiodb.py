@@ -0,0 +1,39 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDatabase:
+    """
+    Async access to DatabaseConnection for ASGI handlers.
+    Blocking SQLite work runs on a dedicated thread pool sized to the connection
+    pool, so coroutines wait on a future instead of tying up the event loop, and
+    writes are awaited straight from the writer thread's futures.
+    """
+    def __init__(self, session_factory, max_workers=8, writer=None):
+        self.session_factory = session_factory
+        self.writer = writer
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='quickpay-async-db')
+
+    def _run_in_session(self, fn, args):
+        with self.session_factory(*args) as db:
+            return fn(db)
+
+    async def run(self, fn, *args):
+        """
+        Runs fn(db) inside a session on the executor and returns its result; `args`
+        go to the session factory (e.g. the user whose shard to open).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_in_session, fn, args)
+
+    async def call(self, fn, *args):
+        """Runs any blocking callable on the executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args))
+
+    async def write(self, job):
+        """Queues job(db) on the writer thread and awaits its committed result."""
+        return await asyncio.wrap_future(self.writer.submit(job))
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,160 @@
+import glob
+import os
+import re
+
+from utils.pool import get_pool
+from utils.rows import to_records
+
+ARCHIVE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY,
+        sender_id INTEGER NOT NULL,
+        receiver_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        amount_cents INTEGER,
+        timestamp DATETIME NOT NULL,
+        status TEXT NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_transactions_sender_ts ON transactions (sender_id, timestamp, id, receiver_id, amount);",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_receiver_ts ON transactions (receiver_id, timestamp, id, sender_id, amount);",
+]
+
+ARCHIVE_COLUMNS = ('id', 'sender_id', 'receiver_id', 'amount', 'amount_cents', 'timestamp', 'status')
+
+# The hot history query without the user joins; callers resolve names from the main database.
+ARCHIVE_HISTORY_SQL = """
+    SELECT id, amount, timestamp, sender_id, receiver_id, 'Sent' AS type
+    FROM transactions
+    WHERE sender_id = ?{filters}
+    UNION ALL
+    SELECT id, amount, timestamp, sender_id, receiver_id, 'Received'
+    FROM transactions
+    WHERE receiver_id = ? AND sender_id != ?{filters}
+    ORDER BY timestamp DESC, id DESC{limit};
+"""
+
+# Archived rows at or above the hot table's oldest id may be in the hot table as well: a
+# batch the archiver has copied but not yet deleted, or the history of a user moved in
+# from another shard. Aggregates read them one by one and keep those not_hot returns.
+OVERLAP_SQL = """
+    SELECT id, sender_id, receiver_id, timestamp, CAST(ROUND(amount * 100) AS INTEGER) AS cents
+    FROM transactions WHERE sender_id BETWEEN ? AND ? AND id BETWEEN ? AND ?
+    UNION
+    SELECT id, sender_id, receiver_id, timestamp, CAST(ROUND(amount * 100) AS INTEGER) AS cents
+    FROM transactions WHERE receiver_id BETWEEN ? AND ? AND id BETWEEN ? AND ?
+"""
+
+
+def not_hot(hot, rows, chunk_size=500):
+    """The rows (tuples with the transaction id first) whose id the hot connection `hot` does not hold."""
+    rows = {row[0]: row for row in rows}
+    ids = list(rows)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        for (transaction_id,) in hot.execute(
+                f"SELECT id FROM transactions WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+            del rows[transaction_id]
+    return list(rows.values())
+
+
+MONTH_FILE = re.compile(r'transactions-(\d{4}-\d{2})\.db$')
+
+
+class TransactionArchive:
+    """
+    Cold storage for old transactions: one SQLite file per calendar month
+    (`transactions-YYYY-MM.db` under `directory`), each with the same covering
+    history indexes as the hot table. Files are opened through shared pools only
+    when a history read reaches that far back.
+    """
+    def __init__(self, directory, pool_size=2, pragmas=None):
+        self.directory = directory
+        self.pool_size = pool_size
+        self.pragmas = pragmas
+
+    def path_for(self, month):
+        return os.path.join(self.directory, f'transactions-{month}.db')
+
+    def months(self):
+        """Archived months, newest first."""
+        paths = glob.glob(os.path.join(self.directory, 'transactions-*.db'))
+        return sorted((match.group(1) for match in map(MONTH_FILE.search, paths) if match), reverse=True)
+
+    def paths(self):
+        return [self.path_for(month) for month in self.months()]
+
+    def _pool(self, month):
+        return get_pool(self.path_for(month), isolation_level=None, size=self.pool_size, pragmas=self.pragmas)
+
+    def store(self, rows):
+        """
+        Copies hot-table rows (records with ARCHIVE_COLUMNS) into their monthly files,
+        one transaction per month. Rows already archived are skipped, so a batch
+        interrupted before its hot rows were deleted can simply be stored again.
+        """
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row.timestamp[:7], []).append(tuple(getattr(row, column) for column in ARCHIVE_COLUMNS))
+        os.makedirs(self.directory, exist_ok=True)
+        sql = f"INSERT OR IGNORE INTO transactions ({', '.join(ARCHIVE_COLUMNS)}) VALUES ({', '.join('?' * len(ARCHIVE_COLUMNS))})"
+        for month, values in by_month.items():
+            with self._pool(month).connection() as connection:
+                for ddl in ARCHIVE_DDL:
+                    connection.execute(ddl)
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    connection.executemany(sql, values)
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+        return {month: len(values) for month, values in by_month.items()}
+
+    def iter_history(self, user_id, limit=None, before=None, since=None, until=None):
+        """
+        Yields a user's archived history newest first, continuing below a
+        (timestamp, id) cursor. Months outside the cursor or date range are never
+        opened, and older months are only opened once newer ones run out.
+        """
+        remaining = limit
+        for month in self.months():
+            if remaining is not None and remaining <= 0:
+                return
+            if before and month > before[0][:7]:
+                continue
+            if until is not None and month > until[:7]:
+                continue
+            if since is not None and month < since[:7]:
+                return
+
+            filters, filter_params = '', ()
+            if before:
+                filters += " AND (timestamp, id) < (?, ?)"
+                filter_params += tuple(before)
+            if since is not None:
+                filters += " AND timestamp >= ?"
+                filter_params += (since,)
+            if until is not None:
+                filters += " AND timestamp < ?"
+                filter_params += (until,)
+            params = (user_id,) + filter_params + (user_id, user_id) + filter_params
+            if remaining is not None:
+                params += (remaining,)
+            sql = ARCHIVE_HISTORY_SQL.format(filters=filters, limit=' LIMIT ?' if remaining is not None else '')
+
+            with self._pool(month).connection() as connection:
+                cursor = connection.cursor()
+                cursor.row_factory = None
+                try:
+                    cursor.execute(sql, params)
+                    while True:
+                        rows = cursor.fetchmany(256)
+                        if not rows:
+                            break
+                        if remaining is not None:
+                            remaining -= len(rows)
+                        yield from to_records(cursor, rows)
+                finally:
+                    cursor.close()
@@ -0,0 +1,45 @@
+import sqlite3
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; the bootstrap DDL is idempotent, so it just runs unguarded there.
+    fcntl = None
+
+
+def schema_version(db_path):
+    """The version stamped into the database header (PRAGMA user_version); 0 for a new file."""
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        connection.close()
+
+
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive advisory lock on `path` (created if missing), across processes and threads."""
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def ensure_schema(db_path, version, initialize, force=False):
+    """
+    Runs initialize() unless the database is already stamped with `version`;
+    initialize must set PRAGMA user_version as the last step of its transaction.
+    Checking costs one header read. Otherwise processes queue on a lock file next
+    to the database and check again, so when many workers start at once only the
+    first runs the DDL. Returns whether the schema is at `version` afterwards.
+    """
+    if not force and schema_version(db_path) >= version:
+        return True
+    with file_lock(f'{db_path}.init-lock'):
+        if force or schema_version(db_path) < version:
+            initialize()
+        return schema_version(db_path) >= version
@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from utils.pool import WAL_PROFILE, ConnectionPool
+from utils.rows import Record
+
+
+class CacheStats:
+    """
+    Hit/miss/eviction counters for a cache backend.
+    Counters are per process, even for backends whose data is shared.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+class Cache:
+    """
+    Base class for read-through caches.
+    Backends implement `_get` (returning MISSING when absent or expired), `_set`,
+    `_delete` and `clear`; callers use `get_or_load`, `set` and `invalidate`.
+    """
+    MISSING = object()
+
+    def __init__(self, max_size=10000, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        # Bumped on every invalidation, so a load that raced with a write is not cached.
+        self._generation = 0
+
+    def get_or_load(self, key, loader):
+        """Returns the cached value for key, calling loader() and caching its result on a miss."""
+        value = self._get(key)
+        if value is not self.MISSING:
+            self.stats.hits += 1
+            return value
+        self.stats.misses += 1
+        generation = self._generation
+        value = loader()
+        if value is not None and generation == self._generation:
+            self._set(key, value)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """Like get_or_load, for async callers: loader is a coroutine function."""
+        value = self._get(key)
+        if value is not self.MISSING:
+            self.stats.hits += 1
+            return value
+        self.stats.misses += 1
+        generation = self._generation
+        value = await loader()
+        if value is not None and generation == self._generation:
+            self._set(key, value)
+        return value
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        if value is self.MISSING:
+            self.stats.misses += 1
+            return default
+        self.stats.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def invalidate(self, key):
+        self._generation += 1
+        self.stats.invalidations += 1
+        self._delete(key)
+
+
+class LRUCache(Cache):
+    """An in-process LRU cache with a per-entry TTL. Thread-safe."""
+
+    def __init__(self, max_size=10000, ttl=30.0):
+        super().__init__(max_size, ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self.MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.stats.expirations += 1
+                return self.MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCache(Cache):
+    """
+    A cache shared by every process on the host, stored in a small SQLite file.
+    Values must be JSON-serialisable; records are stored, and come back, as dicts.
+    When the store grows past max_size, the entries closest to expiry are evicted first.
+    """
+    def __init__(self, path, max_size=10000, ttl=30.0, pool_size=4):
+        super().__init__(max_size, ttl)
+        self.pool = ConnectionPool(path, size=pool_size, pragmas=WAL_PROFILE, isolation_level=None)
+        self._writes = 0
+        with self.pool.connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at)")
+
+    def _get(self, key):
+        with self.pool.connection() as connection:
+            row = connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (str(key),)).fetchone()
+        if row is None:
+            return self.MISSING
+        if row['expires_at'] < time.time():
+            self.stats.expirations += 1
+            return self.MISSING
+        return json.loads(row['value'])
+
+    def _set(self, key, value):
+        with self.pool.connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               (str(key), json.dumps(value._asdict() if isinstance(value, Record) else value),
+                                time.time() + self.ttl))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._trim(connection)
+
+    def _trim(self, connection):
+        connection.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        overflow = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_size
+        if overflow > 0:
+            connection.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                               (overflow,))
+            self.stats.evictions += overflow
+
+    def _delete(self, key):
+        with self.pool.connection() as connection:
+            connection.execute("DELETE FROM cache WHERE key = ?", (str(key),))
+
+    def clear(self):
+        with self.pool.connection() as connection:
+            connection.execute("DELETE FROM cache")
@@ -1,44 +1,79 @@
 import sqlite3
 
+from utils.metrics import query_metrics
+from utils.pool import WAL_PROFILE, get_pool
+from utils.rows import to_records
+
+POOL_SIZE = 8
+POOL_TIMEOUT = 10.0
+PRAGMAS = WAL_PROFILE
+
+
 class DatabaseConnection:
     """
     A context manager class to handle SQLite database connections.
-    It automatically opens and closes the connection and cursor.
+    Connections are checked out of a shared, long-lived pool on entry and
+    returned to it on exit instead of being opened and closed every time.
     """
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool=None):
         self.db_path = db_path
+        self.pool = pool or get_pool(db_path, isolation_level=None, size=POOL_SIZE,
+                                     timeout=POOL_TIMEOUT, pragmas=PRAGMAS)
         self.connection = None
         self.cursor = None
 
     def __enter__(self):
-        """Connect to the database and return the cursor."""
+        """Check out a pooled connection and begin a transaction."""
         try:
-            self.connection = sqlite3.connect(self.db_path, isolation_level=None)
-            self.connection.row_factory = sqlite3.Row
+            self.connection = self.pool.acquire()
             self.cursor = self.connection.cursor()
+            self.cursor.row_factory = None
             self.cursor.execute("BEGIN")
+            query_metrics.count_session()
             return self
         except sqlite3.Error as e:
             print(f"SQLite connection error: {e}")
+            if self.connection:
+                self.pool.release(self.connection, discard=True)
+                self.connection = None
             raise
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Commit changes or rollback, and close the connection."""
+        """Commit changes or rollback, and return the connection to the pool."""
         if self.connection:
-            if exc_type is None:
-                self.connection.commit()
-            else:
-                self.connection.rollback()
-            self.cursor.close()
-            self.connection.close()
+            try:
+                if exc_type is None:
+                    self.connection.commit()
+                else:
+                    self.connection.rollback()
+            finally:
+                self.cursor.close()
+                self.pool.release(self.connection)
         return False
 
     def execute_query(self, query, params=()):
-        """Executes a SELECT query and returns the result as a list of dictionaries."""
-        self.cursor.execute(query, params)
-        return [dict(row) for row in self.cursor.fetchall()]
+        """Executes a SELECT query and returns the result as a list of records (see utils.rows)."""
+        query_metrics.execute(self.cursor, query, params)
+        rows = self.cursor.fetchall()
+        query_metrics.count_rows(len(rows))
+        return to_records(self.cursor, rows)
+
+    def execute_iter(self, query, params=(), chunk_size=256):
+        """Executes a SELECT query and yields its records lazily, fetching chunk_size rows at a time."""
+        cursor = self.connection.cursor()
+        cursor.row_factory = None
+        try:
+            query_metrics.execute(cursor, query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                query_metrics.count_rows(len(rows))
+                yield from to_records(cursor, rows)
+        finally:
+            cursor.close()
 
     def execute_update(self, query, params=()):
         """Executes an INSERT, UPDATE, or DELETE query and returns the row count."""
-        self.cursor.execute(query, params)
-        return self.cursor.lastrowid if 'INSERT' in query.upper() else self.cursor.rowcount
\ No newline at end of file
+        query_metrics.execute(self.cursor, query, params)
+        return self.cursor.lastrowid if 'INSERT' in query.upper() else self.cursor.rowcount
@@ -0,0 +1,69 @@
+import atexit
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from utils.metrics import Histogram
+
+
+class HashQueueFull(Exception):
+    """Raised when too many hash operations are already queued; callers should answer 503."""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification in a bounded process pool.
+    Hashing is deliberately CPU-heavy and holds the GIL, so keeping it off the
+    request threads stops a burst of logins from stalling every other request.
+    At most `max_pending` operations may be queued or running at once; beyond
+    that, callers get HashQueueFull instead of an ever-growing backlog. Workers
+    are started with `start_method` ('spawn' by default): forking a process that
+    runs other threads can copy a held lock into the child and hang it.
+    """
+    def __init__(self, method='scrypt:32768:8:1', max_workers=2, max_pending=32, timeout=30.0,
+                 start_method='spawn'):
+        self.method = method
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self.timeout = timeout
+        self.latency = {'hash': Histogram(), 'verify': Histogram()}
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Imported on first use: the process pool machinery is slow to import.
+                from concurrent.futures import ProcessPoolExecutor
+                from multiprocessing import get_context
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=get_context(self.start_method))
+                # Stopped before interpreter teardown, while the pool's own modules still exist.
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashQueueFull("Too many password operations in progress; try again shortly.")
+        try:
+            with self.latency[operation].time():
+                return self._get_executor().submit(fn, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run('verify', check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different method or cost than the current one."""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
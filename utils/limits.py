@@ -0,0 +1,204 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from utils.pool import WAL_PROFILE, ConnectionPool
+
+
+class LimiterStats:
+    """Allowed/limited/eviction counters for a limiter backend, per process like CacheStats."""
+    def __init__(self):
+        self.allowed = 0
+        self.limited = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        return {'allowed': self.allowed, 'limited': self.limited, 'evictions': self.evictions}
+
+
+def seconds_until_fits(previous, current, needed, limit, elapsed, window):
+    """
+    For a sliding window estimated as previous * (1 - elapsed / window) + current,
+    the seconds until `needed` more fits under `limit`: first while the previous
+    window's weight runs down, else after the current window becomes the previous
+    one. None if it can never fit.
+    """
+    if needed > limit:
+        return None
+    room = limit - needed - current
+    if room >= 0:
+        return max(0.0, window * (1 - room / previous) - elapsed) if previous > room else 0.0
+    return window - elapsed + window * (1 - (limit - needed) / current)
+
+
+class Limiter:
+    """
+    Base class of the rate and velocity limiters. Every decision reads and
+    rewrites a few numbers stored under one key, so it costs O(1) whatever the
+    traffic. Backends implement `_update(key, change)`, which atomically passes
+    the key's state (None when absent) and the current time to change(state, now)
+    and stores the (state, expires_at, result) it returns until expires_at: a key
+    left idle until then is indistinguishable from a new one, so it may be dropped.
+    """
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.stats = LimiterStats()
+
+    def _count(self, retry_after):
+        if retry_after == 0:
+            self.stats.allowed += 1
+        else:
+            self.stats.limited += 1
+        return retry_after
+
+    def take(self, key, capacity, refill_per_second, cost=1.0):
+        """
+        Token bucket: takes `cost` tokens from the bucket of `key`, which holds up to
+        `capacity` and refills at `refill_per_second`. Returns 0 when they were
+        taken, otherwise the seconds until they would be.
+        """
+        def change(state, now):
+            tokens, updated = state if state else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            retry_after = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                retry_after = (cost - tokens) / refill_per_second
+            return [tokens, now], now + (capacity - tokens) / refill_per_second, retry_after
+        return self._count(self._update(key, change))
+
+    def add_within(self, key, window, amount, max_count, max_total):
+        """
+        Sliding window: records one event of `amount` for `key` unless the events of
+        the last `window` seconds would then exceed max_count events or max_total in
+        sum. The window is estimated from the current and the previous fixed
+        window, the previous one weighted by how much of it the sliding window
+        still covers, so a key holds five numbers. Returns 0 when recorded,
+        otherwise the seconds until it would fit (None: never, as the amount alone
+        is over max_total).
+        """
+        def change(state, now):
+            start = now - now % window
+            current, previous = [0, 0], [0, 0]
+            if state and state[0] == start:
+                current, previous = state[1:3], state[3:5]
+            elif state and state[0] == start - window:
+                previous = state[1:3]
+            elapsed = now - start
+            weight = 1 - elapsed / window
+            if (previous[0] * weight + current[0] + 1 > max_count
+                    or previous[1] * weight + current[1] + amount > max_total):
+                waits = [seconds_until_fits(previous[0], current[0], 1, max_count, elapsed, window),
+                         seconds_until_fits(previous[1], current[1], amount, max_total, elapsed, window)]
+                retry_after = None if None in waits else max(max(waits), 0.001)
+                return [start, *current, *previous], start + 2 * window, retry_after
+            current = [current[0] + 1, current[1] + amount]
+            return [start, *current, *previous], start + 2 * window, 0.0
+        return self._count(self._update(key, change))
+
+    def remove_within(self, key, window, amount):
+        """Takes back an event recorded by add_within, e.g. for a transfer that then failed."""
+        def change(state, now):
+            if not state:
+                return state, now, None
+            # The event is in the state's current window, unless that has already passed.
+            if state[0] >= now - now % window - window:
+                state = [state[0], max(0, state[1] - 1), max(0, state[2] - amount), *state[3:5]]
+            return state, state[0] + 2 * window, None
+        self._update(key, change)
+
+
+class MemoryLimiter(Limiter):
+    """
+    Limiter state in this process, in a dict kept in least-recently-used order.
+    Each call drops a few idle keys from the old end, and max_keys caps the total,
+    so memory stays bounded under any number of keys. Thread-safe.
+    """
+    def __init__(self, max_keys=100000, sweep=2):
+        super().__init__(max_keys)
+        self.sweep = sweep
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _update(self, key, change):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            state = entry[1] if entry and entry[0] > now else None
+            state, expires_at, result = change(state, now)
+            if state is not None:
+                self._entries[key] = (expires_at, state)
+            for _ in range(self.sweep):
+                if not self._entries:
+                    break
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][0] > now:
+                    break
+                del self._entries[oldest]
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileLimiter(Limiter):
+    """
+    Limiter state shared by every process on the host, in a small SQLite file, so
+    limits hold across workers. Each decision is one IMMEDIATE transaction on a
+    primary-key row; expired rows are trimmed every 100 writes, and past max_keys
+    the rows closest to expiry go first.
+    """
+    def __init__(self, path, max_keys=100000, pool_size=4):
+        super().__init__(max_keys)
+        self.pool = ConnectionPool(path, size=pool_size, pragmas=WAL_PROFILE, isolation_level=None)
+        self._writes = 0
+        with self.pool.connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS limits (
+                    key TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_limits_expires ON limits (expires_at)")
+
+    def _update(self, key, change):
+        now = time.time()
+        with self.pool.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT state, expires_at FROM limits WHERE key = ?", (key,)).fetchone()
+                state = json.loads(row['state']) if row and row['expires_at'] > now else None
+                state, expires_at, result = change(state, now)
+                if state is not None:
+                    connection.execute("INSERT OR REPLACE INTO limits (key, state, expires_at) VALUES (?, ?, ?)",
+                                       (key, json.dumps(state), expires_at))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._trim(connection, now)
+        return result
+
+    def _trim(self, connection, now):
+        connection.execute("DELETE FROM limits WHERE expires_at < ?", (now,))
+        overflow = connection.execute("SELECT COUNT(*) FROM limits").fetchone()[0] - self.max_keys
+        if overflow > 0:
+            connection.execute("DELETE FROM limits WHERE key IN (SELECT key FROM limits ORDER BY expires_at LIMIT ?)",
+                               (overflow,))
+            self.stats.evictions += overflow
+
+    def clear(self):
+        with self.pool.connection() as connection:
+            connection.execute("DELETE FROM limits")
@@ -0,0 +1,226 @@
+import bisect
+import functools
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+
+class Histogram:
+    """
+    A fixed-bucket latency histogram (seconds), cheap enough to update on every call.
+    Percentiles are estimated by interpolating within the bucket that holds them.
+    """
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def percentile(self, q):
+        """Estimates the q-th percentile (0-100); returns 0.0 when nothing has been observed."""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = total * q / 100.0
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+    def prometheus(self, name, labels=''):
+        """Renders the histogram in the Prometheus text format (cumulative `le` buckets)."""
+        with self._lock:
+            counts = list(self.counts)
+            total, total_sum = self.count, self.sum
+        prefix = f'{labels},' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {total}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {total_sum}')
+        lines.append(f'{name}_count{suffix} {total}')
+        return lines
+
+
+class HistogramFamily:
+    """Histograms keyed by a label tuple, created on first observation."""
+
+    def __init__(self, label_names, buckets=Histogram.DEFAULT_BUCKETS):
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        histogram = self.histograms.get(values)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(values, Histogram(self.buckets))
+        return histogram
+
+    def prometheus(self, name, help_text):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for values, histogram in sorted(self.histograms.items()):
+            lines += histogram.prometheus(name, format_labels(zip(self.label_names, values)))
+        return lines
+
+
+def format_labels(pairs):
+    """Formats (name, value) pairs as a Prometheus label set body, escaping the values."""
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' '))
+                    for name, value in pairs)
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """
+    Reduces a statement to a stable metrics key: whitespace collapsed, literals
+    replaced with `?` and variable-length placeholder lists folded to `?, ...`.
+    """
+    statement = ' '.join(sql.split()).rstrip(';')
+    statement = _LITERALS.sub('?', statement)
+    return _PLACEHOLDER_LISTS.sub('?, ...', statement)
+
+
+_UNTIMED = ('CREATE', 'ALTER', 'DROP', 'PRAGMA', 'EXPLAIN')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+(\w+)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql):
+    """
+    A short label for a statement that stays the same across processes and
+    restarts: its verb, the first table it names and a hash of normalize_sql(sql),
+    e.g. 'SELECT users 1a2b3c4d'. None for schema changes and PRAGMAs, which run at
+    startup and would only add series.
+    """
+    statement = normalize_sql(sql)
+    verb = statement.split(' ', 1)[0].upper()
+    if verb in _UNTIMED:
+        return None
+    table = _TABLE.search(statement)
+    return f"{verb} {table.group(1) if table else '-'} {zlib.crc32(statement.encode()):08x}"
+
+
+class QueryMetrics:
+    """
+    Per-statement SQL timings plus connection and row counters, shared by every
+    DatabaseConnection in the process. Timings are labelled with statement_label,
+    for at most `max_statements` distinct statements; later ones share the label
+    'other'. `statements` maps each label to the normalized text behind it.
+    Statements slower than `slow_query_threshold` seconds are logged in full.
+    Connections share it across threads, so every counter changes under its lock.
+    """
+    def __init__(self, slow_query_threshold=0.1, max_statements=200):
+        self.slow_query_threshold = slow_query_threshold
+        self.max_statements = max_statements
+        self.durations = HistogramFamily(('statement',))
+        self.statements = {}
+        self.sessions = 0
+        self.rows_fetched = 0
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def count_session(self):
+        with self._lock:
+            self.sessions += 1
+
+    def count_rows(self, count):
+        with self._lock:
+            self.rows_fetched += count
+
+    def observe(self, sql, elapsed):
+        label = statement_label(sql)
+        if label is not None:
+            if label not in self.statements:
+                with self._lock:
+                    if label not in self.statements:
+                        if len(self.statements) >= self.max_statements:
+                            label = 'other'
+                        else:
+                            self.statements[label] = normalize_sql(sql)
+            self.durations.labels(label).observe(elapsed)
+        if elapsed >= self.slow_query_threshold:
+            with self._lock:
+                self.slow_queries += 1
+            print(f"Slow query ({elapsed * 1000:.1f} ms) [{label or '-'}]: {normalize_sql(sql)}")
+
+    def statement_texts(self):
+        """(label, normalized text) pairs for every labelled statement, sorted by label."""
+        with self._lock:
+            return sorted(self.statements.items())
+
+    def execute(self, cursor, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return cursor.execute(sql, params)
+        finally:
+            self.observe(sql, time.perf_counter() - started)
+
+    def executemany(self, cursor, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            return cursor.executemany(sql, seq_of_params)
+        finally:
+            self.observe(sql, time.perf_counter() - started)
+
+
+# Process-wide query metrics used by both DatabaseConnection implementations.
+query_metrics = QueryMetrics()
+
+
+def render_prometheus(families):
+    """
+    Renders counters and gauges for a /metrics response. `families` is a list of
+    (name, type, help, samples) where samples is a list of (labels dict, value).
+    """
+    lines = []
+    for name, metric_type, help_text, samples in families:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in samples:
+            label_text = format_labels(labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return lines
@@ -0,0 +1,32 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENTS_PER_UNIT = 100
+# Largest amount accepted, in cents. Far below SQLite's 64-bit integers, so even a
+# payout's total of PAYOUT_MAX_ROWS such amounts still fits in one.
+MAX_AMOUNT_CENTS = 10 ** 13
+# The largest integer SQLite stores.
+SQLITE_MAX_INTEGER = 2 ** 63 - 1
+
+
+def to_cents(amount):
+    """
+    Converts an amount in currency units (str, int, float or Decimal) to integer cents.
+    Rounds half-up to the nearest cent and raises ValueError for anything non-numeric
+    or larger than MAX_AMOUNT_CENTS either way.
+    """
+    try:
+        value = Decimal(str(amount).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount: {amount!r}")
+    cents = value * CENTS_PER_UNIT
+    # Checked before rounding, which itself fails on values with too many digits.
+    if abs(cents) > MAX_AMOUNT_CENTS:
+        raise ValueError(f"Amount out of range: {amount!r}")
+    return int(cents.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Converts integer cents back to a float amount for display."""
+    return cents / CENTS_PER_UNIT
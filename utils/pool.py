@@ -0,0 +1,206 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Storage profile for concurrent readers alongside a single writer: WAL lets readers
+# proceed while a write is in flight, NORMAL sync is durable across application crashes
+# in WAL mode, and the mmap/page cache sizes keep the hot part of the database in memory.
+WAL_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+class PoolStats:
+    """
+    Counters describing how a ConnectionPool is being used.
+    All updates happen under the owning pool's lock.
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+
+    def as_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'wait_time': self.wait_time,
+            'timeouts': self.timeouts,
+            'created': self.created,
+            'discarded': self.discarded,
+        }
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of long-lived SQLite connections.
+    Connections are opened lazily up to `size`, configured once with the given
+    PRAGMAs, health-checked when they have been idle for a while and reused
+    across requests instead of being reconnected on every `with` block.
+    """
+    def __init__(self, db_path, size=5, timeout=10.0, pragmas=None,
+                 isolation_level='', health_check_interval=30.0):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self.isolation_level = isolation_level
+        self.health_check_interval = health_check_interval
+        self.stats = PoolStats()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._last_used = {}
+        self._closed = False
+
+    def _connect(self):
+        """Opens a new connection and applies the per-connection PRAGMA setup."""
+        connection = sqlite3.connect(self.db_path, isolation_level=self.isolation_level,
+                                     check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def _is_healthy(self, connection):
+        """Pings a connection that has been idle longer than the health check interval."""
+        idle_for = time.monotonic() - self._last_used.get(id(connection), 0.0)
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, connection):
+        self._last_used.pop(id(connection), None)
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+            self.stats.discarded += 1
+
+    def acquire(self):
+        """Checks a connection out of the pool, opening one if the pool is not yet full."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed.")
+
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = None
+                with self._lock:
+                    can_open = self._open < self.size
+                    if can_open:
+                        self._open += 1
+                if can_open:
+                    try:
+                        connection = self._connect()
+                    except sqlite3.Error:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                    with self._lock:
+                        self.stats.created += 1
+                else:
+                    started = time.monotonic()
+                    try:
+                        connection = self._idle.get(timeout=self.timeout)
+                    except queue.Empty:
+                        with self._lock:
+                            self.stats.waits += 1
+                            self.stats.timeouts += 1
+                            self.stats.wait_time += time.monotonic() - started
+                        raise PoolTimeout(
+                            f"Timed out after {self.timeout}s waiting for a connection to {self.db_path}")
+                    with self._lock:
+                        self.stats.waits += 1
+                        self.stats.wait_time += time.monotonic() - started
+
+            if not self._is_healthy(connection):
+                self._discard(connection)
+                continue
+
+            with self._lock:
+                self.stats.checkouts += 1
+            return connection
+
+    def release(self, connection, discard=False):
+        """Returns a connection to the pool, rolling back anything left uncommitted."""
+        if not discard:
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except sqlite3.Error:
+                discard = True
+
+        if discard or self._closed:
+            self._discard(connection)
+            return
+
+        self._last_used[id(connection)] = time.monotonic()
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self):
+        """Checks a connection out for the duration of a with-block."""
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        """Closes every idle connection; connections still checked out are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, isolation_level='', **options):
+    """
+    Returns the shared pool for a database path and isolation level, creating it on first use.
+    Options only take effect for the call that creates the pool.
+    """
+    key = (db_path, isolation_level)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, isolation_level=isolation_level, **options)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    """Closes and forgets every shared pool (used on shutdown and between test runs)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
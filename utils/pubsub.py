@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from collections import deque
+
+
+class TooManySubscribers(Exception):
+    """Raised when the broker already holds max_subscribers subscriptions; callers should answer 503."""
+
+
+class Subscription:
+    """
+    One subscriber's buffer of published events, bounded at `buffer_size`: when it
+    is full the oldest event is dropped and counted in `missed`, so a slow client
+    costs a fixed amount of memory and learns that it has to resync. Waiting needs
+    no thread of its own: coroutines await next_events(), threads call wait_events().
+    """
+    def __init__(self, broker, topic, buffer_size):
+        self.broker = broker
+        self.topic = topic
+        self.buffer_size = buffer_size
+        self.missed = 0
+        self.closed = False
+        self._events = deque()
+        self._wake = None
+        self._lock = threading.Lock()
+
+    def put(self, event):
+        with self._lock:
+            if len(self._events) >= self.buffer_size:
+                self._events.popleft()
+                self.missed += 1
+                self.broker.dropped += 1
+            self._events.append(event)
+            wake = self._wake
+        self._call(wake)
+
+    @staticmethod
+    def _call(wake):
+        if wake is not None:
+            try:
+                wake()
+            except RuntimeError:  # The waiting event loop has already closed.
+                pass
+
+    def drain(self):
+        """Returns (events, missed) buffered since the last drain and clears both."""
+        with self._lock:
+            events, missed = list(self._events), self.missed
+            self._events.clear()
+            self.missed = 0
+        return events, missed
+
+    def _wait(self, wake):
+        """Registers `wake` unless there is already something to return; returns whether to wait."""
+        with self._lock:
+            if self._events or self.missed or self.closed:
+                return False
+            self._wake = wake
+            return True
+
+    async def next_events(self, timeout):
+        """Waits up to `timeout` seconds for events; returns drain(), which is empty on a timeout."""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        if self._wait(lambda: loop.call_soon_threadsafe(ready.set)):
+            try:
+                await asyncio.wait_for(ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._wake = None
+        return self.drain()
+
+    def wait_events(self, timeout):
+        """Blocking next_events() for threads."""
+        ready = threading.Event()
+        if self._wait(ready.set):
+            ready.wait(timeout)
+            self._wake = None
+        return self.drain()
+
+    def close(self):
+        """Unsubscribes and wakes a pending wait; safe to call more than once."""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            wake = self._wake
+        self.broker.unsubscribe(self)
+        self._call(wake)
+
+
+class Broker:
+    """
+    In-process publish/subscribe keyed by topic. publish() never blocks and never
+    raises: it appends to each subscriber's bounded buffer and wakes its waiter, so
+    it can run from the writer thread's commit callbacks. Topics without
+    subscribers cost one dict lookup. Only subscribers in this process see an
+    event; other worker processes get nothing.
+    """
+    def __init__(self, buffer_size=32, max_subscribers=10000):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.published = 0
+        self.dropped = 0
+        self._topics = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, topic):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers("Too many open event streams; try again shortly.")
+            subscription = Subscription(self, topic, self.buffer_size)
+            self._topics.setdefault(topic, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+            self._count -= 1
+
+    def has_subscribers(self, topic):
+        return topic in self._topics
+
+    def publish(self, topic, event):
+        """Queues `event` for every subscriber of `topic`; returns how many there were."""
+        if topic not in self._topics:
+            return 0
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+        self.published += 1
+        return len(subscribers)
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import time
+
+from utils.archive import OVERLAP_SQL, not_hot
+
+# Cents are derived from amount per row so the sums read straight off the
+# (sender_id, timestamp, id, receiver_id, amount) and (receiver_id, ...) covering indexes.
+SENT_SQL = """
+    SELECT sender_id, SUM(CAST(ROUND(amount * 100) AS INTEGER)) FROM transactions
+    WHERE sender_id BETWEEN ? AND ? AND id <= ? GROUP BY sender_id
+"""
+RECEIVED_SQL = """
+    SELECT receiver_id, SUM(CAST(ROUND(amount * 100) AS INTEGER)) FROM transactions
+    WHERE receiver_id BETWEEN ? AND ? AND id <= ? GROUP BY receiver_id
+"""
+LEDGER_SQL = """
+    SELECT user_id, SUM(amount_cents) FROM ledger_entries
+    WHERE user_id BETWEEN ? AND ? GROUP BY user_id
+"""
+NO_ID_LIMIT = 2 ** 63 - 1
+
+
+def lower_priority():
+    """Process pool initializer: reconciliation workers yield the CPU to request handling."""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def reconcile_range(db_path, archive_paths, first_user_id, last_user_id, signup_credit_cents, duty_cycle=0.5):
+    """
+    Checks users first_user_id..last_user_id in a worker process. Each user's
+    balance_cents should equal the signup credit plus transfers received minus
+    sent, and the sum of the user's ledger entries.
+
+    Balances, hot transactions and the ledger are read in one read transaction,
+    so they come from a single WAL snapshot and in-flight transfers cannot cause
+    false mismatches; the writer is never blocked. Archived transactions count in
+    full below the hot table's oldest id; above it (see utils.archive.OVERLAP_SQL)
+    only if that snapshot no longer holds them, so nothing is counted twice.
+    Afterwards the worker sleeps long enough to keep its busy time under `duty_cycle`.
+    """
+    started = time.perf_counter()
+    sums = {}
+
+    def add(rows, sign):
+        for user_id, cents in rows:
+            sums[user_id] = sums.get(user_id, 0) + sign * (cents or 0)
+
+    hot = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, isolation_level=None)
+    try:
+        hot.execute("BEGIN")
+        balances = dict(hot.execute("SELECT id, balance_cents FROM users WHERE id BETWEEN ? AND ?",
+                                    (first_user_id, last_user_id)))
+        oldest_hot_id = hot.execute("SELECT MIN(id) FROM transactions").fetchone()[0]
+        params = (first_user_id, last_user_id, NO_ID_LIMIT)
+        add(hot.execute(RECEIVED_SQL, params), 1)
+        add(hot.execute(SENT_SQL, params), -1)
+        ledger = dict(hot.execute(LEDGER_SQL, (first_user_id, last_user_id)))
+
+        archive_params = (first_user_id, last_user_id, NO_ID_LIMIT if oldest_hot_id is None else oldest_hot_id - 1)
+        overlap = []
+        for path in archive_paths:
+            connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                add(connection.execute(RECEIVED_SQL, archive_params), 1)
+                add(connection.execute(SENT_SQL, archive_params), -1)
+                if oldest_hot_id is not None:
+                    overlap += connection.execute(OVERLAP_SQL, (first_user_id, last_user_id, oldest_hot_id,
+                                                                NO_ID_LIMIT) * 2).fetchall()
+            finally:
+                connection.close()
+        for _, sender_id, receiver_id, _, cents in not_hot(hot, overlap):
+            if first_user_id <= receiver_id <= last_user_id:
+                add([(receiver_id, cents)], 1)
+            if first_user_id <= sender_id <= last_user_id:
+                add([(sender_id, cents)], -1)
+        hot.execute("COMMIT")
+    finally:
+        hot.close()
+
+    mismatches = []
+    for user_id, balance_cents in sorted(balances.items()):
+        expected_cents = signup_credit_cents + sums.get(user_id, 0)
+        ledger_cents = ledger.get(user_id, 0)
+        if balance_cents != expected_cents or balance_cents != ledger_cents:
+            mismatches.append({
+                'user_id': user_id,
+                'balance_cents': balance_cents,
+                'expected_cents': expected_cents,
+                'ledger_cents': ledger_cents,
+                'difference_cents': balance_cents - expected_cents,
+            })
+
+    busy = time.perf_counter() - started
+    if 0 < duty_cycle < 1:
+        time.sleep(busy * (1 - duty_cycle) / duty_cycle)
+    return {'first_user_id': first_user_id, 'last_user_id': last_user_id, 'checked': len(balances),
+            'mismatches': mismatches}
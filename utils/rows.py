@@ -0,0 +1,66 @@
+from collections import namedtuple
+from functools import lru_cache
+
+
+class Record(tuple):
+    """
+    Base class of the row types returned by the data layer: a namedtuple per
+    column list, so a row costs one tuple instead of a dict. Columns are read as
+    attributes (`row.name`), and `row['name']`, `get` and `keys` keep working for
+    code written against dict rows.
+    """
+    __slots__ = ()
+    _columns = ()
+    _positions = {}
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            key = self._positions[key]
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        position = self._positions.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def keys(self):
+        return self._columns
+
+    def _asdict(self):
+        return dict(zip(self._columns, self))
+
+    def __repr__(self):
+        return f"Record({', '.join(f'{column}={value!r}' for column, value in zip(self._columns, self))})"
+
+    def __reduce__(self):
+        return make_record, (self._columns, tuple(self))
+
+
+@lru_cache(maxsize=512)
+def record_type(columns):
+    """
+    The row type for a tuple of column names, created once per distinct column
+    list. Names that are not identifiers (e.g. `COUNT(*)` without an alias) only
+    lose attribute access; lookups by name still work.
+    """
+    fields = namedtuple('Record', columns, rename=True)
+    positions = {}
+    for position, column in enumerate(columns):
+        positions.setdefault(column, position)
+    return type('Record', (Record, fields), {'__slots__': (), '_columns': columns, '_positions': positions})
+
+
+def make_record(columns, values):
+    return tuple.__new__(record_type(columns), values)
+
+
+def record_type_for(cursor):
+    return record_type(tuple(column[0] for column in cursor.description))
+
+
+def to_records(cursor, rows):
+    """Wraps plain tuples fetched from `cursor` (row_factory None) in its record type."""
+    if not rows:
+        return []
+    cls = record_type_for(cursor)
+    new = tuple.__new__
+    return [new(cls, row) for row in rows]
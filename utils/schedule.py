@@ -0,0 +1,48 @@
+import calendar
+from datetime import datetime, timedelta, timezone
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def next_occurrence(frequency, run_at, day_of_month):
+    """
+    The run after `run_at` (a datetime) of a daily, weekly or monthly schedule, at
+    the same time of day. Monthly runs fall on day_of_month, or on the last day of
+    a month too short for it, so a schedule started on the 31st keeps coming back
+    to the 31st.
+    """
+    if frequency == 'daily':
+        return run_at + timedelta(days=1)
+    if frequency == 'weekly':
+        return run_at + timedelta(weeks=1)
+    year, month = divmod(run_at.year * 12 + run_at.month, 12)
+    month += 1
+    return run_at.replace(year=year, month=month, day=min(day_of_month, calendar.monthrange(year, month)[1]))
+
+
+def next_run_after(frequency, run_at, day_of_month, now):
+    """
+    The first run of a recurring schedule later than `now`, both 'YYYY-MM-DD HH:MM:SS'
+    strings. Runs missed while no scheduler was running are skipped rather than paid
+    one after another.
+    """
+    current = datetime.fromisoformat(run_at)
+    while True:
+        current = next_occurrence(frequency, current, day_of_month)
+        if current.strftime(TIMESTAMP_FORMAT) > now:
+            return current.strftime(TIMESTAMP_FORMAT)
+
+
+def parse_start(value, now):
+    """
+    Reads an ISO 8601 date or date and time (UTC unless it has an offset) as the
+    'YYYY-MM-DD HH:MM:SS' first run of a schedule; None means `now`. Raises ValueError.
+    """
+    if value is None:
+        return now
+    if not isinstance(value, str):
+        raise ValueError(value)
+    start = datetime.fromisoformat(value)
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    return start.strftime(TIMESTAMP_FORMAT)
@@ -0,0 +1,100 @@
+import time
+
+from utils.cache import LRUCache
+
+# Transaction ids pack (milliseconds since ID_EPOCH_MS, shard, sequence) into one
+# integer: shards never hand out the same id, and ids sort in creation order on every
+# shard, including rows a cross-shard transfer writes to both of its shards.
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+SHARD_BITS = 6
+SEQUENCE_BITS = 6
+MAX_SHARDS = 1 << SHARD_BITS
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+
+def transaction_ids(last_id, shard, count, now_ms=None):
+    """
+    Returns `count` new ids for `shard`, each greater than `last_id`, the last id the
+    shard handed out (0 if none). Up to 64 ids fit in a millisecond; a larger batch
+    borrows the following milliseconds, and later calls continue after it.
+    """
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    last_ms, last_sequence = last_id >> (SHARD_BITS + SEQUENCE_BITS), last_id & SEQUENCE_MASK
+    ms = max(now_ms - ID_EPOCH_MS, last_ms)
+    sequence = last_sequence + 1 if ms == last_ms and last_id else 0
+    ids = []
+    for _ in range(count):
+        if sequence > SEQUENCE_MASK:
+            ms, sequence = ms + 1, 0
+        ids.append((ms << (SHARD_BITS + SEQUENCE_BITS)) | (shard << SEQUENCE_BITS) | sequence)
+        sequence += 1
+    return ids
+
+
+class ShardRouter:
+    """
+    Maps user ids to the database files ("shards") holding their rows.
+
+    The first path also holds the user directory, which records the shard of every
+    user registered or moved while more than one shard was configured; users it does
+    not list (anyone who signed up before sharding) live on the first shard.
+    `load_placements(user_ids)` reads the directory and returns {user_id: shard} for
+    the ids it lists. Placements only change when a user is moved, so they are
+    cached; a caller that finds a user missing from its cached shard calls forget()
+    and routes again. With a single path every user is on shard 0 and the directory
+    is never read.
+    """
+    def __init__(self, paths, load_placements, cache_size=100000, ttl=60.0):
+        if not 0 < len(paths) <= MAX_SHARDS:
+            raise ValueError(f"Between 1 and {MAX_SHARDS} shard paths are supported.")
+        self.paths = list(paths)
+        self.load_placements = load_placements
+        self._placements = LRUCache(max_size=cache_size, ttl=ttl)
+
+    @property
+    def count(self):
+        return len(self.paths)
+
+    def index_of(self, path):
+        return self.paths.index(path)
+
+    def shard_for(self, user_id):
+        if len(self.paths) == 1:
+            return 0
+        return self.shards_for([user_id])[user_id]
+
+    def path_for(self, user_id):
+        return self.paths[self.shard_for(user_id)]
+
+    def shards_for(self, user_ids):
+        """{user_id: shard} for every id, reading the directory once for all uncached ids."""
+        if len(self.paths) == 1:
+            return dict.fromkeys(user_ids, 0)
+        found, missing = {}, []
+        for user_id in user_ids:
+            shard = self._placements.get(user_id)
+            if shard is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = shard
+        if missing:
+            loaded = self.load_placements(missing)
+            for user_id in missing:
+                found[user_id] = loaded.get(user_id, 0)
+                self._placements.set(user_id, found[user_id])
+        return found
+
+    def group(self, user_ids):
+        """{shard: [user_id, ...]} for the given ids."""
+        groups = {}
+        for user_id, shard in self.shards_for(user_ids).items():
+            groups.setdefault(shard, []).append(user_id)
+        return groups
+
+    def forget(self, user_id):
+        """Drops a cached placement; returns whether routing again could give a different shard."""
+        if len(self.paths) == 1:
+            return False
+        self._placements.invalidate(user_id)
+        return True
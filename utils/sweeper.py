@@ -0,0 +1,35 @@
+import threading
+
+
+class PeriodicTask:
+    """
+    Calls `fn` every `interval` seconds on a daemon thread.
+    Like the writer, the thread is started lazily on first use (and again after a fork),
+    and an exception in one run is reported without stopping later runs.
+    """
+    def __init__(self, fn, interval, name='quickpay-periodic'):
+        self.fn = fn
+        self.interval = interval
+        self.name = name
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.fn()
+            except Exception as e:
+                print(f"{self.name} run FAILED: {e}")
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,121 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+
+class WriteQueueFull(sqlite3.OperationalError):
+    """Raised when the writer's bounded queue stays full for longer than the submit timeout."""
+
+
+class WriteQueue:
+    """
+    Funnels every write through one dedicated writer thread.
+    Callers submit jobs of the form `job(db)`. The writer drains up to
+    `batch_size` queued jobs at a time and runs them in a single transaction
+    from `session_factory` (a DatabaseConnection-style context manager), each
+    job under its own savepoint, so many writes share one commit (group commit)
+    while a failing job only rolls back its own changes.
+    """
+    def __init__(self, session_factory, maxsize=1000, submit_timeout=5.0, batch_size=64,
+                 name='quickpay-writer'):
+        self.session_factory = session_factory
+        self.submit_timeout = submit_timeout
+        self.batch_size = batch_size
+        self.name = name
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Starts the writer thread on first use (and again after a fork)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        """Blocks for one job, then takes whatever else is already queued, up to batch_size."""
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, items):
+        outcomes = []
+        try:
+            with self.session_factory() as db:
+                if not db.connection.in_transaction:
+                    db.connection.execute("BEGIN IMMEDIATE")
+                for job, future in items:
+                    db.execute_update("SAVEPOINT write_job")
+                    callbacks = len(db.commit_callbacks)
+                    try:
+                        result = job(db)
+                    except Exception as e:
+                        db.execute_update("ROLLBACK TO SAVEPOINT write_job")
+                        db.execute_update("RELEASE SAVEPOINT write_job")
+                        # A rolled-back job's on_commit callbacks must not run with the batch.
+                        del db.commit_callbacks[callbacks:]
+                        outcomes.append((future, False, e))
+                    else:
+                        db.execute_update("RELEASE SAVEPOINT write_job")
+                        outcomes.append((future, True, result))
+        except BaseException as e:
+            # The shared commit failed, so none of the batch's writes are durable.
+            for _, future in items:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.jobs += len(items)
+        for future, ok, value in outcomes:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is None
+            items = [item for item in batch if item is not None and item[1].set_running_or_notify_cancel()]
+            if items:
+                self._run_batch(items)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                break
+
+    def submit(self, job):
+        """Queues a write job and returns a Future for its result."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Write jobs cannot be submitted from the writer thread itself.")
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put((job, future), timeout=self.submit_timeout)
+        except queue.Full:
+            raise WriteQueueFull("The database writer queue is full; try again shortly.")
+        return future
+
+    def run(self, job, timeout=None):
+        """Queues a write job and blocks until the writer thread has committed it."""
+        return self.submit(job).result(timeout=timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=None):
+        """Drains the queue and stops the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)